@@ -1,54 +1,74 @@
-from django.shortcuts import get_object_or_404
-from recipes.models import Recipe
 from rest_framework import status
-from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from users.models import User
 
+BULK_MAX_SIZE = 100
 
-@action(detail=True, methods=["post", "delete"])
-def post_and_delete_action(
-    self, request, recipe_user_model, target_model, serializer, **kwargs
-):
+
+def relation_action(self, request, relation, target, exists_message, missing_message):
     """
-    Действия добавления и удаления:
-    рецепта в список покупок(recipe_user_model == Recipe, target_model == Shopping_list),
-    рецепта в избранное(recipe_user_model == Recipe, target_model == Favorite)
-    подписки на пользователей(recipe_user_model == User, target_model == Subscription)
+    Действия добавления (POST) и удаления (DELETE) одной связи
+    текущего пользователя: рецепта в избранном или в списке покупок,
+    подписки на автора. При успешном добавлении возвращается объект
+    target в представлении сериализатора действия.
     """
-    object_1 = get_object_or_404(recipe_user_model, id=kwargs["pk"])
-    data = request.data.copy()
-    if recipe_user_model == Recipe:
-        data.update({"recipe": object_1.id})
-    elif recipe_user_model == User:
-        data.update({"author": object_1.id})
-    serializer = serializer(data=data, context={"request": request})
-
     if request.method == "POST":
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-
+        if not relation.add(request.user.id, [target.id]):
+            return Response(
+                {"errors": exists_message}, status=status.HTTP_400_BAD_REQUEST
+            )
         return Response(
-            status=status.HTTP_201_CREATED, data=self.get_serializer(object_1).data
+            status=status.HTTP_201_CREATED, data=self.get_serializer(target).data
         )
 
-    elif request.method == "DELETE" and recipe_user_model == Recipe:
-        object = target_model.objects.filter(recipe=object_1, user=request.user)
-        if not object.exists():
-            return Response(
-                {"errors": "В списке покупок(в избранном) нет этого рецепта."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        object.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    if not relation.remove(request.user.id, [target.id]):
+        return Response({"errors": missing_message}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(status=status.HTTP_204_NO_CONTENT)
 
-    elif request.method == "DELETE" and recipe_user_model == User:
-        object = target_model.objects.filter(author=object_1, user=request.user)
-        if not object.exists():
-            return Response(
-                {"errors": "Вы не подписаны на этого пользователя"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
 
-        object.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+def read_ids(request, field):
+    ids = request.data.get(field)
+    if (
+        not isinstance(ids, list)
+        or not ids
+        or not all(isinstance(value, int) and value > 0 for value in ids)
+    ):
+        raise ValidationError({field: "Ожидается непустой список id."})
+    if len(ids) > BULK_MAX_SIZE:
+        raise ValidationError({field: f"Не больше {BULK_MAX_SIZE} id в одном запросе."})
+    return ids
+
+
+def bulk_relation_action(request, relation, model, field):
+    """
+    Массовое добавление (POST) и удаление (DELETE) связей: в теле
+    {field: [id, ...]}. Существование объектов проверяется одним
+    запросом, изменение - одним INSERT или DELETE. Для каждого id
+    возвращается статус: added, exists или not_found при добавлении,
+    removed или absent при удалении.
+    """
+    ids = list(dict.fromkeys(read_ids(request, field)))
+    if request.method == "POST":
+        existing = set(model.objects.filter(id__in=ids).values_list("id", flat=True))
+        added = set(relation.add(request.user.id, existing))
+        statuses = {
+            target_id: (
+                "added"
+                if target_id in added
+                else "exists" if target_id in existing else "not_found"
+            )
+            for target_id in ids
+        }
+    else:
+        removed = set(relation.remove(request.user.id, ids))
+        statuses = {
+            target_id: "removed" if target_id in removed else "absent"
+            for target_id in ids
+        }
+    return Response(
+        {
+            "results": [
+                {"id": target_id, "status": statuses[target_id]} for target_id in ids
+            ]
+        }
+    )
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        from . import ingredient_index, pantry_index, recipe_cache  # noqa: F401
+        from .metrics import instrument_serializers
+
+        instrument_serializers()
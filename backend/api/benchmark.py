@@ -0,0 +1,418 @@
+import statistics
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver
+from recipes.dataset import DATASET_PASSWORD
+from recipes.models import Favorite, Recipe, ShoppingCart
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import Follow, User
+
+from . import urls
+from .query_detector import QueryDetector
+
+# Рост p95 и памяти меньше порога в долях (и меньше абсолютного
+# минимума) регрессией не считается: это шум замера.
+REGRESSION_THRESHOLD = 0.2
+REGRESSION_MIN_MS = 1.0
+REGRESSION_MIN_KIB = 64
+
+
+class Step:
+    """
+    Один замеряемый запрос. path и data - строки/словари или функции от
+    контекста сценария; after получает контекст и ответ и может
+    сохранить в контексте данные для следующих шагов.
+    """
+
+    def __init__(self, route, method, path, data=None, label=None, after=None):
+        self.route = route
+        self.method = method
+        self.path = path
+        self.data = data
+        self.label = label
+        self.after = after
+
+    @property
+    def key(self):
+        key = f"{self.route} {self.method}"
+        return f"{key} {self.label}" if self.label else key
+
+    def resolve(self, value, context):
+        return value(context) if callable(value) else value
+
+    def request(self, client, context):
+        path = self.resolve(self.path, context)
+        if self.method == "GET":
+            return client.get(path)
+        return getattr(client, self.method.lower())(
+            path, self.resolve(self.data, context), format="json"
+        )
+
+
+def remember_recipe(context, response):
+    context["created_recipe"] = response.data["id"]
+
+
+def recipe_body(context):
+    context["counter"] += 1
+    return {
+        "name": f"Замер {context['counter']}",
+        "text": "Рецепт для замера",
+        "cooking_time": 10,
+        "image": context["image"],
+        "tags": context["tags"][:1],
+        "ingredients": [
+            {"id": ingredient_id, "amount": 10}
+            for ingredient_id in context["ingredients"][:3]
+        ],
+    }
+
+
+def user_body(context):
+    context["counter"] += 1
+    return {
+        "email": f"benchmark{context['counter']}@example.com",
+        "username": f"benchmark{context['counter']}",
+        "first_name": "Замер",
+        "last_name": "Замеров",
+        "password": DATASET_PASSWORD,
+    }
+
+
+# Сценарии выполняются по порядку на каждой итерации; пары "добавить -
+# удалить" возвращают данные в исходное состояние.
+SCENARIOS = [
+    [Step("api-root", "GET", "/api/")],
+    [Step("metrics", "GET", "/api/metrics/")],
+    [
+        Step("login", "POST", "/api/auth/token/login/", lambda c: c["login"]),
+        Step("logout", "POST", "/api/auth/token/logout/"),
+    ],
+    [
+        Step("users-list", "GET", "/api/users/"),
+        Step("users-list", "GET", "/api/users/?cursor=", label="cursor"),
+        Step("users-list", "POST", "/api/users/", user_body),
+        Step("users-detail", "GET", lambda c: f"/api/users/{c['author']}/"),
+        Step("users-me", "GET", "/api/users/me/"),
+        Step("users-subscriptions", "GET", "/api/users/subscriptions/"),
+        Step(
+            "users-subscribe", "POST", lambda c: f"/api/users/{c['author']}/subscribe/"
+        ),
+        Step(
+            "users-subscribe",
+            "DELETE",
+            lambda c: f"/api/users/{c['author']}/subscribe/",
+        ),
+        Step(
+            "users-set-password",
+            "POST",
+            "/api/users/set_password/",
+            {"current_password": DATASET_PASSWORD, "new_password": "Zamer-2-pass"},
+        ),
+        Step(
+            "users-set-password",
+            "POST",
+            "/api/users/set_password/",
+            {"current_password": "Zamer-2-pass", "new_password": DATASET_PASSWORD},
+        ),
+    ],
+    [
+        Step("ingredients-list", "GET", "/api/ingredients/"),
+        Step("ingredients-list", "GET", "/api/ingredients/?name=ингр", label="name"),
+        Step(
+            "ingredients-detail",
+            "GET",
+            lambda c: f"/api/ingredients/{c['ingredients'][0]}/",
+        ),
+        Step("tags-list", "GET", "/api/tags/"),
+        Step("tags-detail", "GET", lambda c: f"/api/tags/{c['tags'][0]}/"),
+    ],
+    [
+        Step("recipes-list", "GET", "/api/recipes/"),
+        Step("recipes-list", "GET", "/api/recipes/?cursor=", label="cursor"),
+        Step(
+            "recipes-list",
+            "GET",
+            "/api/recipes/?is_favorited=1&is_in_shopping_cart=1",
+            label="flags",
+        ),
+        Step("recipes-list", "GET", "/api/recipes/?tags=breakfast", label="tags"),
+        Step("recipes-list", "GET", "/api/recipes/?search=суп", label="search"),
+        Step("recipes-detail", "GET", lambda c: f"/api/recipes/{c['recipe']}/"),
+        Step(
+            "recipes-list", "POST", "/api/recipes/", recipe_body, after=remember_recipe
+        ),
+        Step(
+            "recipes-detail",
+            "PATCH",
+            lambda c: f"/api/recipes/{c['created_recipe']}/",
+            {"cooking_time": 15},
+        ),
+        Step(
+            "recipes-detail",
+            "DELETE",
+            lambda c: f"/api/recipes/{c['created_recipe']}/",
+        ),
+    ],
+    [
+        Step(
+            "recipes-favorite",
+            "POST",
+            lambda c: f"/api/recipes/{c['recipe']}/favorite/",
+        ),
+        Step(
+            "recipes-favorite",
+            "DELETE",
+            lambda c: f"/api/recipes/{c['recipe']}/favorite/",
+        ),
+        Step(
+            "recipes-shopping-cart",
+            "POST",
+            lambda c: f"/api/recipes/{c['recipe']}/shopping_cart/",
+        ),
+        Step(
+            "recipes-shopping-cart",
+            "DELETE",
+            lambda c: f"/api/recipes/{c['recipe']}/shopping_cart/",
+        ),
+        Step(
+            "recipes-favorite-bulk",
+            "POST",
+            "/api/recipes/favorite/",
+            lambda c: {"recipes": c["bulk_recipes"]},
+        ),
+        Step(
+            "recipes-favorite-bulk",
+            "DELETE",
+            "/api/recipes/favorite/",
+            lambda c: {"recipes": c["bulk_recipes"]},
+        ),
+        Step(
+            "recipes-shopping-cart-bulk",
+            "POST",
+            "/api/recipes/shopping_cart/",
+            lambda c: {"recipes": c["bulk_recipes"]},
+        ),
+        Step(
+            "recipes-shopping-cart-bulk",
+            "DELETE",
+            "/api/recipes/shopping_cart/",
+            lambda c: {"recipes": c["bulk_recipes"]},
+        ),
+    ],
+    [
+        Step(
+            "recipes-cook",
+            "GET",
+            lambda c: "/api/recipes/cook/?ingredients="
+            + ",".join(map(str, c["ingredients"][:20])),
+        ),
+        Step("recipes-feed", "GET", "/api/recipes/feed/"),
+        Step(
+            "recipes-download-shopping-cart",
+            "GET",
+            "/api/recipes/download_shopping_cart/",
+        ),
+    ],
+]
+
+IMAGE = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlE"
+    "QVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
+)
+
+
+def route_names(patterns=urls.urlpatterns):
+    """Имена всех маршрутов api/urls.py, включая подключённые include."""
+    names = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            names |= route_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+def build_context(dataset):
+    """
+    Пользователь замера, автор, на которого он не подписан, и рецепт
+    этого автора не из его избранного и списка покупок. Пользователь
+    для входа и выхода заодно становится админом для /api/metrics/.
+    """
+    user_id, login_id, *others = dataset["users"]
+    author_id = others[0]
+    Follow.objects.filter(user_id=user_id, author_id=author_id).delete()
+    recipe = Recipe.objects.filter(author_id=author_id).order_by("id").first()
+    if recipe is None:
+        recipe = Recipe.objects.exclude(author_id=user_id).order_by("id").first()
+    bulk = list(
+        Recipe.objects.exclude(author_id=user_id)
+        .exclude(id=recipe.id)
+        .order_by("-id")
+        .values_list("id", flat=True)[:10]
+    )
+    for model in (Favorite, ShoppingCart):
+        model.objects.filter(user_id=user_id, recipe_id__in=[recipe.id, *bulk]).delete()
+    User.objects.filter(id=login_id).update(role=User.ADMIN)
+    login = User.objects.get(id=login_id)
+    return {
+        "user": User.objects.get(id=user_id),
+        "author": author_id,
+        "recipe": recipe.id,
+        "bulk_recipes": bulk,
+        "ingredients": dataset["ingredients"],
+        "tags": dataset["tags"],
+        "login": {"email": login.email, "password": DATASET_PASSWORD},
+        "admin": login,
+        "image": IMAGE,
+        "counter": 0,
+    }
+
+
+class Benchmark:
+    """
+    Прогоняет сценарии через тестовый клиент и собирает по каждому
+    маршруту и методу: число SQL-запросов, p50/p95 времени ответа и
+    пиковую память, выделенную за запрос, и повторяющиеся запросы
+    (N+1). Память и повторы снимаются отдельным проходом, чтобы
+    трассировка не искажала время.
+    """
+
+    def __init__(self, context, repeat=20, warmup=2):
+        self.context = context
+        self.repeat = repeat
+        self.warmup = warmup
+        self.client = APIClient()
+        token, _ = Token.objects.get_or_create(user=context["user"])
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.login_client = APIClient()
+        self.admin_client = APIClient()
+        self.admin_client.force_authenticate(context["admin"])
+        self.samples = {}
+
+    def client_for(self, step):
+        if step.route == "logout":
+            token = Token.objects.filter(
+                user__email=self.context["login"]["email"]
+            ).first()
+            self.login_client.credentials(
+                HTTP_AUTHORIZATION=f"Token {token.key}" if token else ""
+            )
+            return self.login_client
+        if step.route == "metrics":
+            return self.admin_client
+        if step.route == "login":
+            self.login_client.credentials()
+            return self.login_client
+        return self.client
+
+    def run_step(self, step, record, trace=False):
+        client = self.client_for(step)
+        detector = QueryDetector(label=step.key)
+        if trace:
+            tracemalloc.reset_peak()
+        with ExitStack() as stack:
+            if trace:
+                stack.enter_context(detector.watch())
+            queries = stack.enter_context(CaptureQueriesContext(connection))
+            started = time.perf_counter()
+            response = step.request(client, self.context)
+            elapsed = time.perf_counter() - started
+        if step.after:
+            step.after(self.context, response)
+        if not record:
+            return
+        sample = self.samples.setdefault(
+            step.key,
+            {
+                "route": step.route,
+                "method": step.method,
+                "times": [],
+                "queries": [],
+                "statuses": {},
+                "peak": 0,
+                "repeated": {},
+            },
+        )
+        if trace:
+            sample["peak"] = max(sample["peak"], tracemalloc.get_traced_memory()[1])
+            for repeated in detector.report():
+                sample["repeated"][repeated.sql] = {
+                    "sql": repeated.sql,
+                    "count": repeated.count,
+                    "stack": "".join(repeated.stack),
+                }
+            return
+        sample["times"].append(elapsed * 1000)
+        sample["queries"].append(len(queries.captured_queries))
+        status = str(response.status_code)
+        sample["statuses"][status] = sample["statuses"].get(status, 0) + 1
+
+    def run(self):
+        for iteration in range(self.warmup + self.repeat):
+            for scenario in SCENARIOS:
+                for step in scenario:
+                    self.run_step(step, record=iteration >= self.warmup)
+        tracemalloc.start()
+        try:
+            for scenario in SCENARIOS:
+                for step in scenario:
+                    self.run_step(step, record=True, trace=True)
+        finally:
+            tracemalloc.stop()
+        return self.report()
+
+    def report(self):
+        routes = {}
+        for key, sample in sorted(self.samples.items()):
+            times = sorted(sample["times"])
+            routes[key] = {
+                "route": sample["route"],
+                "method": sample["method"],
+                "requests": len(times),
+                "queries": max(sample["queries"]),
+                "p50_ms": round(statistics.median(times), 3),
+                "p95_ms": round(percentile(times, 95), 3),
+                "max_ms": round(times[-1], 3),
+                "peak_memory_kib": round(sample["peak"] / 1024, 1),
+                "statuses": sample["statuses"],
+                "repeated_queries": list(sample["repeated"].values()),
+            }
+        covered = {sample["route"] for sample in self.samples.values()}
+        return {"routes": routes, "uncovered_routes": sorted(route_names() - covered)}
+
+
+def percentile(values, percent):
+    """Процентиль по отсортированному списку (ближайший ранг)."""
+    rank = max(0, min(len(values) - 1, round(percent / 100 * len(values)) - 1))
+    return values[rank]
+
+
+def compare(base, current, threshold=REGRESSION_THRESHOLD):
+    """
+    Сравнивает два прогона и возвращает регрессии: (ключ, метрика,
+    было, стало). Число запросов сравнивается точно, время и память -
+    с порогом threshold и абсолютными минимумами.
+    """
+    regressions = []
+    for key, new in current["routes"].items():
+        old = base["routes"].get(key)
+        if old is None:
+            continue
+        if new["queries"] > old["queries"]:
+            regressions.append((key, "queries", old["queries"], new["queries"]))
+        for metric, minimum in (
+            ("p95_ms", REGRESSION_MIN_MS),
+            ("peak_memory_kib", REGRESSION_MIN_KIB),
+        ):
+            if (
+                new[metric] > old[metric] * (1 + threshold)
+                and new[metric] - old[metric] > minimum
+            ):
+                regressions.append((key, metric, old[metric], new[metric]))
+    return regressions
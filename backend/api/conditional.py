@@ -0,0 +1,99 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from recipes.models import ChangeMarker
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+
+class NotModified(APIException):
+    status_code = status.HTTP_304_NOT_MODIFIED
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET запросы (ETag / Last-Modified) для вьюсетов.
+    Версия ответа вычисляется одним запросом к ChangeMarker по общим
+    таблицам version_tables и таблицам текущего пользователя
+    user_version_tables, поэтому 304 отдаётся без сериализации.
+    ETag строится только из версий; время изменения идёт лишь в
+    Last-Modified, у которого точность - секунда.
+    Прочитанные версии лежат в self.versions: по ним же проверяется
+    свежесть индексов и кэша, из которых собирается ответ. Действия
+    unvalidated_actions отдаются без ETag: их ответ зависит от данных
+    в памяти процесса, которые версиями не описываются.
+    """
+
+    version_tables = ()
+    user_version_tables = ()
+    unvalidated_actions = ()
+
+    def get_version_tables(self):
+        return self.version_tables
+
+    def get_version_keys(self):
+        keys = list(self.get_version_tables())
+        if self.request.user.is_authenticated:
+            keys.extend(
+                ChangeMarker.user_key(table, self.request.user.id)
+                for table in self.user_version_tables
+            )
+        return keys
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = self.last_modified = None
+        self.versions = {}
+        if request.method not in ("GET", "HEAD"):
+            return
+
+        keys = self.get_version_keys()
+        if not keys:
+            return
+
+        markers = {
+            marker.key: marker
+            for marker in ChangeMarker.objects.filter(key__in=keys)
+        }
+        self.versions = {
+            key: markers[key].version if key in markers else 0 for key in keys
+        }
+        if self.action in self.unvalidated_actions:
+            return
+        token = hashlib.md5(request.accepted_media_type.encode())
+        for key in sorted(keys):
+            token.update(f"{key}={self.versions[key]};".encode())
+        self.etag = quote_etag(token.hexdigest())
+        if markers:
+            self.last_modified = int(
+                max(marker.changed_at for marker in markers.values()).timestamp()
+            )
+
+        conditional_response = get_conditional_response(
+            request._request, etag=self.etag, last_modified=self.last_modified
+        )
+        if (
+            conditional_response is not None
+            and conditional_response.status_code == status.HTTP_304_NOT_MODIFIED
+        ):
+            raise NotModified
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, "etag", None) and response.status_code in (
+            status.HTTP_200_OK,
+            status.HTTP_304_NOT_MODIFIED,
+        ):
+            response["ETag"] = self.etag
+            if self.last_modified is not None:
+                response["Last-Modified"] = http_date(self.last_modified)
+            if self.user_version_tables:
+                patch_vary_headers(response, ("Authorization",))
+        return response
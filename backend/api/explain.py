@@ -0,0 +1,187 @@
+import json
+
+from django.db import connection, transaction
+from django.db.models import Count
+from recipes.models import Ingredient, Recipe, Tag
+from rest_framework.test import APIClient
+from users.models import User
+
+from .benchmark import SCENARIOS, Step
+from .query_detector import fingerprint
+
+# Последовательное чтение таблиц меньше этого числа строк дешевле
+# индекса, такие узлы не показываются.
+EXPLAIN_MIN_ROWS = 1000
+
+# Запросы главных эндпоинтов, которых нет в сценариях замера.
+EXTRA_STEPS = [
+    Step("recipes-list", "GET", lambda c: f"/api/recipes/?author={c['author']}"),
+    Step("recipes-list", "GET", "/api/recipes/?is_favorited=1", label="favorited"),
+    Step("recipes-list", "GET", "/api/recipes/?is_in_shopping_cart=1", label="cart"),
+    Step("recipes-list", "GET", "/api/recipes/?tags=lunch&tags=dinner", label="tags"),
+    Step("users-subscriptions", "GET", "/api/users/subscriptions/?recipe_limit=3"),
+]
+
+
+def explain_context():
+    """
+    Контекст сценариев по данным текущей базы, без записи в неё:
+    пользователь с наибольшим числом подписок, самый популярный автор
+    и его последний рецепт.
+    """
+    user = (
+        User.objects.annotate(follows=Count("follower"))
+        .order_by("-follows", "id")
+        .first()
+    )
+    author = User.objects.order_by("-followers_count", "-recipes_count", "id").first()
+    recipe = (
+        Recipe.objects.filter(author=author).order_by("-pub_date", "-id").first()
+        or Recipe.objects.order_by("-pub_date", "-id").first()
+    )
+    return {
+        "user": user,
+        "author": author.id,
+        "recipe": recipe.id if recipe else 0,
+        "ingredients": list(
+            Ingredient.objects.order_by("id").values_list("id", flat=True)[:20]
+        ),
+        "tags": list(Tag.objects.order_by("id").values_list("id", flat=True)),
+    }
+
+
+class QueryRecorder:
+    """Запоминает SELECT-запросы (SQL и параметры), по одному на отпечаток."""
+
+    def __init__(self):
+        self.queries = {}
+
+    def execute(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith("SELECT"):
+            self.queries.setdefault(fingerprint(sql), (sql, params))
+        return execute(sql, params, many, context)
+
+
+def replay(context):
+    """
+    Выполняет GET-шаги сценариев и возвращает список (шаг, SQL,
+    параметры) без повторов. Запись в базу откатывается.
+    """
+    client = APIClient()
+    client.force_authenticate(context["user"])
+    steps = [
+        step
+        for scenario in [*SCENARIOS, EXTRA_STEPS]
+        for step in scenario
+        if step.method == "GET" and step.route != "metrics"
+    ]
+    seen = set()
+    queries = []
+    with transaction.atomic():
+        for step in steps:
+            recorder = QueryRecorder()
+            with connection.execute_wrapper(recorder.execute):
+                step.request(client, context)
+            for key, (sql, params) in recorder.queries.items():
+                if key not in seen:
+                    seen.add(key)
+                    queries.append((step.key, sql, params))
+        transaction.set_rollback(True)
+    return queries
+
+
+class PostgresExplain:
+    """EXPLAIN (ANALYZE, BUFFERS): последовательные чтения и сортировки."""
+
+    def __init__(self, min_rows=EXPLAIN_MIN_ROWS):
+        self.min_rows = min_rows
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        report = {
+            "time_ms": plan[0]["Execution Time"],
+            "seq_scans": [],
+            "sorts": [],
+        }
+        self.walk(plan[0]["Plan"], report)
+        return report
+
+    def walk(self, node, report):
+        loops = node.get("Actual Loops", 1)
+        if node["Node Type"] == "Seq Scan":
+            rows = (
+                node.get("Actual Rows", 0) + node.get("Rows Removed by Filter", 0)
+            ) * loops
+            if rows >= self.min_rows:
+                report["seq_scans"].append(
+                    {
+                        "table": node["Relation Name"],
+                        "filter": node.get("Filter"),
+                        "rows_read": rows,
+                        "loops": loops,
+                        "blocks": node.get("Shared Hit Blocks", 0)
+                        + node.get("Shared Read Blocks", 0),
+                    }
+                )
+        elif node["Node Type"] == "Sort":
+            report["sorts"].append(
+                {
+                    "key": node.get("Sort Key"),
+                    "rows": node.get("Actual Rows", 0) * loops,
+                    "method": node.get("Sort Method"),
+                    "space_kib": node.get("Sort Space Used"),
+                    "space_type": node.get("Sort Space Type"),
+                }
+            )
+        for child in node.get("Plans", ()):
+            self.walk(child, report)
+
+
+class SQLiteExplain:
+    """
+    EXPLAIN QUERY PLAN: план без выполнения и числа строк. SCAN -
+    полный проход по таблице (или по индексу целиком), TEMP B-TREE -
+    сортировка. Поиск по FTS5 и проход по подзапросу в FROM - не
+    чтение таблицы.
+    """
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            details = [row[3] for row in cursor.fetchall()]
+        return {
+            "time_ms": None,
+            "seq_scans": [
+                {"table": detail[len("SCAN ") :]}
+                for detail in details
+                if detail.startswith("SCAN ")
+                and "VIRTUAL TABLE" not in detail
+                and detail != "SCAN subquery"
+            ],
+            "sorts": [
+                {"key": detail[len("USE TEMP B-TREE FOR ") :]}
+                for detail in details
+                if detail.startswith("USE TEMP B-TREE FOR ")
+            ],
+        }
+
+
+def get_explainer(min_rows=EXPLAIN_MIN_ROWS):
+    if connection.vendor == "postgresql":
+        return PostgresExplain(min_rows)
+    return SQLiteExplain()
+
+
+def advise(context, min_rows=EXPLAIN_MIN_ROWS):
+    """Отчёт по запросам, в планах которых есть полные чтения или сортировки."""
+    explainer = get_explainer(min_rows)
+    findings = []
+    for step, sql, params in replay(context):
+        report = explainer.explain(sql, params)
+        if report["seq_scans"] or report["sorts"]:
+            findings.append({"step": step, "sql": sql, **report})
+    return findings
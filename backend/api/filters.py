@@ -1,45 +1,83 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
+from recipes.search import search_recipes
 
 
-class IngredientFilter(rest_framework.FilterSet):
-    """Фильтр для ингредиентов."""
+class StableOrderingFilter(rest_framework.OrderingFilter):
+    """
+    Сортировка ordering с id последним ключом: рецепты с равным
+    значением не переставляются между страницами.
+    """
 
-    name = rest_framework.CharFilter(lookup_expr="startswith")
-
-    class Meta:
-        model = Ingredient
-        fields = ("name",)
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        qs = super().filter(qs, value)
+        return qs.order_by(*qs.query.order_by, "-id")
 
 
 class RecipeFilter(rest_framework.FilterSet):
-    """Фильтр для рецептов: по избранному, списку покупок, автору и тегам."""
+    """
+    Фильтр для рецептов: по избранному, списку покупок, автору, тегам,
+    полнотекстовый поиск search по названию, описанию и ингредиентам
+    и сортировка ordering по дате публикации или числу добавлений
+    в избранное.
+    """
 
     is_favorited = rest_framework.BooleanFilter(method="filter_is_favorited__in")
     is_in_shopping_cart = rest_framework.BooleanFilter(
         method="is_in_shopping_cart_method"
     )
     author = rest_framework.NumberFilter(field_name="author", lookup_expr="exact")
-    tags = rest_framework.AllValuesMultipleFilter(
-        field_name="tags__slug",
+    tags = rest_framework.ModelMultipleChoiceFilter(
+        queryset=Tag.objects.all(),
+        to_field_name="slug",
+        method="filter_tags",
     )
+    search = rest_framework.CharFilter(method="filter_search")
+    # Популярность берётся из столбца-счётчика, без COUNT по избранному.
+    ordering = StableOrderingFilter(fields=("pub_date", "favorites_count"))
+
+    def filter_by_user_relation(self, queryset, model, value):
+        """
+        Фильтр EXISTS / NOT EXISTS по связи рецепта с текущим пользователем,
+        сочетается с остальными фильтрами, сортировкой и пагинацией.
+        """
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.none() if value else queryset
+
+        in_relation = Exists(model.objects.filter(user=user, recipe=OuterRef("pk")))
+        return queryset.filter(in_relation if value else ~in_relation)
 
     def filter_is_favorited__in(self, queryset, name, value):
         if value:
-            favorites = Favorite.objects.filter(user=self.request.user)
-            recipes = [item.recipe.id for item in favorites]
-            return queryset.filter(id__in=recipes)
+            return self.filter_by_user_relation(queryset, Favorite, value)
         return queryset
 
     def is_in_shopping_cart_method(self, queryset, name, value):
-        shopping_cart = ShoppingCart.objects.filter(user=self.request.user)
-        recipes = [item.recipe.id for item in shopping_cart]
-        new_queryset = queryset.filter(id__in=recipes)
+        return self.filter_by_user_relation(queryset, ShoppingCart, value)
 
+    def filter_tags(self, queryset, name, value):
+        """
+        Рецепты хотя бы с одним из тегов. EXISTS вместо JOIN не размножает
+        строки рецепта, и выборке не нужен DISTINCT с сортировкой.
+        """
         if not value:
-            return queryset.difference(new_queryset)
+            return queryset
+        return queryset.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe=OuterRef("pk"), tag__in=value
+                )
+            )
+        )
 
-        return queryset.filter(id__in=recipes)
+    def filter_search(self, queryset, name, value):
+        if not value.strip():
+            return queryset
+        return search_recipes(queryset, value)
 
     class Meta:
         model = Recipe
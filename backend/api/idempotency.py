@@ -0,0 +1,57 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.db import transaction
+from recipes.models import IdempotencyKey
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+KEY_MAX_LENGTH = 255
+
+
+def request_signature(request):
+    """Метод, путь и хэш тела: один ключ нельзя использовать для разных запросов."""
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    digest = hashlib.sha256(body.encode()).hexdigest()[:16]
+    return f"{request.method} {request.path} {digest}"
+
+
+def idempotent(method):
+    """
+    Делает действие вьюсета идемпотентным для авторизованных запросов
+    с заголовком Idempotency-Key: действие и сохранение ответа идут в
+    одной транзакции, повтор с тем же ключом получает сохранённый ответ.
+    Ответы с ошибкой (исключения) не сохраняются, такой запрос можно
+    повторить с тем же ключом.
+    """
+
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key or not request.user.is_authenticated:
+            return method(self, request, *args, **kwargs)
+        if len(key) > KEY_MAX_LENGTH:
+            raise ValidationError(
+                {"errors": f"Ключ идемпотентности длиннее {KEY_MAX_LENGTH} символов."}
+            )
+
+        signature = request_signature(request)
+        with transaction.atomic():
+            record, created = IdempotencyKey.claim(request.user, key, signature)
+            if not created:
+                if record.request != signature:
+                    return Response(
+                        {"errors": "Ключ идемпотентности уже использован."},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    )
+                return Response(record.response, status=record.status_code)
+            response = method(self, request, *args, **kwargs)
+            record.status_code = response.status_code
+            record.response = response.data
+            record.save(update_fields=["status_code", "response"])
+        return response
+
+    return wrapper
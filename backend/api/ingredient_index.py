@@ -0,0 +1,111 @@
+import re
+import threading
+from bisect import bisect_left
+
+from recipes.models import Ingredient
+
+SEARCH_LIMIT = 50
+
+WORD_SEPARATOR_REGEX = re.compile(r"[\W_]+")
+
+
+def normalize(text):
+    """Приводит строку к виду для поиска: без регистра, ё == е."""
+    return text.strip().casefold().replace("ё", "е")
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения.
+    Совпадения по началу названия ищутся бинарным поиском по
+    отсортированному списку названий, по началу слова - по отсортированному
+    списку слов, а подстроки - перебором, пока не набран лимит.
+    """
+
+    def __init__(self, ingredients):
+        self.ingredients = sorted(
+            ingredients, key=lambda item: (normalize(item.name), item.id)
+        )
+        self.by_id = {ingredient.id: ingredient for ingredient in self.ingredients}
+        self.names = [normalize(ingredient.name) for ingredient in self.ingredients]
+        words = []
+        for position, name in enumerate(self.names):
+            for word in WORD_SEPARATOR_REGEX.split(name)[1:]:
+                if word:
+                    words.append((word, position))
+        words.sort()
+        self.words = [word for word, _ in words]
+        self.word_positions = [position for _, position in words]
+
+    @staticmethod
+    def prefix_range(keys, prefix):
+        start = bisect_left(keys, prefix)
+        end = start
+        while end < len(keys) and keys[end].startswith(prefix):
+            end += 1
+        return range(start, end)
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """
+        Ищет ингредиенты по запросу и возвращает не более limit
+        результатов: сначала по началу названия, затем по началу
+        любого слова, затем по подстроке.
+        """
+        query = normalize(query)
+        if not query:
+            return self.ingredients[:limit]
+
+        found = []
+        seen = set()
+
+        def collect(positions):
+            group = []
+            for position in positions:
+                if position not in seen:
+                    seen.add(position)
+                    group.append(position)
+            group.sort(key=lambda position: (len(self.names[position]), position))
+            found.extend(group)
+
+        collect(self.prefix_range(self.names, query))
+        if len(found) < limit:
+            collect(
+                self.word_positions[index]
+                for index in self.prefix_range(self.words, query)
+            )
+        if len(found) < limit:
+            collect(
+                position
+                for position, name in enumerate(self.names)
+                if query in name
+            )
+        return [self.ingredients[position] for position in found[:limit]]
+
+
+class IngredientIndexHolder:
+    """
+    Хранит построенный индекс вместе с версией справочника ингредиентов
+    (ChangeMarker "ingredients"), из которой он построен. Версию читает
+    вьюсет вместе с ETag; индекс перестраивается, когда она сменилась, -
+    в том числе после загрузки справочника другим процессом.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.built = (None, None)
+
+    def get(self, version):
+        built_version, index = self.built
+        if version != built_version:
+            with self.lock:
+                built_version, index = self.built
+                if version != built_version:
+                    index = IngredientIndex(list(Ingredient.objects.all()))
+                    self.built = (version, index)
+        return index
+
+
+ingredient_index = IngredientIndexHolder()
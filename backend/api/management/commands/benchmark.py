@@ -0,0 +1,153 @@
+import json
+import logging
+import platform
+import tempfile
+
+import django
+from api.benchmark import REGRESSION_THRESHOLD, Benchmark, build_context, compare
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from django.utils import timezone
+from recipes.dataset import DatasetGenerator
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger()
+
+
+def load(path):
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+class Command(BaseCommand):
+    help = (
+        "Замер всех маршрутов API на тестовой базе с детерминированными "
+        "данными: число запросов к БД, p50/p95 времени ответа, память"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="Сохранить результаты в JSON-файл.")
+        parser.add_argument(
+            "--compare",
+            nargs="+",
+            metavar="RESULTS",
+            help=(
+                "Сравнить с результатами из файла. С двумя файлами замер "
+                "не выполняется, сравниваются они между собой."
+            ),
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=REGRESSION_THRESHOLD,
+            help="Допустимый рост p95 и памяти в долях.",
+        )
+        parser.add_argument(
+            "--strict-n-plus-one",
+            action="store_true",
+            help="Завершиться с ошибкой, если найдены повторяющиеся запросы (N+1).",
+        )
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--recipes", type=int, default=500)
+        parser.add_argument("--ingredients", type=int, default=300)
+        parser.add_argument("--ingredients-per-recipe", type=int, default=6)
+        parser.add_argument("--favorites-per-user", type=int, default=20)
+        parser.add_argument("--carts-per-user", type=int, default=5)
+        parser.add_argument("--follows-per-user", type=int, default=5)
+
+    def handle(self, *args, **options):
+        compared = options["compare"] or []
+        if len(compared) > 2:
+            raise CommandError("--compare принимает один или два файла.")
+        if len(compared) == 2:
+            self.report_regressions(
+                load(compared[0]), load(compared[1]), options["threshold"]
+            )
+            return
+
+        results = self.run(options)
+        for key, route in results["routes"].items():
+            logger.info(
+                f"{key}: запросов {route['queries']}, p50 {route['p50_ms']} мс, "
+                f"p95 {route['p95_ms']} мс, память {route['peak_memory_kib']} КиБ, "
+                f"ответы {route['statuses']}"
+            )
+        repeated = {
+            key: route["repeated_queries"]
+            for key, route in results["routes"].items()
+            if route["repeated_queries"]
+        }
+        for key, queries in repeated.items():
+            for query in queries:
+                logger.warning(
+                    f"N+1 {key}: {query['count']} одинаковых запросов: "
+                    f"{query['sql']}\n{query['stack']}"
+                )
+        if results["uncovered_routes"]:
+            logger.warning(
+                f"Маршруты без замера: {', '.join(results['uncovered_routes'])}"
+            )
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+            logger.info(f"Результаты сохранены в {options['output']}")
+        if compared:
+            self.report_regressions(load(compared[0]), results, options["threshold"])
+        if repeated and options["strict_n_plus_one"]:
+            raise CommandError(f"N+1 в маршрутах: {', '.join(repeated)}")
+
+    def run(self, options):
+        sizes = {
+            name: options[name]
+            for name in (
+                "users",
+                "recipes",
+                "ingredients",
+                "ingredients_per_recipe",
+                "favorites_per_user",
+                "carts_per_user",
+                "follows_per_user",
+            )
+        }
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory() as media_root, override_settings(
+                MEDIA_ROOT=media_root
+            ):
+                logger.info(f"Генерация данных: {sizes}")
+                dataset = DatasetGenerator(seed=options["seed"], **sizes).generate()
+                results = Benchmark(
+                    build_context(dataset),
+                    repeat=options["repeat"],
+                    warmup=options["warmup"],
+                ).run()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        results["meta"] = {
+            "created_at": timezone.now().isoformat(),
+            "seed": options["seed"],
+            "sizes": sizes,
+            "repeat": options["repeat"],
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+        }
+        return results
+
+    def report_regressions(self, base, current, threshold):
+        regressions = compare(base, current, threshold)
+        for key, metric, old, new in regressions:
+            logger.warning(f"Регрессия {key}: {metric} {old} -> {new}")
+        if regressions:
+            raise CommandError(f"Найдено регрессий: {len(regressions)}")
+        logger.info("Регрессий не найдено.")
@@ -0,0 +1,55 @@
+import json
+import logging
+from collections import Counter
+
+from api.explain import EXPLAIN_MIN_ROWS, advise, explain_context
+from django.core.management import BaseCommand, CommandError
+from users.models import User
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger()
+
+
+class Command(BaseCommand):
+    help = (
+        "Планы SQL-запросов основных эндпоинтов на текущей базе: "
+        "последовательные чтения таблиц и сортировки без индекса"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-rows",
+            type=int,
+            default=EXPLAIN_MIN_ROWS,
+            help="Не показывать чтения таблиц меньше этого числа строк "
+            "(только Postgres).",
+        )
+        parser.add_argument("--output", help="Сохранить отчёт в JSON-файл.")
+
+    def handle(self, *args, **options):
+        if not User.objects.exists():
+            raise CommandError(
+                "База пуста: заполните её, например, командой generate_load_data."
+            )
+        findings = advise(explain_context(), options["min_rows"])
+        tables = Counter()
+        for finding in findings:
+            time_ms = finding["time_ms"]
+            logger.info(
+                f"{finding['step']}"
+                f"{f' ({time_ms:.1f} мс)' if time_ms is not None else ''}:\n"
+                f"{finding['sql']}"
+            )
+            for scan in finding["seq_scans"]:
+                tables[scan["table"]] += 1
+                logger.warning(f"  последовательное чтение: {scan}")
+            for sort in finding["sorts"]:
+                logger.warning(f"  сортировка: {sort}")
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(findings, file, ensure_ascii=False, indent=2, default=str)
+            logger.info(f"Отчёт сохранён в {options['output']}")
+        logger.info(
+            f"Запросов с полными чтениями или сортировками: {len(findings)}. "
+            f"Таблицы: {dict(tables.most_common()) or 'нет'}"
+        )
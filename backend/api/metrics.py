@@ -0,0 +1,206 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from rest_framework import renderers, serializers
+
+METRICS_PREFIX = "foodgram"
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+HISTOGRAMS = {
+    "request_duration_seconds": ("Время обработки запроса.", TIME_BUCKETS),
+    "db_duration_seconds": ("Время SQL-запросов за запрос.", TIME_BUCKETS),
+    "serializer_duration_seconds": ("Время сериализации ответа.", TIME_BUCKETS),
+    "db_queries": ("Число SQL-запросов за запрос.", QUERY_BUCKETS),
+    "response_size_bytes": ("Размер тела ответа.", SIZE_BUCKETS),
+}
+
+current_metrics = ContextVar("current_metrics", default=None)
+
+
+class RequestMetrics:
+    """
+    Замеры одного запроса: число и время SQL-запросов (через
+    execute_wrapper соединений), время сериализации и размер ответа.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.size = None
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    @contextmanager
+    def serializing(self):
+        # Вложенные сериализаторы тоже обращаются к .data;
+        # считается только внешний вызов.
+        self.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.serializer_depth -= 1
+            if not self.serializer_depth:
+                self.serializer_time += time.perf_counter() - started
+
+    def finish(self, response):
+        self.duration = time.perf_counter() - self.started
+        if not response.streaming:
+            self.size = len(response.content)
+
+    def server_timing(self):
+        """Значение заголовка Server-Timing, время в миллисекундах."""
+        timings = [
+            f"total;dur={self.duration * 1000:.3f}",
+            f'db;dur={self.db_time * 1000:.3f};desc="{self.queries} queries"',
+            f"serializer;dur={self.serializer_time * 1000:.3f}",
+        ]
+        if self.size is not None:
+            timings.append(f'response;desc="{self.size} bytes"')
+        return ", ".join(timings)
+
+    def values(self):
+        return {
+            "request_duration_seconds": self.duration,
+            "db_duration_seconds": self.db_time,
+            "serializer_duration_seconds": self.serializer_time,
+            "db_queries": self.queries,
+            "response_size_bytes": self.size,
+        }
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels):
+    return ",".join(f'{name}="{escape_label(value)}"' for name, value in labels)
+
+
+class MetricsRegistry:
+    """
+    Гистограммы замеров по действиям вьюсетов (recipes.list,
+    users.subscriptions) и методам. Хранятся в памяти процесса:
+    при нескольких воркерах каждый отдаёт свои значения.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.requests = {}
+
+    def record(self, view, method, status, metrics):
+        with self.lock:
+            key = (view, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for name, value in metrics.values().items():
+                if value is None:
+                    continue
+                histogram = self.histograms.get((name, view, method))
+                if histogram is None:
+                    histogram = self.histograms[(name, view, method)] = Histogram(
+                        HISTOGRAMS[name][1]
+                    )
+                histogram.observe(value)
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+            self.requests.clear()
+
+    def render(self):
+        """Текстовый формат Prometheus (version 0.0.4)."""
+        with self.lock:
+            total = f"{METRICS_PREFIX}_requests_total"
+            lines = [
+                f"# HELP {total} Число обработанных запросов.",
+                f"# TYPE {total} counter",
+            ]
+            for (view, method, status), count in sorted(self.requests.items()):
+                labels = format_labels(
+                    (("view", view), ("method", method), ("status", status))
+                )
+                lines.append(f"{total}{{{labels}}} {count}")
+            for name, (help_text, _) in HISTOGRAMS.items():
+                metric = f"{METRICS_PREFIX}_{name}"
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                for key in sorted(self.histograms):
+                    if key[0] == name:
+                        lines.extend(
+                            render_histogram(metric, *key[1:], self.histograms[key])
+                        )
+        return "\n".join(lines) + "\n"
+
+
+def render_histogram(metric, view, method, histogram):
+    labels = (("view", view), ("method", method))
+    cumulative = 0
+    for bucket, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+        cumulative += count
+        bucket_labels = format_labels((*labels, ("le", bucket)))
+        yield f"{metric}_bucket{{{bucket_labels}}} {cumulative}"
+    yield f"{metric}_sum{{{format_labels(labels)}}} {histogram.sum}"
+    yield f"{metric}_count{{{format_labels(labels)}}} {histogram.count}"
+
+
+registry = MetricsRegistry()
+
+
+class PrometheusRenderer(renderers.BaseRenderer):
+    media_type = "text/plain"
+    format = "txt"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = "\n".join(f"{key}: {value}" for key, value in data.items())
+        return str(data).encode(self.charset)
+
+
+def instrument_serializers():
+    """
+    Оборачивает BaseSerializer.data, чтобы время сериализации
+    попадало в замеры текущего запроса.
+    """
+    data = serializers.BaseSerializer.data
+    if getattr(data.fget, "instrumented", False):
+        return
+
+    def timed_data(self):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return data.fget(self)
+        with metrics.serializing():
+            return data.fget(self)
+
+    timed_data.instrumented = True
+    serializers.BaseSerializer.data = property(timed_data)
@@ -0,0 +1,79 @@
+from contextlib import ExitStack
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .metrics import RequestMetrics, current_metrics, registry
+from .query_detector import DETECTOR_OFF, DETECTOR_STRICT, QueryDetector, detector_mode
+
+UNRESOLVED_VIEW = "unresolved"
+
+
+def view_label(request, view_func):
+    """
+    Имя действия для метрик: basename.action для вьюсетов
+    (recipes.list, users.subscriptions), имя маршрута для остальных.
+    """
+    actions = getattr(view_func, "actions", None)
+    if actions:
+        method = request.method.lower()
+        if method == "head" and "head" not in actions:
+            method = "get"
+        basename = view_func.initkwargs.get("basename")
+        return f"{basename}.{actions.get(method, method)}"
+    return request.resolver_match.view_name
+
+
+class RequestMetricsMiddleware:
+    """
+    Замеряет каждый запрос: число SQL-запросов, время в базе, время
+    сериализации и размер ответа. Замеры отдаются клиенту в заголовке
+    Server-Timing и копятся в гистограммах по действиям вьюсетов,
+    которые читает /api/metrics/.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        request.metrics_view = UNRESOLVED_VIEW
+        token = current_metrics.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.execute))
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        metrics.finish(response)
+        response["Server-Timing"] = metrics.server_timing()
+        registry.record(
+            request.metrics_view, request.method, response.status_code, metrics
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = view_label(request, view_func)
+
+
+class NPlusOneMiddleware:
+    """
+    Ищет N+1 в каждом запросе (N_PLUS_ONE_DETECTOR = "log" или
+    "strict"). Повторы пишутся в лог со стеком вызова; в строгом
+    режиме запрос падает с NPlusOneError, а с ним и тест, который
+    его сделал. По умолчанию выключен.
+    """
+
+    def __init__(self, get_response):
+        self.mode = detector_mode()
+        if self.mode == DETECTOR_OFF:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryDetector(
+            strict=self.mode == DETECTOR_STRICT,
+            label=f"{request.method} {request.path}",
+        ):
+            return self.get_response(request)
@@ -1,5 +1,16 @@
+import base64
+import json
+from collections import namedtuple
+from functools import reduce
+
 from django.core import paginator
-from rest_framework.pagination import PageNumberPagination
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from recipes.models import Recipe
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 PAGE_SIZE = 6
 
@@ -8,3 +19,163 @@ class CustomPagination(PageNumberPagination):
     django_paginator_class = paginator.Paginator
     page_size_query_param = "limit"
     page_size = PAGE_SIZE
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная пагинация по уникальному набору полей ordering.
+    Следующая страница выбирается условием "после последней записи",
+    без COUNT(*) и OFFSET, поэтому глубокие страницы не медленнее первой.
+    Размер страницы задаётся тем же параметром limit.
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "limit"
+    page_size = PAGE_SIZE
+    ordering = ("-pub_date", "-id")
+    invalid_cursor_message = "Неверный курсор."
+
+    def get_page_size(self, request):
+        page_size = request.query_params.get(self.page_size_query_param, "")
+        if page_size.isdigit() and int(page_size) > 0:
+            return int(page_size)
+        return self.page_size
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                model._meta.get_field(field.lstrip("-")).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, item):
+        values = [getattr(item, field.lstrip("-")) for field in self.ordering]
+        values = [
+            value.isoformat() if hasattr(value, "isoformat") else value
+            for value in values
+        ]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def after(self, position, ordering=None):
+        """Условие (a, b, ...) > (x, y, ...) с учётом направления полей."""
+        ordering = ordering or self.ordering
+        conditions = []
+        for index, field in enumerate(ordering):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            equal = {
+                previous.lstrip("-"): position[number]
+                for number, previous in enumerate(ordering[:index])
+            }
+            conditions.append(Q(**equal, **{f"{name}__{lookup}": position[index]}))
+        return reduce(Q.__or__, conditions)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = getattr(view, "keyset_ordering", self.ordering)
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, queryset.model)
+
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+        results = list(queryset[: page_size + 1])
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.page[-1]),
+        )
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True},
+                "results": schema,
+            },
+        }
+
+
+FeedItem = namedtuple("FeedItem", ("pub_date", "id"))
+
+
+class FeedPagination(KeysetPagination):
+    """
+    Курсорная пагинация ленты, собранной из нескольких источников.
+    Источник - запрос и имена его полей даты публикации и id рецепта.
+    С каждого источника берётся не больше страницы после курсора,
+    результаты сливаются по (pub_date, id).
+    """
+
+    ordering = ("-pub_date", "-id")
+
+    def paginate_queryset(self, sources, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, Recipe)
+
+        results = []
+        for queryset, fields in sources:
+            ordering = tuple(f"-{field}" for field in fields)
+            if position is not None:
+                queryset = queryset.filter(self.after(position, ordering))
+            results.extend(
+                FeedItem(*row)
+                for row in queryset.order_by(*ordering).values_list(*fields)[
+                    : page_size + 1
+                ]
+            )
+        results.sort(reverse=True)
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+        return self.page
+
+
+class KeysetOptInMixin:
+    """
+    Включает KeysetPagination для действий keyset_actions, если в запросе
+    передан параметр cursor (пустой - первая страница). Без него
+    остаётся постраничная пагинация pagination_class.
+    Параметры keyset_excluded_params задают собственный порядок выдачи
+    (например, search - по релевантности), который курсор по ordering
+    потерял бы, поэтому с ними cursor игнорируется.
+    """
+
+    keyset_actions = ()
+    keyset_ordering = KeysetPagination.ordering
+    keyset_excluded_params = ()
+
+    def use_keyset(self):
+        params = self.request.query_params
+        return (
+            self.action in self.keyset_actions
+            and KeysetPagination.cursor_query_param in params
+            and not any(params.get(name) for name in self.keyset_excluded_params)
+        )
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            if self.use_keyset():
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
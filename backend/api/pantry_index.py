@@ -0,0 +1,207 @@
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from recipes.models import IngredientInRecipe, Recipe
+from recipes.signals import ingredients_changed
+
+MAX_MISSING = 2
+
+
+def insert_sorted(values, value):
+    position = bisect_left(values, value)
+    if position == len(values) or values[position] != value:
+        values.insert(position, value)
+
+
+def remove_sorted(values, value):
+    position = bisect_left(values, value)
+    if position < len(values) and values[position] == value:
+        del values[position]
+
+
+class PantryIndex:
+    """
+    Индекс "ингредиент -> рецепты" для подбора рецептов по продуктам,
+    которые есть у пользователя. Для каждого ингредиента хранится
+    отсортированный массив id рецептов, для каждого рецепта - массив id
+    его ингредиентов. Подбор проходит только по спискам рецептов
+    переданных ингредиентов, без запросов к базе.
+    """
+
+    def __init__(self, rows):
+        """rows - пары (recipe_id, ingredient_id), по возрастанию обоих."""
+        self.recipes = {}
+        self.postings = {}
+        for recipe_id, group in groupby(rows, key=itemgetter(0)):
+            ingredient_ids = array("q", (ingredient for _, ingredient in group))
+            self.recipes[recipe_id] = ingredient_ids
+            for ingredient_id in ingredient_ids:
+                # id рецептов приходят по возрастанию, списки уже отсортированы.
+                self.postings.setdefault(ingredient_id, array("q")).append(recipe_id)
+
+    def update(self, recipe_id, ingredient_ids):
+        """Заменяет состав рецепта; пустой состав удаляет рецепт из индекса."""
+        stored = set(self.recipes.pop(recipe_id, ()))
+        wanted = set(ingredient_ids)
+        for ingredient_id in stored - wanted:
+            posting = self.postings[ingredient_id]
+            remove_sorted(posting, recipe_id)
+            if not posting:
+                del self.postings[ingredient_id]
+        for ingredient_id in wanted - stored:
+            insert_sorted(
+                self.postings.setdefault(ingredient_id, array("q")), recipe_id
+            )
+        if wanted:
+            self.recipes[recipe_id] = array("q", sorted(wanted))
+
+    def match(self, ingredient_ids, max_missing=MAX_MISSING):
+        """
+        Рецепты, в которых есть хотя бы один из ингредиентов и не хватает
+        не больше max_missing. Возвращает кортежи (recipe_id, доля
+        имеющихся ингредиентов, id недостающих): сначала рецепты с
+        наибольшей долей, затем с меньшим числом недостающих, затем новые.
+        """
+        owned = set(ingredient_ids)
+        found = Counter()
+        for ingredient_id in owned:
+            found.update(self.postings.get(ingredient_id, ()))
+        matches = []
+        for recipe_id, count in found.items():
+            total = len(self.recipes.get(recipe_id, ()))
+            if total and total - count <= max_missing:
+                matches.append((recipe_id, count / total, total - count))
+        matches.sort(key=lambda item: (-item[1], item[2], -item[0]))
+        return [
+            (
+                recipe_id,
+                coverage,
+                [
+                    ingredient_id
+                    for ingredient_id in self.recipes.get(recipe_id, ())
+                    if ingredient_id not in owned
+                ],
+            )
+            for recipe_id, coverage, _ in matches
+        ]
+
+
+class PantryIndexHolder:
+    """
+    Хранит построенный индекс вместе с версией рецептов (ChangeMarker
+    "recipes"), из которой он построен. Версию читает вьюсет вместе с
+    ETag до обращения к индексу. Рецепты, изменённые в этом процессе,
+    обновляются в индексе по одному после коммита. Когда версия
+    сменилась, в том числе после записи другого процесса, индекс
+    перестраивается в фоновом потоке, а запросы до конца перестройки
+    получают прежний. Синхронно строится только первый индекс.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.built = (None, None)
+        self.rebuilding = None
+
+    @staticmethod
+    def build():
+        return PantryIndex(
+            IngredientInRecipe.objects.order_by("recipe_id", "ingredient_id")
+            .values_list("recipe_id", "ingredient_id")
+            .iterator()
+        )
+
+    def get(self, version):
+        built_version, index = self.built
+        if index is None:
+            with self.lock:
+                built_version, index = self.built
+                if index is None:
+                    index = self.build()
+                    self.built = (version, index)
+        elif version != built_version:
+            if getattr(settings, "PANTRY_INDEX_BACKGROUND_REBUILD", True):
+                self.start_rebuild(version)
+            else:
+                self.rebuild(version)
+                built_version, index = self.built
+        return index
+
+    def start_rebuild(self, version):
+        """Запускает перестройку в фоновом потоке, если она ещё не идёт."""
+        with self.lock:
+            if self.rebuilding is not None or version == self.built[0]:
+                return
+            self.rebuilding = threading.Thread(
+                target=self.rebuild_in_background, args=(version,), daemon=True
+            )
+        self.rebuilding.start()
+
+    def rebuild_in_background(self, version):
+        try:
+            self.rebuild(version)
+        finally:
+            self.rebuilding = None
+            # У потока своё соединение с базой, его некому закрыть.
+            connection.close()
+
+    def rebuild(self, version):
+        index = self.build()
+        with self.lock:
+            self.built = (version, index)
+
+    def refresh(self, recipe_ids):
+        """Перечитывает из базы состав рецептов recipe_ids."""
+        if self.built[1] is None:
+            return
+        compositions = {recipe_id: [] for recipe_id in recipe_ids}
+        for recipe_id, ingredient_id in IngredientInRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list("recipe_id", "ingredient_id"):
+            compositions[recipe_id].append(ingredient_id)
+        with self.lock:
+            _, index = self.built
+            if index is not None:
+                for recipe_id, ingredient_ids in compositions.items():
+                    index.update(recipe_id, ingredient_ids)
+
+    def schedule_refresh(self, recipe_ids):
+        recipe_ids = set(recipe_ids)
+        transaction.on_commit(lambda: self.refresh(recipe_ids))
+
+
+pantry_index = PantryIndexHolder()
+
+
+@receiver(post_save, sender=Recipe)
+def add_pantry_recipe(sender, instance, created, **kwargs):
+    # Ингредиенты нового рецепта сохраняются bulk_create без сигналов,
+    # уже после самого рецепта; к коммиту состав окончательный. При
+    # изменении рецепта состав обновляет RecipePostSerializer.
+    if created:
+        pantry_index.schedule_refresh([instance.id])
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_pantry_recipe(sender, instance, **kwargs):
+    pantry_index.schedule_refresh([instance.id])
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+def refresh_pantry_ingredients(sender, instance, **kwargs):
+    pantry_index.schedule_refresh([instance.recipe_id])
+
+
+@receiver(ingredients_changed, sender=IngredientInRecipe)
+def refresh_changed_pantry_recipes(sender, recipe_ids, **kwargs):
+    pantry_index.schedule_refresh(recipe_ids)
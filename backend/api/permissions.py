@@ -15,3 +15,12 @@ class IsAuthorOrAdminOrReadOnly(permissions.BasePermission):
             or obj.author == request.user
             or request.user.is_superuser
         )
+
+
+class IsAdmin(permissions.BasePermission):
+    """Доступ только у админа."""
+
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and (
+            request.user.is_superuser or request.user.is_admin
+        )
@@ -0,0 +1,148 @@
+import logging
+import re
+import traceback
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+N_PLUS_ONE_THRESHOLD = 5
+STACK_DEPTH = 8
+
+DETECTOR_OFF = ""
+DETECTOR_LOG = "log"
+DETECTOR_STRICT = "strict"
+
+logger = logging.getLogger(__name__)
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+PLACEHOLDER_LIST = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)")
+SPACES = re.compile(r"\s+")
+SKIPPED = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+def fingerprint(sql):
+    """
+    Структура запроса без значений: строки и числа заменяются на ?,
+    списки параметров IN (...) любой длины - на один (...). Одинаково
+    для SQLite и Postgres: обёртка видит SQL до подстановки параметров.
+    """
+    sql = STRING.sub("?", sql)
+    sql = NUMBER.sub("?", sql)
+    sql = PLACEHOLDER_LIST.sub("(...)", sql)
+    return SPACES.sub(" ", sql).strip()
+
+
+def project_stack():
+    """Кадры стека из кода проекта, без Django, DRF и самого детектора."""
+    root = str(settings.BASE_DIR)
+    frames = [
+        frame
+        for frame in traceback.extract_stack()[:-2]
+        if frame.filename.startswith(root)
+        and "site-packages" not in frame.filename
+        and frame.filename != __file__
+    ]
+    return traceback.format_list(frames[-STACK_DEPTH:])
+
+
+class RepeatedQuery:
+    def __init__(self, sql, stack):
+        self.sql = sql
+        self.stack = stack
+        self.count = 0
+
+    def __str__(self):
+        return (
+            f"{self.count} одинаковых запросов: {self.sql}\n"
+            f"{''.join(self.stack) or '  (стек вне кода проекта)'}"
+        )
+
+
+class QueryDetector:
+    """
+    Ищет N+1: считает запросы с одинаковым отпечатком и запоминает
+    стек вызова, на котором число повторов дошло до threshold.
+    Используется как контекстный менеджер вокруг запроса или теста;
+    на выходе пишет повторы в лог, в строгом режиме (strict) бросает
+    NPlusOneError. watch() только собирает повторы для report().
+
+        with QueryDetector(strict=True):
+            client.get("/api/recipes/")
+    """
+
+    def __init__(self, threshold=None, strict=False, label=""):
+        if threshold is None:
+            threshold = getattr(settings, "N_PLUS_ONE_THRESHOLD", N_PLUS_ONE_THRESHOLD)
+        self.threshold = threshold
+        self.strict = strict
+        self.label = label
+        self.counts = Counter()
+        self.repeated = {}
+        self.stack = None
+
+    def execute(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith(SKIPPED):
+            key = fingerprint(sql)
+            self.counts[key] += 1
+            if self.counts[key] == self.threshold:
+                self.repeated[key] = RepeatedQuery(key, project_stack())
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def watch(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self.execute))
+            yield self
+
+    def __enter__(self):
+        self.stack = ExitStack()
+        self.stack.enter_context(self.watch())
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stack.close()
+        if exc_type is None:
+            self.check()
+        return False
+
+    def report(self):
+        """Повторы не меньше threshold, от самых частых."""
+        for key, repeated in self.repeated.items():
+            repeated.count = self.counts[key]
+        return sorted(self.repeated.values(), key=lambda item: -item.count)
+
+    def check(self):
+        repeated = self.report()
+        if not repeated:
+            return
+        message = f"N+1 {self.label}:\n" + "\n".join(map(str, repeated))
+        if self.strict:
+            raise NPlusOneError(message)
+        logger.warning(message)
+
+
+def detector_mode():
+    return getattr(settings, "N_PLUS_ONE_DETECTOR", DETECTOR_OFF)
+
+
+def detect_n_plus_one(threshold=None, strict=True):
+    """Декоратор для тестов: падает, если внутри были N+1."""
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with QueryDetector(threshold, strict, label=function.__qualname__):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,103 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import CharField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Concat
+from recipes.models import ChangeMarker, Favorite, Recipe, ShoppingCart
+from recipes.signals import RECIPE_CATALOG_KEY
+
+from .serializers import FollowedAuthors
+
+RECIPE_CACHE_TIMEOUT = 60 * 60
+
+
+def marker_version(key):
+    """Версия ChangeMarker по выражению ключа, 0 если строки ещё нет."""
+    return Coalesce(
+        Subquery(ChangeMarker.objects.filter(key=key).values("version")[:1]),
+        0,
+    )
+
+
+def row_key(table, field):
+    return Concat(Value(f"{table}#"), Cast(field, CharField()))
+
+
+def document_keys(recipe_ids, request):
+    """
+    Ключи общих документов рецептов. В ключ входят версии самого рецепта,
+    его автора и используемых в рецептах тэгов и ингредиентов: запись
+    в любом процессе (API, фоновой задаче, команде) меняет версии только
+    затронутых документов. Версии читаются одним запросом до сборки
+    документов, поэтому документ, собранный во время записи, ляжет под
+    старый ключ. В ключ входит и адрес сайта, так как ссылки на картинки
+    в документе абсолютные.
+    """
+    site = hashlib.md5(request.build_absolute_uri("/").encode()).hexdigest()
+    rows = (
+        Recipe.objects.filter(id__in=recipe_ids)
+        .annotate(
+            recipe_version=marker_version(row_key("recipes", OuterRef("id"))),
+            author_version=marker_version(row_key("users", OuterRef("author_id"))),
+            catalog_version=marker_version(Value(RECIPE_CATALOG_KEY)),
+        )
+        .values_list("id", "recipe_version", "author_version", "catalog_version")
+    )
+    return {
+        recipe_id: f"recipe_cache:{site}:{recipe_id}:{recipe}.{author}.{catalog}"
+        for recipe_id, recipe, author, catalog in rows
+    }
+
+
+def get_cached_recipes(keys, request):
+    """Достаёт из кэша документы рецептов и накладывает флаги зрителя."""
+    found = cache.get_many(keys.values())
+    documents = {
+        recipe_id: found[key] for recipe_id, key in keys.items() if key in found
+    }
+    apply_viewer_flags(documents.values(), request.user)
+    return documents
+
+
+def cache_recipes(documents, keys):
+    cache.set_many(
+        {
+            keys[document["id"]]: document
+            for document in documents
+            if document["id"] in keys
+        },
+        getattr(settings, "RECIPE_CACHE_TIMEOUT", RECIPE_CACHE_TIMEOUT),
+    )
+
+
+def apply_viewer_flags(documents, user):
+    """
+    Флаги is_favorited, is_in_shopping_cart и author.is_follow для
+    текущего пользователя, по одному запросу на флаг для всех документов.
+    """
+    documents = list(documents)
+    if not documents:
+        return
+    if user.is_anonymous:
+        favorites = shopping_cart = ()
+    else:
+        recipe_ids = [document["id"] for document in documents]
+        favorites = set(
+            Favorite.objects.filter(user=user, recipe__in=recipe_ids).values_list(
+                "recipe_id", flat=True
+            )
+        )
+        shopping_cart = set(
+            ShoppingCart.objects.filter(user=user, recipe__in=recipe_ids).values_list(
+                "recipe_id", flat=True
+            )
+        )
+    followed_authors = FollowedAuthors(user)
+    followed_authors.load(document["author"]["id"] for document in documents)
+    for document in documents:
+        document["is_favorited"] = document["id"] in favorites
+        document["is_in_shopping_cart"] = document["id"] in shopping_cart
+        document["author"]["is_follow"] = (
+            user.is_authenticated and document["author"]["id"] in followed_authors
+        )
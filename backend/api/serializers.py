@@ -1,62 +1,71 @@
+from collections.abc import Mapping
+
 import drf_extra_fields.fields
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
+from recipes.images import VARIANT_SIZES, ImageTooLarge, open_image
 from recipes.models import (
     Favorite,
     Ingredient,
     IngredientInRecipe,
     Recipe,
     ShoppingCart,
+    ShoppingCartIngredient,
     Tag,
 )
 from rest_framework import serializers
 from users.models import Follow, User
 
+from .pantry_index import pantry_index
 
-class UserGetSerializer(UserSerializer):
-    """Сериализатор для просмотра профиля пользователя."""
-
-    is_follow = serializers.SerializerMethodField()
-
-    class Meta:
-        model = User
-        fields = (
-            "email",
-            "id",
-            "username",
-            "first_name",
-            "last_name",
-            "is_follow",
-        )
-
-    def get_is_follow(self, obj):
-        request = self.context.get("request")
-        if request.user.is_anonymous:
-            return False
 
-        return Follow.objects.filter(author=obj, user=request.user).exists()
+class FollowedAuthors:
+    """
+    Подписки текущего пользователя на уже проверенных авторов.
+    Хранится в контексте сериализатора и догружается одним запросом
+    на всю пачку ещё не проверенных авторов.
+    """
 
+    def __init__(self, user):
+        self.user = user
+        self.checked = set()
+        self.followed = set()
+
+    def load(self, author_ids):
+        missing = set(author_ids) - self.checked
+        if missing and self.user.is_authenticated:
+            self.followed.update(
+                Follow.objects.filter(user=self.user, author__in=missing).values_list(
+                    "author_id", flat=True
+                )
+            )
+        self.checked.update(missing)
 
-class UserWithRecipesSerializer(UserGetSerializer):
-    """Сериализатор для просмотра пользователя с рецептами."""
+    def __contains__(self, author_id):
+        self.load([author_id])
+        return author_id in self.followed
 
-    recipes = serializers.SerializerMethodField(read_only=True)
-    recipes_count = serializers.SerializerMethodField(read_only=True)
 
-    class Meta:
-        model = User
-        fields = UserGetSerializer.Meta.fields + ("recipes", "recipes_count")
+def get_followed_authors(context):
+    if "followed_authors" not in context:
+        context["followed_authors"] = FollowedAuthors(context["request"].user)
+    return context["followed_authors"]
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
 
-    def get_recipes(self, object):
-        request = self.context.get("request")
-        context = {"request": request}
-        recipe_limit = request.query_params.get("recipe_limit")
-        if recipe_limit:
-            queryset = queryset[: int(recipe_limit)]
+class FollowedAuthorsListSerializer(serializers.ListSerializer):
+    """
+    Перед сериализацией страницы загружает подписки на всех её авторов,
+    поле с id автора задаёт author_id_field дочернего сериализатора.
+    """
 
-        return RecipeShortSerializer(queryset, context=context, many=True).data
+    def to_representation(self, data):
+        iterable = list(data.all() if isinstance(data, models.Manager) else data)
+        get_followed_authors(self.context).load(
+            getattr(item, self.child.author_id_field) for item in iterable
+        )
+        return super().to_representation(iterable)
 
 
 class UserGetSerializer(UserSerializer):
@@ -64,8 +73,11 @@ class UserGetSerializer(UserSerializer):
 
     is_follow = serializers.SerializerMethodField()
 
+    author_id_field = "id"
+
     class Meta:
         model = User
+        list_serializer_class = FollowedAuthorsListSerializer
         fields = (
             "email",
             "id",
@@ -80,7 +92,7 @@ class UserGetSerializer(UserSerializer):
         if request.user.is_anonymous:
             return False
 
-        return Follow.objects.filter(author=obj, user=request.user).exists()
+        return obj.id in get_followed_authors(self.context)
 
 
 class UserWithRecipesSerializer(UserGetSerializer):
@@ -89,20 +101,21 @@ class UserWithRecipesSerializer(UserGetSerializer):
     recipes = serializers.SerializerMethodField(read_only=True)
     recipes_count = serializers.SerializerMethodField(read_only=True)
 
-    class Meta:
-        model = User
+    class Meta(UserGetSerializer.Meta):
         fields = UserGetSerializer.Meta.fields + ("recipes", "recipes_count")
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
     def get_recipes(self, object):
         request = self.context.get("request")
         context = {"request": request}
-        recipe_limit = request.query_params.get("recipe_limit")
-        queryset = object.recipes.all()
-        if recipe_limit:
-            queryset = queryset[: int(recipe_limit)]
+        queryset = getattr(object, "limited_recipes", None)
+        if queryset is None:
+            recipe_limit = request.query_params.get("recipe_limit")
+            queryset = object.recipes.all()
+            if recipe_limit and recipe_limit.isdigit():
+                queryset = queryset[: int(recipe_limit)]
 
         return RecipeShortSerializer(queryset, context=context, many=True).data
 
@@ -122,43 +135,6 @@ class UserPostSerializer(UserCreateSerializer):
         )
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
-    """Сериализатор для подписок."""
-
-    user = serializers.PrimaryKeyRelatedField(
-        read_only=True, default=serializers.CurrentUserDefault()
-    )
-
-    class Meta:
-        model = Follow
-        fields = (
-            "author",
-            "user",
-        )
-        validators = [
-            serializers.UniqueTogetherValidator(
-                queryset=Follow.objects.all(),
-                fields=[
-                    "author",
-                    "user",
-                ],
-                message="Вы уже подписаны на этого пользователя",
-            )
-        ]
-
-    def create(self, validated_data):
-        return Follow.objects.create(
-            user=self.context.get("request").user, **validated_data
-        )
-
-    def validate_author(self, value):
-        if self.context.get("request").user == value:
-            raise serializers.ValidationError(
-                {"errors": "Подписка на самого себя не возможна!"}
-            )
-        return value
-
-
 class IngredientSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Ingredient, где не требуется поле amount."""
 
@@ -167,10 +143,42 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "measurement_unit")
 
 
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField, которому можно заранее передать все id из
+    запроса (preload): объекты загружаются одним запросом, и проверка
+    каждого id берёт объект из загруженных, а не делает свой запрос.
+    """
+
+    preloaded = None
+
+    def preload(self, values):
+        pks = set()
+        for value in values:
+            if not isinstance(value, bool):
+                try:
+                    pks.add(int(value))
+                except (TypeError, ValueError):
+                    pass
+        self.preloaded = self.get_queryset().in_bulk(pks)
+
+    def to_internal_value(self, data):
+        if self.preloaded is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            return self.preloaded[int(data)]
+        except KeyError:
+            self.fail("does_not_exist", pk_value=data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+
+
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения ингредиентов в рецептах."""
 
-    id = serializers.PrimaryKeyRelatedField(
+    id = PreloadedPrimaryKeyRelatedField(
         queryset=Ingredient.objects.all(), source="ingredient.id"
     )
     name = serializers.CharField(source="ingredient.name", read_only=True)
@@ -196,6 +204,32 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "color", "slug")
 
 
+class ImageVariantsField(serializers.Field):
+    """
+    Ссылки на уменьшенные копии картинки рецепта по размерам и форматам.
+    None, пока копии текущей картинки ещё не построены.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        variants = recipe.image_variants
+        if not recipe.image or variants.get("source") != recipe.image.name:
+            return None
+        request = self.context.get("request")
+        return {
+            name: {
+                image_format: request.build_absolute_uri(default_storage.url(path))
+                for image_format, path in variants[name].items()
+            }
+            for name in VARIANT_SIZES
+            if name in variants
+        }
+
+
 class RecipeGetSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Recipe.
     Для GET запросов к эндпоинтам /recipe/ и /recipe/id/.
@@ -208,9 +242,13 @@ class RecipeGetSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField()
+
+    author_id_field = "author_id"
 
     class Meta:
         model = Recipe
+        list_serializer_class = FollowedAuthorsListSerializer
         fields = (
             "id",
             "tags",
@@ -220,6 +258,7 @@ class RecipeGetSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "image_variants",
             "text",
             "cooking_time",
         )
@@ -229,6 +268,10 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         if request.user.is_anonymous:
             return False
 
+        is_favorited = getattr(obj, "is_favorited", None)
+        if is_favorited is not None:
+            return is_favorited
+
         return Favorite.objects.filter(recipe=obj, user=request.user).exists()
 
     def get_is_in_shopping_cart(self, obj):
@@ -236,22 +279,28 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         if request.user.is_anonymous:
             return False
 
+        is_in_shopping_cart = getattr(obj, "is_in_shopping_cart", None)
+        if is_in_shopping_cart is not None:
+            return is_in_shopping_cart
+
         return ShoppingCart.objects.filter(recipe=obj, user=request.user).exists()
 
 
 class RecipeShortSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения краткой информации о рецептах."""
 
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "image_variants", "cooking_time")
 
 
 class RecipePostSerializer(serializers.ModelSerializer):
     """Сериализатор для создания рецептов."""
 
     author = UserGetSerializer(read_only=True, default=serializers.CurrentUserDefault())
-    tags = serializers.PrimaryKeyRelatedField(many=True, queryset=Tag.objects.all())
+    tags = PreloadedPrimaryKeyRelatedField(many=True, queryset=Tag.objects.all())
     ingredients = IngredientInRecipeSerializer(
         source="IngredientsInRecipe",
         many=True,
@@ -271,6 +320,24 @@ class RecipePostSerializer(serializers.ModelSerializer):
             "cooking_time",
         )
 
+    def to_internal_value(self, data):
+        """
+        id тэгов и ингредиентов проверяются двумя запросами на весь
+        рецепт, а не запросом на каждый id.
+        """
+        if isinstance(data, Mapping):
+            tags = data.get("tags")
+            if isinstance(tags, list):
+                self.fields["tags"].child_relation.preload(tags)
+            ingredients = data.get("ingredients")
+            if isinstance(ingredients, list):
+                self.fields["ingredients"].child.fields["id"].preload(
+                    ingredient.get("id")
+                    for ingredient in ingredients
+                    if isinstance(ingredient, Mapping)
+                )
+        return super().to_internal_value(data)
+
     @staticmethod
     def save_ingredients(recipe, ingredients):
         ingredients_list = []
@@ -284,14 +351,24 @@ class RecipePostSerializer(serializers.ModelSerializer):
             )
         IngredientInRecipe.objects.bulk_create(ingredients_list)
 
+    def validate_image(self, image):
+        if image:
+            try:
+                open_image(image)
+            except ImageTooLarge as error:
+                raise serializers.ValidationError(str(error))
+            finally:
+                image.seek(0)
+        return image
+
     def validate(self, data):
         cooking_time = data.get("cooking_time")
-        if cooking_time <= 0:
+        if cooking_time is not None and cooking_time <= 0:
             raise serializers.ValidationError(
                 {"error": "Время приготовления не должно быть менее 1 мин."}
             )
         ingredients_list = []
-        ingredients_in_recipe = data.get("IngredientsInRecipe")
+        ingredients_in_recipe = data.get("IngredientsInRecipe", [])
         for ingredient in ingredients_in_recipe:
             if ingredient.get("amount") <= 0:
                 raise serializers.ValidationError(
@@ -304,6 +381,7 @@ class RecipePostSerializer(serializers.ModelSerializer):
             )
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get("request").user
         ingredients = validated_data.pop("IngredientsInRecipe")
@@ -314,6 +392,63 @@ class RecipePostSerializer(serializers.ModelSerializer):
 
         return recipe
 
+    @staticmethod
+    def update_tags(recipe, tags):
+        """Добавляет и удаляет только изменившиеся связи с тэгами."""
+        stored = set(recipe.tags.values_list("id", flat=True))
+        wanted = {tag.id for tag in tags}
+        if stored - wanted:
+            recipe.tags.remove(*(stored - wanted))
+        if wanted - stored:
+            recipe.tags.add(*(wanted - stored))
+
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        """
+        Сравнивает ингредиенты с сохранёнными и меняет только разницу:
+        удаляет лишние, добавляет новые и обновляет количество.
+        """
+        stored = {row.ingredient_id: row for row in recipe.IngredientsInRecipe.all()}
+        wanted = {
+            ingredient["ingredient"]["id"].id: ingredient["amount"]
+            for ingredient in ingredients
+        }
+        removed = stored.keys() - wanted.keys()
+        added = [
+            IngredientInRecipe(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in wanted.items()
+            if ingredient_id not in stored
+        ]
+        changed = []
+        for ingredient_id, amount in wanted.items():
+            row = stored.get(ingredient_id)
+            if row is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+
+        if removed:
+            # У IngredientInRecipe нет сигналов удаления, так что это
+            # один DELETE; как и для bulk_create/bulk_update, последствия
+            # ниже.
+            IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredient__in=removed
+            ).delete()
+        if added:
+            IngredientInRecipe.objects.bulk_create(added)
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ["amount"])
+        if removed or added or changed:
+            ShoppingCartIngredient.refresh_for_recipe(
+                recipe, [*removed, *(row.ingredient_id for row in (*added, *changed))]
+            )
+        if removed or added:
+            # Индекс подбора по продуктам обновляется после коммита;
+            # поисковый документ пересчитает сохранение рецепта в update.
+            pantry_index.schedule_refresh([recipe.id])
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         instance.name = validated_data.get("name", instance.name)
         instance.text = validated_data.get("text", instance.text)
@@ -321,86 +456,25 @@ class RecipePostSerializer(serializers.ModelSerializer):
         instance.cooking_time = validated_data.get(
             "cooking_time", instance.cooking_time
         )
-        ingredients = validated_data.pop("IngredientsInRecipe")
-        tags = validated_data.pop("tags")
-        instance.tags.clear()
-        instance.tags.add(*tags)
-        instance.ingredients.clear()
-        recipe = instance
-        self.save_ingredients(recipe, ingredients)
+        ingredients = validated_data.pop("IngredientsInRecipe", None)
+        tags = validated_data.pop("tags", None)
+        if tags is not None:
+            self.update_tags(instance, tags)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
         instance.save()
         return instance
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance],
+            "tags",
+            Prefetch(
+                "IngredientsInRecipe",
+                queryset=IngredientInRecipe.objects.select_related("ingredient"),
+            ),
+        )
         serializer = RecipeGetSerializer(
             instance, context={"request": self.context.get("request")}
         )
         return serializer.data
-
-
-class FavoriteSerializer(serializers.ModelSerializer):
-    """Сериализатор для избранных рецептов."""
-
-    user = serializers.PrimaryKeyRelatedField(
-        read_only=True, default=serializers.CurrentUserDefault()
-    )
-    recipe = serializers.PrimaryKeyRelatedField(
-        queryset=Recipe.objects.all(),
-        write_only=True,
-    )
-
-    class Meta:
-        model = Favorite
-        fields = (
-            "recipe",
-            "user",
-        )
-        validators = [
-            serializers.UniqueTogetherValidator(
-                queryset=Favorite.objects.all(),
-                fields=[
-                    "recipe",
-                    "user",
-                ],
-                message="Этот рецепт уже добавлен в избранное.",
-            )
-        ]
-
-    def create(self, validated_data):
-        return Favorite.objects.create(
-            user=self.context.get("request").user, **validated_data
-        )
-
-
-class ShoppingCartSerializer(serializers.ModelSerializer):
-    """Сериализатор для списка покупок."""
-
-    user = serializers.PrimaryKeyRelatedField(
-        read_only=True, default=serializers.CurrentUserDefault()
-    )
-    recipe = serializers.PrimaryKeyRelatedField(
-        queryset=Recipe.objects.all(),
-        write_only=True,
-    )
-
-    class Meta:
-        model = ShoppingCart
-        fields = (
-            "recipe",
-            "user",
-        )
-        validators = [
-            serializers.UniqueTogetherValidator(
-                queryset=ShoppingCart.objects.all(),
-                fields=[
-                    "recipe",
-                    "user",
-                ],
-                message="Этот рецепт уже добавлен в список покупок.",
-            )
-        ]
-
-    def create(self, validated_data):
-        return ShoppingCart.objects.create(
-            user=self.context.get("request").user, **validated_data
-        )
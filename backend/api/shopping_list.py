@@ -0,0 +1,157 @@
+import csv
+import tempfile
+
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework import renderers
+from rest_framework.negotiation import DefaultContentNegotiation
+
+SHOPPING_LIST_CHUNK_SIZE = 2000
+
+FILENAME = "shopping_list"
+TITLE = "Список покупок:"
+CSV_HEADER = ("Ингредиент", "Единица измерения", "Количество")
+
+PDF_FONT_NAME = "ShoppingListFont"
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_LINE_HEIGHT = 18
+PDF_SPOOL_SIZE = 1024 * 1024
+
+
+class ShoppingListRenderer(renderers.BaseRenderer):
+    """
+    Рендерер формата списка покупок. Сам список отдаётся потоком,
+    через рендерер выбирается формат (?format=) и выводятся ошибки.
+    """
+
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if isinstance(data, dict):
+            data = "\n".join(f"{key}: {value}" for key, value in data.items())
+        return str(data).encode(self.charset)
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = "text/plain"
+    format = "txt"
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    media_type = "application/pdf"
+    format = "pdf"
+
+
+SHOPPING_LIST_RENDERERS = (
+    TextShoppingListRenderer,
+    CSVShoppingListRenderer,
+    PDFShoppingListRenderer,
+)
+
+
+class ShoppingListContentNegotiation(DefaultContentNegotiation):
+    """Формат выбирается только параметром ?format=, Accept не учитывается."""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        format_query = format_suffix or request.query_params.get(
+            self.settings.URL_FORMAT_OVERRIDE
+        )
+        if format_query:
+            renderers = self.filter_renderers(renderers, format_query)
+        return renderers[0], renderers[0].media_type
+
+
+class Echo:
+    """Псевдофайл для csv.writer: возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def format_line(ingredient):
+    return (
+        f"{ingredient['ingredient__name']} "
+        f"({ingredient['ingredient__measurement_unit']}) - "
+        f"{ingredient['amount']}"
+    )
+
+
+def text_lines(ingredients):
+    yield TITLE
+    for ingredient in ingredients:
+        yield f"\n{format_line(ingredient)}"
+
+
+def csv_lines(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for ingredient in ingredients:
+        yield writer.writerow(
+            (
+                ingredient["ingredient__name"],
+                ingredient["ingredient__measurement_unit"],
+                ingredient["amount"],
+            )
+        )
+
+
+def pdf_file(ingredients):
+    """
+    Собирает PDF построчно во временный файл: небольшой список остаётся
+    в памяти, большой сбрасывается на диск.
+    """
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT))
+    output = tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_SIZE)
+    pdf = canvas.Canvas(output, pagesize=A4)
+    _, height = A4
+
+    def new_page():
+        pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+        return height - PDF_MARGIN
+
+    position = new_page()
+    for line in (TITLE, *map(format_line, ingredients)):
+        if position < PDF_MARGIN:
+            pdf.showPage()
+            position = new_page()
+        pdf.drawString(PDF_MARGIN, position, line)
+        position -= PDF_LINE_HEIGHT
+    pdf.save()
+    output.seek(0)
+    return output
+
+
+def shopping_list_response(ingredients, output_format):
+    """Ответ со списком покупок в формате txt, csv или pdf."""
+    if output_format == PDFShoppingListRenderer.format:
+        return FileResponse(
+            pdf_file(ingredients),
+            as_attachment=True,
+            filename=f"{FILENAME}.pdf",
+            content_type=PDFShoppingListRenderer.media_type,
+        )
+
+    if output_format == CSVShoppingListRenderer.format:
+        renderer, lines = CSVShoppingListRenderer, csv_lines(ingredients)
+    else:
+        renderer, lines = TextShoppingListRenderer, text_lines(ingredients)
+    response = StreamingHttpResponse(
+        lines, content_type=f"{renderer.media_type}; charset={renderer.charset}"
+    )
+    response[
+        "Content-Disposition"
+    ] = f'attachment; filename="{FILENAME}.{renderer.format}"'
+    return response
@@ -1,7 +1,13 @@
 from django.urls import include, path
 from rest_framework import routers
 
-from .views import CustomUserViewSet, IngredientViewSet, RecipeViewSet, TagViewSet
+from .views import (
+    CustomUserViewSet,
+    IngredientViewSet,
+    MetricsView,
+    RecipeViewSet,
+    TagViewSet,
+)
 
 app_name = "api"
 
@@ -16,4 +22,5 @@ router.register(r"recipes", RecipeViewSet, basename="recipes")
 urlpatterns = [
     path("", include(router.urls)),
     path("auth/", include("djoser.urls.authtoken")),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
 ]
@@ -1,29 +1,43 @@
 from django.contrib.auth import update_session_auth_hash
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import Exists, OuterRef, Prefetch, Subquery
+from django.http import Http404
+from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.serializers import SetPasswordSerializer
+from recipes.feed import FEED_KEY, feed_sources
 from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingCartIngredient, Tag)
+from recipes.relations import FAVORITES, FOLLOWS, SHOPPING_CART
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from users.models import Follow, User
-
-from .action import post_and_delete_action
-from .filters import IngredientFilter, RecipeFilter
-from .pagination import CustomPagination
-from .permissions import IsAuthorOrAdminOrReadOnly
-from .serializers import (FavoriteSerializer, IngredientSerializer,
-                          RecipeGetSerializer, RecipePostSerializer,
-                          RecipeShortSerializer, ShoppingCartSerializer,
-                          SubscriptionSerializer, TagSerializer,
-                          UserGetSerializer, UserPostSerializer,
+from rest_framework.views import APIView
+from users.models import User
+
+from .action import bulk_relation_action, relation_action
+from .conditional import ConditionalGetMixin
+from .filters import RecipeFilter
+from .idempotency import idempotent
+from .ingredient_index import ingredient_index
+from .metrics import PrometheusRenderer, registry
+from .pagination import CustomPagination, FeedPagination, KeysetOptInMixin
+from .pantry_index import MAX_MISSING, pantry_index
+from .permissions import IsAdmin, IsAuthorOrAdminOrReadOnly
+from .recipe_cache import cache_recipes, document_keys, get_cached_recipes
+from .serializers import (IngredientSerializer, RecipeGetSerializer,
+                          RecipePostSerializer, RecipeShortSerializer,
+                          TagSerializer, UserGetSerializer, UserPostSerializer,
                           UserWithRecipesSerializer)
+from .shopping_list import (SHOPPING_LIST_CHUNK_SIZE, SHOPPING_LIST_RENDERERS,
+                            ShoppingListContentNegotiation,
+                            shopping_list_response)
 
 
 class CustomUserViewSet(
+    KeysetOptInMixin,
+    ConditionalGetMixin,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
@@ -50,7 +64,10 @@ class CustomUserViewSet(
     GET запрос: Возвращает пользователей, на которых
     подписан текущий пользователь.
     Только авторизованным. В выдачу подключены рецепты с возможностью
-    установить лимит на их колличество.
+    установить лимит на их колличество. С параметром cursor включается
+    курсорная пагинация. Параметр ordering=recipes_count (или
+    -recipes_count) сортирует авторов по числу рецептов, cursor с ним
+    игнорируется.
 
     /api/users/{id}/subscribe/
     POST запрос: подписаться на пользователя. Только авторизованным.
@@ -59,6 +76,20 @@ class CustomUserViewSet(
 
     queryset = User.objects.all()
     pagination_class = CustomPagination
+    keyset_actions = ("subscriptions",)
+    keyset_ordering = ("id",)
+    keyset_excluded_params = ("ordering",)
+    subscription_orderings = {
+        "recipes_count": ("recipes_count", "id"),
+        "-recipes_count": ("-recipes_count", "-id"),
+    }
+    version_tables = ("users",)
+    user_version_tables = ("follows",)
+
+    def get_version_tables(self):
+        if self.action == "subscriptions":
+            return self.version_tables + ("recipes",)
+        return self.version_tables
 
     def get_instance(self):
         return self.request.user
@@ -106,9 +137,26 @@ class CustomUserViewSet(
 
     @action(detail=False, permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
+        recipes = Recipe.objects.all()
+        recipe_limit = request.query_params.get("recipe_limit")
+        if recipe_limit and recipe_limit.isdigit():
+            recipes = recipes.filter(
+                pk__in=Subquery(
+                    Recipe.objects.filter(author=OuterRef("author")).values("pk")[
+                        : int(recipe_limit)
+                    ]
+                )
+            )
         users = (
             User.objects.filter(following__user=request.user)
-            .prefetch_related("recipes")
+            .prefetch_related(
+                Prefetch("recipes", queryset=recipes, to_attr="limited_recipes")
+            )
+            .order_by(
+                *self.subscription_orderings.get(
+                    request.query_params.get("ordering"), self.keyset_ordering
+                )
+            )
         )
         page = self.paginate_queryset(users)
 
@@ -130,16 +178,29 @@ class CustomUserViewSet(
         detail=True,
         permission_classes=[IsAuthorOrAdminOrReadOnly],
     )
+    @idempotent
     def subscribe(self, request, **kwargs):
-        return post_and_delete_action(
-            self, request, User, Follow, SubscriptionSerializer, **kwargs
+        author = get_object_or_404(User, id=kwargs["pk"])
+        if author == request.user:
+            return Response(
+                {"errors": "Подписка на самого себя не возможна!"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return relation_action(
+            self,
+            request,
+            FOLLOWS,
+            author,
+            "Вы уже подписаны на этого пользователя",
+            "Вы не подписаны на этого пользователя",
         )
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """Эндпоинт  api/ingredients/.
     GET запрос: Получение списка всех ингредиентов с
-    возможностью поиска по name.
+    возможностью поиска по name. Отдаётся из индекса в памяти процесса,
+    который перестраивается при смене версии справочника.
     Эндпоинт  api/ingredients/id.
     GET запрос: получение ингредиента по id
     Права доступа: Доступно без токена.
@@ -147,12 +208,26 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
     pagination_class = None
+    version_tables = ("ingredients",)
+
+    def list(self, request, *args, **kwargs):
+        index = ingredient_index.get(self.versions["ingredients"])
+        name = request.query_params.get("name")
+        ingredients = index.search(name) if name else index.ingredients
+        return Response(self.get_serializer(ingredients, many=True).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        index = ingredient_index.get(self.versions["ingredients"])
+        ingredient = index.by_id.get(
+            int(kwargs["pk"]) if kwargs["pk"].isdigit() else None
+        )
+        if ingredient is None:
+            raise Http404
+        return Response(self.get_serializer(ingredient).data)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """Эндпоинт  api/tags/.
     GET запрос: Получение списка всех тэгов
     Эндпоинт  api/tags/id.
@@ -163,26 +238,54 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    version_tables = ("tags",)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(KeysetOptInMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     """Эндпоинт  api/recipes/.
     GET запрос: Получение списка всех рецептов.
     Страница доступна всем пользователям. Пагинация.
     Доступна фильтрация по избранному, автору, списку покупок и тегам.
+    Параметр search - полнотекстовый поиск по названию, описанию и
+    ингредиентам, результаты упорядочены по релевантности.
+    Параметр ordering - сортировка по pub_date или favorites_count
+    (с минусом - по убыванию).
 
     POST запрос: Создать рецепт. Доступно только авторизованному пользователю.
 
+    С параметром cursor (пустым для первой страницы) включается курсорная
+    пагинация по (pub_date, id) без подсчёта общего количества.
+    Вместе с search или ordering cursor игнорируется: выдача остаётся
+    постраничной, чтобы не потерять заданный порядок.
+
     Эндпоинт  api/recipes/id.
     GET запрос: получение рецепта по id. Доступно только авторизованным.
     PATCH и DELETE запрос доступно только автору рецепта.
 
-    Эндпоинт  api/recipes/favorite.
-    POST и DEL запрос: создание и удаление подписки.
-    Доступно только авторизованному.
+    Эндпоинт  api/recipes/id/favorite (и shopping_cart).
+    POST и DEL запрос: добавление рецепта в избранное (список покупок)
+    и удаление из него. Доступно только авторизованному.
+
+    Эндпоинт  api/recipes/favorite (и shopping_cart).
+    POST и DEL запрос: то же для списка рецептов {"recipes": [id, ...]},
+    в ответе статус по каждому id. Доступно только авторизованному.
+
+    Изменяющие запросы принимают заголовок Idempotency-Key.
 
     Эндпоинт api/recipes/download_shopping_cart
     GET запрос: скачать список покупок.
+    Формат задаётся параметром ?format=txt|csv|pdf, по умолчанию txt.
+
+    Эндпоинт api/recipes/cook
+    GET запрос: рецепты, которые можно приготовить из ингредиентов
+    ?ingredients=1,2,3, если недостающих не больше ?max_missing
+    (по умолчанию 2). Сначала рецепты с наибольшей долей имеющихся
+    ингредиентов. Доступно всем, пагинация.
+
+    Эндпоинт api/recipes/feed
+    GET запрос: новые рецепты авторов, на которых подписан пользователь,
+    от новых к старым. Курсорная пагинация параметром cursor.
+    Только авторизованным.
     """
 
     queryset = Recipe.objects.all()
@@ -192,6 +295,93 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     pagination_class = CustomPagination
+    keyset_actions = ("list",)
+    keyset_excluded_params = ("search", "ordering")
+    version_tables = ("recipes", "tags", "ingredients", "users")
+    user_version_tables = ("favorites", "shopping_cart", "follows")
+    # Подбор идёт по индексу в памяти процесса, который другие процессы
+    # догоняют с задержкой: ETag по версиям базы ему не соответствует.
+    unvalidated_actions = ("cook",)
+
+    def get_version_tables(self):
+        if self.action == "feed":
+            return self.version_tables + (FEED_KEY,)
+        return self.version_tables
+
+    def get_queryset(self):
+        """
+        Автор подтягивается JOIN'ом, теги и ингредиенты - prefetch'ем,
+        а флаги текущего пользователя считаются подзапросами EXISTS
+        (подписки на авторов сериализатор догружает одним запросом),
+        чтобы число запросов не зависело от размера страницы.
+        """
+        queryset = (
+            Recipe.objects.select_related("author")
+            .defer("search_vector")
+            .prefetch_related(
+                "tags",
+                Prefetch(
+                    "IngredientsInRecipe",
+                    queryset=IngredientInRecipe.objects.select_related("ingredient"),
+                ),
+            )
+        )
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset
+
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+        )
+
+    def list(self, request, *args, **kwargs):
+        """
+        Страница рецептов: id берутся из базы, документы рецептов - из
+        кэша, сериализуются только отсутствующие в кэше рецепты.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.prefetch_related(None).values_list(
+            "id", "pub_date", named=True
+        )
+        page = self.paginate_queryset(rows)
+        recipe_ids = [row.id for row in (rows if page is None else page)]
+
+        documents = self.get_documents(queryset, recipe_ids)
+        data = [documents[recipe_id] for recipe_id in recipe_ids]
+
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+    def get_documents(self, queryset, recipe_ids):
+        keys = document_keys(recipe_ids, self.request)
+        documents = get_cached_recipes(keys, self.request)
+        missing = [recipe_id for recipe_id in recipe_ids if recipe_id not in documents]
+        if missing:
+            serialized = self.get_serializer(
+                queryset.filter(id__in=missing), many=True
+            ).data
+            cache_recipes(serialized, keys)
+            documents.update((document["id"], document) for document in serialized)
+        return documents
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs["pk"]
+        if not pk.isdigit():
+            return super().retrieve(request, *args, **kwargs)
+        keys = document_keys([int(pk)], request)
+        documents = get_cached_recipes(keys, request)
+        if int(pk) in documents:
+            return Response(documents[int(pk)])
+
+        response = super().retrieve(request, *args, **kwargs)
+        cache_recipes([response.data], keys)
+        return response
 
     def get_serializer_class(self):
         if self.request.method == "GET":
@@ -205,40 +395,143 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return RecipePostSerializer
 
     @action(["POST", "DELETE"], detail=True)
+    @idempotent
     def favorite(self, request, **kwargs):
-        return post_and_delete_action(
-            self, request, Recipe, Favorite, FavoriteSerializer, **kwargs
+        return relation_action(
+            self,
+            request,
+            FAVORITES,
+            get_object_or_404(Recipe, id=kwargs["pk"]),
+            "Этот рецепт уже добавлен в избранное.",
+            "В избранном нет этого рецепта.",
         )
 
     @action(["POST", "DELETE"], detail=True)
+    @idempotent
     def shopping_cart(self, request, **kwargs):
-        return post_and_delete_action(
-            self, request, Recipe, ShoppingCart,
-            ShoppingCartSerializer, **kwargs
+        return relation_action(
+            self,
+            request,
+            SHOPPING_CART,
+            get_object_or_404(Recipe, id=kwargs["pk"]),
+            "Этот рецепт уже добавлен в список покупок.",
+            "В списке покупок нет этого рецепта.",
         )
 
+    @action(
+        ["POST", "DELETE"],
+        detail=False,
+        url_path="favorite",
+        url_name="favorite-bulk",
+        permission_classes=[IsAuthenticated],
+    )
+    @idempotent
+    def favorite_bulk(self, request):
+        return bulk_relation_action(request, FAVORITES, Recipe, "recipes")
+
+    @action(
+        ["POST", "DELETE"],
+        detail=False,
+        url_path="shopping_cart",
+        url_name="shopping-cart-bulk",
+        permission_classes=[IsAuthenticated],
+    )
+    @idempotent
+    def shopping_cart_bulk(self, request):
+        return bulk_relation_action(request, SHOPPING_CART, Recipe, "recipes")
+
     @staticmethod
-    def send_message(ingredients):
-        shopping_list = "Список покупок:"
-        for ingredient in ingredients:
-            shopping_list += (
-                f"\n{ingredient['ingredient__name']} "
-                f"({ingredient['ingredient__measurement_unit']}) - "
-                f"{ingredient['amount']}"
-            )
-        filename = "shopping_list.txt"
-        response = HttpResponse(shopping_list, content_type="text/plain")
-        response["Content-Disposition"] = f'attachment; filename="{filename}"'
-        return response
+    def get_int_params(request, name):
+        values = [
+            value.strip()
+            for param in request.query_params.getlist(name)
+            for value in param.split(",")
+            if value.strip()
+        ]
+        if not all(value.isdigit() for value in values):
+            raise ValidationError({name: "Ожидаются целые неотрицательные числа."})
+        return [int(value) for value in values]
+
+    @action(["GET"], detail=False)
+    def cook(self, request):
+        """
+        Подбор рецептов по индексу "ингредиент -> рецепты" в памяти:
+        база нужна только для документов рецептов текущей страницы.
+        К документу добавляются доля имеющихся ингредиентов coverage
+        и id недостающих ингредиентов missing_ingredients.
+        """
+        ingredient_ids = self.get_int_params(request, "ingredients")
+        if not ingredient_ids:
+            raise ValidationError({"ingredients": "Укажите хотя бы один ингредиент."})
+        max_missing = self.get_int_params(request, "max_missing")
+        max_missing = max_missing[0] if max_missing else MAX_MISSING
+
+        index = pantry_index.get(self.versions["recipes"])
+        matches = index.match(ingredient_ids, max_missing)
+        page = self.paginate_queryset(matches)
+        if page is not None:
+            matches = page
+        documents = self.get_documents(
+            self.get_queryset(), [recipe_id for recipe_id, _, _ in matches]
+        )
+        data = []
+        for recipe_id, coverage, missing in matches:
+            # Рецепт мог быть удалён другим процессом после сборки индекса.
+            if recipe_id in documents:
+                data.append(
+                    {
+                        **documents[recipe_id],
+                        "coverage": round(coverage, 3),
+                        "missing_ingredients": missing,
+                    }
+                )
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+    @action(["GET"], detail=False, permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """
+        Лента читается по индексу (user, pub_date, recipe) таблицы
+        FeedEntry, документы рецептов страницы - из кэша.
+        """
+        paginator = FeedPagination()
+        page = paginator.paginate_queryset(feed_sources(request.user), request, self)
+        recipe_ids = [item.id for item in page]
+        documents = self.get_documents(self.get_queryset(), recipe_ids)
+        return paginator.get_paginated_response(
+            [documents[recipe_id] for recipe_id in recipe_ids if recipe_id in documents]
+        )
 
-    @action(detail=False, methods=["GET"])
+    @action(
+        detail=False,
+        methods=["GET"],
+        permission_classes=[IsAuthenticated],
+        renderer_classes=SHOPPING_LIST_RENDERERS,
+        content_negotiation_class=ShoppingListContentNegotiation,
+    )
     def download_shopping_cart(self, request):
         ingredients = (
-            IngredientInRecipe.objects.filter(
-                recipe__shopping_list__user=request.user
-            )
+            ShoppingCartIngredient.objects.filter(user=request.user)
             .order_by("ingredient__name")
-            .values("ingredient__name", "ingredient__measurement_unit")
-            .annotate(amount=Sum("amount"))
+            .values("ingredient__name", "ingredient__measurement_unit", "amount")
+        )
+        return shopping_list_response(
+            ingredients.iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE),
+            request.accepted_renderer.format,
         )
-        return self.send_message(ingredients)
+
+
+class MetricsView(APIView):
+    """
+    /api/metrics/
+    GET запрос: гистограммы времени ответа, времени в базе и
+    сериализаторах, числа SQL-запросов и размера ответа по действиям
+    вьюсетов в текстовом формате Prometheus. Только админам.
+    """
+
+    permission_classes = [IsAdmin]
+    renderer_classes = [PrometheusRenderer]
+
+    def get(self, request):
+        return Response(registry.render())
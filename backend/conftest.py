@@ -0,0 +1,102 @@
+import pytest
+from api.ingredient_index import ingredient_index
+from api.pantry_index import pantry_index
+from django.core.cache import cache
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from rest_framework.test import APIClient
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(settings, tmp_path):
+    """Картинки - во временный каталог, кэш и индексы процесса - пустые."""
+    settings.MEDIA_ROOT = tmp_path / "media"
+    # Фоновый поток не видит данных незавершённой транзакции теста.
+    settings.PANTRY_INDEX_BACKGROUND_REBUILD = False
+    cache.clear()
+    ingredient_index.reset()
+    pantry_index.reset()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def make_user(django_user_model):
+    def make_user(username):
+        return django_user_model.objects.create_user(
+            username=username,
+            email=f"{username}@example.com",
+            first_name=username,
+            last_name=username,
+            password="test-password",
+        )
+
+    return make_user
+
+
+@pytest.fixture
+def user(make_user):
+    return make_user("user")
+
+
+@pytest.fixture
+def author(make_user):
+    return make_user("author")
+
+
+@pytest.fixture
+def user_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def author_client(author):
+    client = APIClient()
+    client.force_authenticate(author)
+    return client
+
+
+@pytest.fixture
+def tags():
+    return [
+        Tag.objects.create(
+            name=f"Тэг {number}", slug=f"tag{number}", color=f"#E26C2{number}"
+        )
+        for number in range(2)
+    ]
+
+
+@pytest.fixture
+def ingredients():
+    return [
+        Ingredient.objects.create(name=f"ингредиент {number}", measurement_unit="г")
+        for number in range(10)
+    ]
+
+
+@pytest.fixture
+def make_recipe(author, tags, ingredients):
+    """Рецепт автора author с тэгами и ингредиентами {ингредиент: количество}."""
+
+    def make_recipe(name, amounts=None, author=author):
+        recipe = Recipe.objects.create(
+            author=author,
+            name=name,
+            image="recipes/images/recipe.png",
+            text=f"Описание {name}",
+            cooking_time=10,
+        )
+        recipe.tags.set(tags)
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=amount)
+            for ingredient, amount in (amounts or {ingredients[0]: 100}).items()
+        )
+        return recipe
+
+    return make_recipe
@@ -19,6 +19,7 @@ INSTALLED_APPS = [
     "api.apps.ApiConfig",
     "recipes.apps.RecipesConfig",
     "users.apps.UsersConfig",
+    "tasks.apps.TasksConfig",
     "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
@@ -32,6 +33,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.RequestMetricsMiddleware",
+    "api.middleware.NPlusOneMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -104,6 +107,18 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    "SHOPPING_LIST_PDF_FONT",
+    default="/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+)
+
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", default=40_000_000))
+TASK_WORKERS = int(os.getenv("TASK_WORKERS", default=2))
+FEED_FAN_OUT_LIMIT = int(os.getenv("FEED_FAN_OUT_LIMIT", default=10_000))
+# Поиск N+1: "" - выключен, "log" - в лог, "strict" - запрос падает.
+N_PLUS_ONE_DETECTOR = os.getenv("N_PLUS_ONE_DETECTOR", default="")
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", default=5))
+
 
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
@@ -1,6 +1,27 @@
 from django.contrib import admin
 
-from .models import Favorite, Ingredient, IngredientInRecipe, Recipe, ShoppingCart, Tag
+from .models import (
+    Favorite,
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingCartIngredient,
+    Tag,
+)
+from .search import search_recipes
+from .signals import ingredients_changed
+
+
+def send_ingredients_changed(rows):
+    """Последствия удаления строк состава: своих сигналов у них нет."""
+    rows = list(rows)
+    if rows:
+        ingredients_changed.send(
+            sender=IngredientInRecipe,
+            recipe_ids={row.recipe_id for row in rows},
+            ingredient_ids={row.ingredient_id for row in rows},
+        )
 
 
 class RecipeIngredientInline(admin.TabularInline):
@@ -18,6 +39,8 @@ class RecipeAdmin(admin.ModelAdmin):
         "name",
         "author",
         "pub_date",
+        "favorites_count",
+        "in_carts_count",
     )
     list_filter = (
         "name",
@@ -25,6 +48,16 @@ class RecipeAdmin(admin.ModelAdmin):
     )
     search_fields = ("name",)
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search_recipes(queryset, search_term), False
+
+    def save_formset(self, request, form, formset, change):
+        super().save_formset(request, form, formset, change)
+        if formset.model is IngredientInRecipe:
+            send_ingredients_changed(formset.deleted_objects)
+
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -51,6 +84,15 @@ class IngredientInRecipeAdmin(admin.ModelAdmin):
 
     list_display = ("recipe", "ingredient", "amount")
 
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        send_ingredients_changed([obj])
+
+    def delete_queryset(self, request, queryset):
+        rows = list(queryset)
+        super().delete_queryset(request, queryset)
+        send_ingredients_changed(rows)
+
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
@@ -66,3 +108,10 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     """Настройки отображения списка покупок."""
 
     list_display = ("user", "recipe")
+
+
+@admin.register(ShoppingCartIngredient)
+class ShoppingCartIngredientAdmin(admin.ModelAdmin):
+    """Настройки отображения сумм ингредиентов в списках покупок."""
+
+    list_display = ("user", "ingredient", "amount")
@@ -0,0 +1,160 @@
+import json
+import os
+import time
+from csv import DictReader
+from itertools import islice
+
+from django.db import transaction
+
+from .models import Ingredient, Tag
+from .signals import catalog_changed
+
+CATALOG_BATCH_SIZE = 1000
+JSON_READ_SIZE = 64 * 1024
+
+
+class Catalog:
+    """
+    Описание справочника: модель, поля естественного ключа (по ним
+    строка файла сопоставляется с записью в базе), обновляемые поля и
+    другие названия столбцов в файлах.
+    """
+
+    def __init__(self, model, key, fields, aliases=None, path=None):
+        self.model = model
+        self.key = key
+        self.fields = fields
+        self.aliases = aliases or {}
+        self.path = path
+
+    def clean(self, row):
+        for alias, field in self.aliases.items():
+            if alias in row:
+                row[field] = row.pop(alias)
+        return {field: row[field].strip() for field in (*self.key, *self.fields)}
+
+    def key_of(self, values):
+        return tuple(values[field] for field in self.key)
+
+
+CATALOGS = {
+    "ingredients": Catalog(
+        Ingredient,
+        key=("name", "measurement_unit"),
+        fields=(),
+        aliases={"unit of measure": "measurement_unit"},
+        path="./data/ingredients.csv",
+    ),
+    "tags": Catalog(
+        Tag,
+        key=("slug",),
+        fields=("name", "color"),
+        path="./data/tags.csv",
+    ),
+}
+
+
+def iter_json(file):
+    """
+    Потоково читает JSON-массив объектов или JSON Lines, не загружая
+    файл в память целиком.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position = "", 0
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+            position += 1
+        try:
+            value, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(JSON_READ_SIZE)
+            if not chunk:
+                if buffer[position:].strip():
+                    raise
+                return
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        yield value
+
+
+def read_rows(path):
+    file = open(path, encoding="utf-8")
+    if os.path.splitext(path)[1] in (".json", ".jsonl"):
+        return file, iter_json(file)
+    return file, DictReader(file)
+
+
+class CatalogLoader:
+    """
+    Идемпотентная загрузка справочника пачками: новые строки
+    вставляются, изменившиеся обновляются, совпадающие пропускаются.
+    Повторный запуск с тем же файлом ничего не меняет.
+    """
+
+    def __init__(self, catalog, batch_size=CATALOG_BATCH_SIZE):
+        self.catalog = catalog
+        self.batch_size = batch_size
+        self.inserted = self.updated = self.skipped = 0
+        self.elapsed = 0
+
+    def load(self, path=None):
+        started = time.monotonic()
+        file, rows = read_rows(path or self.catalog.path)
+        with file:
+            rows = map(self.catalog.clean, rows)
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+                self.load_batch(batch)
+        if self.inserted or self.updated:
+            catalog_changed.send(sender=self.catalog.model)
+        self.elapsed = time.monotonic() - started
+        return self
+
+    def existing(self, keys):
+        """Записи базы с ключами из пачки, по ключу."""
+        first = self.catalog.key[0]
+        queryset = self.catalog.model.objects.filter(
+            **{f"{first}__in": {key[0] for key in keys}}
+        )
+        return {
+            self.catalog.key_of(vars(obj)): obj
+            for obj in queryset
+            if self.catalog.key_of(vars(obj)) in keys
+        }
+
+    def load_batch(self, rows):
+        # Повтор ключа внутри файла: побеждает последняя строка.
+        unique = {self.catalog.key_of(row): row for row in rows}
+        self.skipped += len(rows) - len(unique)
+        rows = unique
+        stored = self.existing(rows.keys())
+        new, changed = [], []
+        for key, row in rows.items():
+            obj = stored.get(key)
+            if obj is None:
+                new.append(self.catalog.model(**row))
+            elif any(
+                getattr(obj, field) != row[field] for field in self.catalog.fields
+            ):
+                for field in self.catalog.fields:
+                    setattr(obj, field, row[field])
+                changed.append(obj)
+            else:
+                self.skipped += 1
+        inserted = 0
+        with transaction.atomic():
+            if new:
+                # ignore_conflicts: строку мог успеть вставить параллельный
+                # запуск или она конфликтует по другому уникальному полю.
+                # Такие строки не вставлены, вставленные считаются по базе.
+                keys = rows.keys() - stored.keys()
+                before = len(self.existing(keys))
+                self.catalog.model.objects.bulk_create(new, ignore_conflicts=True)
+                inserted = len(self.existing(keys)) - before
+            if changed:
+                self.catalog.model.objects.bulk_update(changed, self.catalog.fields)
+        self.inserted += inserted
+        self.skipped += len(new) - inserted
+        self.updated += len(changed)
@@ -0,0 +1,82 @@
+from functools import reduce
+
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from users.models import Follow, User
+
+from .models import Favorite, Recipe, ShoppingCart
+
+COUNTERS = {
+    Recipe: {
+        "favorites_count": (Favorite, "recipe"),
+        "in_carts_count": (ShoppingCart, "recipe"),
+    },
+    User: {
+        "recipes_count": (Recipe, "author"),
+        "followers_count": (Follow, "author"),
+    },
+}
+
+COUNTED = {
+    counted_model: (model, field, foreign_key)
+    for model, counters in COUNTERS.items()
+    for field, (counted_model, foreign_key) in counters.items()
+}
+
+
+def shift_counter(counted_model, instance, delta):
+    """Атомарно изменяет счётчик, связанный с созданной/удалённой записью."""
+    _, _, foreign_key = COUNTED[counted_model]
+    shift_counters(counted_model, [getattr(instance, f"{foreign_key}_id")], delta)
+
+
+def shift_counters(counted_model, pks, delta):
+    """
+    Изменяет одним UPDATE счётчики объектов pks, на каждый из которых
+    ссылается одна созданная/удалённая запись counted_model.
+    """
+    model, field, _ = COUNTED[counted_model]
+    model.objects.filter(pk__in=pks).update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def actual_count(counted_model, foreign_key):
+    return Coalesce(
+        Subquery(
+            counted_model.objects.filter(**{foreign_key: OuterRef("pk")})
+            .order_by()
+            .values(foreign_key)
+            .annotate(total=Count("pk"))
+            .values("total")
+        ),
+        0,
+    )
+
+
+def reconcile_counters(model, pks=None):
+    """
+    Пересчитывает счётчики модели по исходным таблицам. Обновляются
+    только расходящиеся строки; возвращает их количество.
+    Используется после массовых операций без сигналов.
+    """
+    actual = {
+        f"actual_{field}": actual_count(*counted)
+        for field, counted in COUNTERS[model].items()
+    }
+    queryset = model.objects.all()
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+    differs = reduce(
+        Q.__or__,
+        (~Q(**{field: F(f"actual_{field}")}) for field in COUNTERS[model]),
+    )
+    mismatched = list(
+        queryset.annotate(**actual).filter(differs).values_list("pk", flat=True)
+    )
+    if mismatched:
+        model.objects.filter(pk__in=mismatched).update(
+            **{
+                field: actual_count(*counted)
+                for field, counted in COUNTERS[model].items()
+            }
+        )
+    return len(mismatched)
@@ -0,0 +1,636 @@
+import csv
+import heapq
+import io
+import random
+from bisect import bisect_left
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from users.models import Follow, User
+
+from .counters import reconcile_counters
+from .feed import FEED_KEY
+from .models import (
+    ChangeMarker,
+    Favorite,
+    FeedEntry,
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingCartIngredient,
+    Tag,
+)
+from .search import update_search
+
+DATASET_PASSWORD = "dataset-password"
+DATASET_BATCH_SIZE = 1000
+LOAD_BATCH_SIZE = 50_000
+PREPARED_FIELDS = {"BooleanField", "DateTimeField", "JSONField"}
+MEASUREMENT_UNITS = ("г", "кг", "мл", "л", "шт.", "ст. л.", "ч. л.", "по вкусу")
+TAGS = (
+    ("Завтрак", "breakfast", "#E26C2D"),
+    ("Обед", "lunch", "#49B64E"),
+    ("Ужин", "dinner", "#8775D2"),
+)
+WORDS = (
+    "суп",
+    "салат",
+    "пирог",
+    "каша",
+    "курица",
+    "говядина",
+    "рыба",
+    "картофель",
+    "грибы",
+    "сыр",
+    "томаты",
+    "тыква",
+)
+
+
+class DatasetGenerator:
+    """
+    Детерминированный набор данных для замеров: при одинаковых seed и
+    размерах получаются одни и те же пользователи, рецепты и связи.
+    Строки вставляются bulk_create в обход save() и сигналов, один
+    хэш пароля на всех пользователей; производные данные (счётчики,
+    суммы списков покупок, поисковый индекс, ленты) пересчитываются
+    в конце.
+    """
+
+    def __init__(
+        self,
+        seed=0,
+        users=50,
+        recipes=500,
+        ingredients=300,
+        ingredients_per_recipe=6,
+        favorites_per_user=20,
+        carts_per_user=5,
+        follows_per_user=5,
+        batch_size=DATASET_BATCH_SIZE,
+    ):
+        self.random = random.Random(seed)
+        self.sizes = {
+            "users": users,
+            "recipes": recipes,
+            "ingredients": ingredients,
+            "ingredients_per_recipe": ingredients_per_recipe,
+            "favorites_per_user": favorites_per_user,
+            "carts_per_user": carts_per_user,
+            "follows_per_user": follows_per_user,
+        }
+        self.batch_size = batch_size
+
+    def bulk_create(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+
+    def create_ids(self, model, objects):
+        """Вставляет объекты и возвращает их id в порядке вставки."""
+        last = model.objects.aggregate(last=Max("id"))["last"] or 0
+        self.bulk_create(model, objects)
+        return list(
+            model.objects.filter(id__gt=last)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+    def sample(self, population, size):
+        return self.random.sample(population, min(size, len(population)))
+
+    def generate(self):
+        """Создаёт данные и возвращает id созданных объектов по моделям."""
+        with transaction.atomic():
+            tags = self.create_tags()
+            ingredients = self.create_ingredients()
+            users = self.create_users()
+            recipes = self.create_recipes(users, tags, ingredients)
+            self.create_links(users, recipes)
+        self.refresh_derived(users, recipes)
+        return {
+            "tags": tags,
+            "ingredients": ingredients,
+            "users": users,
+            "recipes": recipes,
+        }
+
+    def create_tags(self):
+        for name, slug, color in TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={"name": name, "color": color}
+            )
+        return list(
+            Tag.objects.filter(slug__in=[slug for _, slug, _ in TAGS])
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+    def create_ingredients(self):
+        return self.create_ids(
+            Ingredient,
+            [
+                Ingredient(
+                    name=f"ингредиент {number}",
+                    measurement_unit=MEASUREMENT_UNITS[number % len(MEASUREMENT_UNITS)],
+                )
+                for number in range(self.sizes["ingredients"])
+            ],
+        )
+
+    def create_users(self):
+        password = make_password(DATASET_PASSWORD)
+        return self.create_ids(
+            User,
+            [
+                User(
+                    username=f"user{number}",
+                    email=f"user{number}@example.com",
+                    first_name=f"Имя{number}",
+                    last_name=f"Фамилия{number}",
+                    password=password,
+                )
+                for number in range(self.sizes["users"])
+            ],
+        )
+
+    def create_recipes(self, users, tags, ingredients):
+        now = timezone.now()
+        recipes = [
+            Recipe(
+                author_id=self.random.choice(users),
+                name=f"{' '.join(self.sample(WORDS, 2))} {number}",
+                text=" ".join(self.random.choices(WORDS, k=30)),
+                cooking_time=self.random.randint(5, 180),
+                image="recipes/images/dataset.png",
+                pub_date=now - timedelta(minutes=number),
+            )
+            for number in range(self.sizes["recipes"])
+        ]
+        pub_dates = [recipe.pub_date for recipe in recipes]
+        recipe_ids = self.create_ids(Recipe, recipes)
+        # bulk_create подставляет текущее время в auto_now_add.
+        Recipe.objects.bulk_update(
+            [
+                Recipe(id=recipe_id, pub_date=pub_date)
+                for recipe_id, pub_date in zip(recipe_ids, pub_dates)
+            ],
+            ["pub_date"],
+            batch_size=self.batch_size,
+        )
+
+        self.bulk_create(
+            Recipe.tags.through,
+            [
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in recipe_ids
+                for tag_id in self.sample(tags, self.random.randint(1, 2))
+            ],
+        )
+        self.bulk_create(
+            IngredientInRecipe,
+            [
+                IngredientInRecipe(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 500),
+                )
+                for recipe_id in recipe_ids
+                for ingredient_id in self.sample(
+                    ingredients, self.sizes["ingredients_per_recipe"]
+                )
+            ],
+        )
+        return recipe_ids
+
+    def create_links(self, users, recipes):
+        for model, size in (
+            (Favorite, self.sizes["favorites_per_user"]),
+            (ShoppingCart, self.sizes["carts_per_user"]),
+        ):
+            self.bulk_create(
+                model,
+                [
+                    model(user_id=user_id, recipe_id=recipe_id)
+                    for user_id in users
+                    for recipe_id in self.sample(recipes, size)
+                ],
+            )
+        self.bulk_create(
+            Follow,
+            [
+                Follow(user_id=user_id, author_id=author_id)
+                for user_id in users
+                for author_id in self.sample(
+                    [author_id for author_id in users if author_id != user_id],
+                    self.sizes["follows_per_user"],
+                )
+            ],
+        )
+
+    @staticmethod
+    def refresh_derived(users, recipes):
+        reconcile_counters(Recipe, recipes)
+        reconcile_counters(User, users)
+        ShoppingCartIngredient.refresh(users)
+        update_search(recipes)
+        for user_id, author_id in Follow.objects.filter(user__in=users).values_list(
+            "user_id", "author_id"
+        ):
+            FeedEntry.backfill(user_id, author_id)
+
+
+class Popularity:
+    """
+    Выбор из набора id по степенному закону: вес элемента с рангом r
+    равен 1 / r ** exponent. Ранги раздаются перемешиванием, так что
+    популярность не связана с порядком id.
+    """
+
+    def __init__(self, ids, exponent, rng):
+        self.ids = list(ids)
+        rng.shuffle(self.ids)
+        self.weights = [1 / rank**exponent for rank in range(1, len(self.ids) + 1)]
+        self.cumulative = list(accumulate(self.weights))
+        self.rng = rng
+
+    def __len__(self):
+        return len(self.ids)
+
+    def choice(self):
+        point = self.rng.random() * self.cumulative[-1]
+        return self.ids[bisect_left(self.cumulative, point)]
+
+    def sample(self, size, exclude=None):
+        """size разных id (без exclude), популярные выпадают чаще."""
+        size = min(size, len(self.ids) - (exclude is not None))
+        if size * 4 > len(self.ids):
+            # Для больших выборок повторы при отборе слишком часты:
+            # взвешенная выборка без возвращения (Efraimidis-Spirakis).
+            keys = (
+                (self.rng.random() ** (1 / weight), item)
+                for item, weight in zip(self.ids, self.weights)
+                if item != exclude
+            )
+            return [item for _, item in heapq.nlargest(size, keys)]
+        chosen = set()
+        while len(chosen) < size:
+            item = self.choice()
+            if item != exclude:
+                chosen.add(item)
+        return list(chosen)
+
+    def allot(self, total, limit):
+        """
+        Делит total между элементами пропорционально весам, не больше
+        limit на элемент. Возвращает пары (id, количество).
+        """
+        scale = total / self.cumulative[-1]
+        for item, weight in zip(self.ids, self.weights):
+            count = min(limit, round(weight * scale))
+            if count:
+                yield item, count
+
+
+class LoadDataGenerator(DatasetGenerator):
+    """
+    Большой набор данных для нагрузочного тестирования. Активность
+    авторов, популярность рецептов и ингредиентов и активность
+    пользователей распределены по степенному закону. Строки не
+    собираются в памяти целиком: они генерируются потоком и пишутся
+    пачками через COPY на Postgres или executemany на других базах;
+    id назначаются заранее, после загрузки сдвигаются последовательности.
+    Результат зависит только от seed и размеров.
+    """
+
+    def __init__(
+        self,
+        seed=0,
+        users=100_000,
+        recipes=1_000_000,
+        ingredients=2_000,
+        ingredients_per_recipe=6,
+        favorites=2_000_000,
+        carts=300_000,
+        follows=500_000,
+        exponent=1.0,
+        batch_size=LOAD_BATCH_SIZE,
+        use_copy=None,
+        feeds=False,
+    ):
+        self.random = random.Random(seed)
+        self.sizes = {
+            "users": users,
+            "recipes": recipes,
+            "ingredients": ingredients,
+            "ingredients_per_recipe": ingredients_per_recipe,
+            "favorites": favorites,
+            "carts": carts,
+            "follows": follows,
+        }
+        self.exponent = exponent
+        self.batch_size = batch_size
+        if use_copy is None:
+            use_copy = connection.vendor == "postgresql"
+        self.use_copy = use_copy
+        self.feeds = feeds
+        self.now = timezone.now()
+
+    def steps(self):
+        """
+        Шаги загрузки: пары (название, функция). Шаги, вставляющие
+        строки, возвращают их число, служебные - None.
+        """
+        return [
+            ("тэги", self.load_tags),
+            ("ингредиенты", self.load_ingredients),
+            ("пользователи", self.load_users),
+            ("рецепты", self.load_recipes),
+            ("тэги рецептов", self.load_recipe_tags),
+            ("ингредиенты рецептов", self.load_recipe_ingredients),
+            ("избранное", lambda: self.load_links(Favorite, "favorites")),
+            ("списки покупок", lambda: self.load_links(ShoppingCart, "carts")),
+            ("подписки", self.load_follows),
+            ("последовательности id", self.reset_sequences),
+            ("производные данные", self.load_derived),
+            *([("ленты подписок", self.fill_feeds)] if self.feeds else []),
+        ]
+
+    def generate(self):
+        return {name: step() for name, step in self.steps()}
+
+    @staticmethod
+    def allocate(model, size):
+        first = (model.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+        return range(first, first + size)
+
+    def write(self, model, columns, rows):
+        """Пишет строки-кортежи пачками по batch_size, возвращает их число."""
+        rows = iter(rows)
+        total = 0
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return total
+            with transaction.atomic():
+                if self.use_copy:
+                    self.copy(model, columns, batch)
+                else:
+                    self.insert(model, columns, batch)
+            total += len(batch)
+
+    @staticmethod
+    def copy(model, columns, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer, quoting=csv.QUOTE_ALL).writerows(rows)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {model._meta.db_table} ({', '.join(columns)}) "
+                "FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+
+    @staticmethod
+    def insert(model, columns, rows):
+        # Подготовка через поле нужна только датам, флагам и JSON;
+        # числа и строки уходят в драйвер как есть.
+        prepare = [
+            (
+                field.get_db_prep_save
+                if field.get_internal_type() in PREPARED_FIELDS
+                else None
+            )
+            for field in map(model._meta.get_field, columns)
+        ]
+        if any(prepare):
+            rows = [
+                [
+                    value if convert is None else convert(value, connection)
+                    for convert, value in zip(prepare, row)
+                ]
+                for row in rows
+            ]
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {quote(model._meta.db_table)} "
+                f"({', '.join(quote(column) for column in columns)}) "
+                f"VALUES ({', '.join(['%s'] * len(columns))})",
+                rows,
+            )
+
+    def load_tags(self):
+        self.tags = self.create_tags()
+        return len(self.tags)
+
+    def load_ingredients(self):
+        ids = self.allocate(Ingredient, self.sizes["ingredients"])
+        # Часто встречающиеся ингредиенты (соль, лук) входят во многие рецепты.
+        self.ingredients = Popularity(ids, self.exponent, self.random)
+        return self.write(
+            Ingredient,
+            ("id", "name", "measurement_unit"),
+            (
+                (
+                    ingredient_id,
+                    f"ингредиент {ingredient_id}",
+                    MEASUREMENT_UNITS[ingredient_id % len(MEASUREMENT_UNITS)],
+                )
+                for ingredient_id in ids
+            ),
+        )
+
+    def load_users(self):
+        ids = self.allocate(User, self.sizes["users"])
+        # Одни и те же ранги: активные авторы пишут больше рецептов
+        # и чаще попадают в подписки.
+        self.authors = Popularity(ids, self.exponent, self.random)
+        self.users = Popularity(ids, self.exponent, self.random)
+        password = make_password(DATASET_PASSWORD)
+        return self.write(
+            User,
+            (
+                "id",
+                "password",
+                "is_superuser",
+                "username",
+                "first_name",
+                "last_name",
+                "email",
+                "is_staff",
+                "is_active",
+                "date_joined",
+                "role",
+                "recipes_count",
+                "followers_count",
+            ),
+            (
+                (
+                    user_id,
+                    password,
+                    False,
+                    f"load{user_id}",
+                    f"Имя{user_id}",
+                    f"Фамилия{user_id}",
+                    f"load{user_id}@example.com",
+                    False,
+                    True,
+                    self.now,
+                    User.USER,
+                    0,
+                    0,
+                )
+                for user_id in ids
+            ),
+        )
+
+    def load_recipes(self):
+        ids = self.allocate(Recipe, self.sizes["recipes"])
+        self.recipes = Popularity(ids, self.exponent, self.random)
+        return self.write(
+            Recipe,
+            (
+                "id",
+                "author_id",
+                "name",
+                "text",
+                "cooking_time",
+                "image",
+                "image_variants",
+                "pub_date",
+                "favorites_count",
+                "in_carts_count",
+            ),
+            (
+                (
+                    recipe_id,
+                    self.authors.choice(),
+                    f"{' '.join(self.sample(WORDS, 2))} {recipe_id}",
+                    " ".join(self.random.choices(WORDS, k=30)),
+                    self.random.randint(5, 180),
+                    "recipes/images/dataset.png",
+                    "{}" if self.use_copy else {},
+                    self.now - timedelta(seconds=ids[-1] - recipe_id),
+                    0,
+                    0,
+                )
+                for recipe_id in ids
+            ),
+        )
+
+    def load_recipe_tags(self):
+        return self.write(
+            Recipe.tags.through,
+            ("recipe_id", "tag_id"),
+            (
+                (recipe_id, tag_id)
+                for recipe_id in sorted(self.recipes.ids)
+                for tag_id in self.sample(self.tags, self.random.randint(1, 2))
+            ),
+        )
+
+    def load_recipe_ingredients(self):
+        mean = self.sizes["ingredients_per_recipe"]
+        return self.write(
+            IngredientInRecipe,
+            ("recipe_id", "ingredient_id", "amount"),
+            (
+                (recipe_id, ingredient_id, self.random.randint(1, 500))
+                for recipe_id in sorted(self.recipes.ids)
+                for ingredient_id in self.ingredients.sample(
+                    self.random.randint(max(1, mean // 2), mean * 3 // 2)
+                )
+            ),
+        )
+
+    def limit(self, population, total):
+        """Предел связей на пользователя: не больше половины набора."""
+        return max(1, min(len(population) // 2, total))
+
+    def load_links(self, model, size):
+        total = self.sizes[size]
+        return self.write(
+            model,
+            ("user_id", "recipe_id"),
+            (
+                (user_id, recipe_id)
+                for user_id, count in self.users.allot(
+                    total, self.limit(self.recipes, total)
+                )
+                for recipe_id in self.recipes.sample(count)
+            ),
+        )
+
+    def load_follows(self):
+        total = self.sizes["follows"]
+        return self.write(
+            Follow,
+            ("user_id", "author_id"),
+            (
+                (user_id, author_id)
+                for user_id, count in self.users.allot(
+                    total, self.limit(self.authors, total)
+                )
+                for author_id in self.authors.sample(count, exclude=user_id)
+            ),
+        )
+
+    @staticmethod
+    def reset_sequences():
+        models = [Ingredient, User, Recipe, Recipe.tags.through, IngredientInRecipe]
+        models += [Favorite, ShoppingCart, Follow]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+
+    def load_derived(self):
+        """
+        Счётчики, суммы списков покупок и поисковый индекс.
+        Счётчики и индекс пересчитываются целиком, без списков id:
+        на SQLite число параметров запроса ограничено.
+        """
+        reconcile_counters(User)
+        reconcile_counters(Recipe)
+        user_ids = sorted(self.users.ids)
+        for start in range(0, len(user_ids), DATASET_BATCH_SIZE):
+            ShoppingCartIngredient.refresh(user_ids[start : start + DATASET_BATCH_SIZE])
+        update_search()
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+        ChangeMarker.bump("recipes")
+
+    def fill_feeds(self):
+        """
+        Раскладывает рецепты по лентам одним INSERT ... SELECT на пачку
+        подписчиков вместо FeedEntry.backfill на каждую подписку.
+        При степенном распределении записей в лентах на порядки больше,
+        чем подписок: активные авторы собирают и больше подписчиков.
+        """
+        sql = f"""
+            INSERT INTO {FeedEntry._meta.db_table}
+                (user_id, recipe_id, author_id, pub_date)
+            SELECT follow.user_id, recipe.id, recipe.author_id, recipe.pub_date
+            FROM {Follow._meta.db_table} AS follow
+            JOIN {User._meta.db_table} AS author ON author.id = follow.author_id
+            JOIN {Recipe._meta.db_table} AS recipe
+                ON recipe.author_id = follow.author_id
+            WHERE follow.user_id BETWEEN %s AND %s
+                AND author.followers_count < %s
+            ON CONFLICT DO NOTHING
+        """
+        user_ids = sorted(self.users.ids)
+        total = 0
+        for start in range(0, len(user_ids), DATASET_BATCH_SIZE):
+            chunk = user_ids[start : start + DATASET_BATCH_SIZE]
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, [chunk[0], chunk[-1], FeedEntry.fan_out_limit()])
+                total += cursor.rowcount
+        ChangeMarker.bump(FEED_KEY)
+        return total
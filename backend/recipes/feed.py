@@ -0,0 +1,51 @@
+from django.db.models import Q
+from tasks.registry import task
+
+from .models import ChangeMarker, FeedEntry, Recipe
+
+# Ключ ChangeMarker: ленты меняются фоновыми задачами уже после
+# изменений рецептов и подписок, по которым считается ETag.
+FEED_KEY = "feed"
+
+
+@task()
+def fan_out_recipe(recipe_id):
+    FeedEntry.fan_out([recipe_id])
+    ChangeMarker.bump(FEED_KEY)
+
+
+@task()
+def fan_out_recipes(recipe_ids):
+    """Раскладывает по лентам рецепты, загруженные пачкой без сигналов."""
+    FeedEntry.fan_out(recipe_ids)
+    ChangeMarker.bump(FEED_KEY)
+
+
+@task()
+def backfill_follow(user_id, author_id):
+    FeedEntry.backfill(user_id, author_id)
+    ChangeMarker.bump(FEED_KEY)
+
+
+@task()
+def backfill_follows(user_id, author_ids):
+    for author_id in author_ids:
+        FeedEntry.backfill(user_id, author_id)
+    ChangeMarker.bump(FEED_KEY)
+
+
+def feed_sources(user):
+    """
+    Источники ленты пользователя - запросы, каждый из которых отдаёт
+    пары (pub_date, id рецепта) и может читаться по убыванию этих полей.
+    Обычно это одна лента FeedEntry; рецепты популярных авторов
+    дочитываются из рецептов по индексу (author, pub_date, id).
+    """
+    popular = list(FeedEntry.popular_authors(user))
+    entries = FeedEntry.objects.filter(user=user)
+    if not popular:
+        return [(entries, ("pub_date", "recipe_id"))]
+    return [
+        (entries.filter(~Q(author__in=popular)), ("pub_date", "recipe_id")),
+        (Recipe.objects.filter(author__in=popular), ("pub_date", "id")),
+    ]
@@ -0,0 +1,145 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+from tasks.registry import task
+
+from .models import Recipe
+
+IMAGE_MAX_PIXELS = 40_000_000
+VARIANTS_DIR = "recipes/images/variants"
+
+# Наибольшая сторона варианта в пикселях.
+VARIANT_SIZES = {
+    "card": 480,
+    "card_2x": 960,
+    "detail": 1200,
+    "detail_2x": 2400,
+}
+VARIANT_FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 85, "optimize": True, "progressive": True}),
+}
+
+
+def max_pixels():
+    return getattr(settings, "IMAGE_MAX_PIXELS", IMAGE_MAX_PIXELS)
+
+
+# Pillow сам отказывается декодировать картинки больше 2 * MAX_IMAGE_PIXELS.
+Image.MAX_IMAGE_PIXELS = max_pixels()
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def open_image(file):
+    """
+    Открывает картинку, читая только заголовок, и проверяет размер
+    до декодирования: память под пиксели не выделяется для картинок
+    больше IMAGE_MAX_PIXELS.
+    """
+    image = Image.open(file)
+    width, height = image.size
+    if width * height > max_pixels():
+        raise ImageTooLarge(
+            f"Картинка {width}x{height} больше {max_pixels()} пикселей."
+        )
+    return image
+
+
+def resize(image, size):
+    """
+    Уменьшает картинку до size по большей стороне. JPEG декодируется
+    сразу в уменьшенном масштабе (draft), без полного растра в памяти.
+    """
+    image.draft("RGB", (size, size))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    image.thumbnail((size, size), Image.LANCZOS)
+    return image
+
+
+def encode(image, image_format):
+    pil_format, options = VARIANT_FORMATS[image_format]
+    if pil_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    output = io.BytesIO()
+    image.save(output, pil_format, **options)
+    return ContentFile(output.getvalue())
+
+
+def variant_paths(variants):
+    return [
+        path
+        for name, formats in variants.items()
+        if name in VARIANT_SIZES
+        for path in formats.values()
+    ]
+
+
+@task()
+def delete_files(paths):
+    for path in paths:
+        default_storage.delete(path)
+
+
+def build_variants(recipe_id, source):
+    """Сохраняет все варианты картинки source и возвращает их пути."""
+    stem = os.path.splitext(os.path.basename(source))[0]
+    variants = {"source": source}
+    with default_storage.open(source) as file:
+        image = open_image(file)
+        # От крупного варианта к мелкому: каждый следующий уменьшается
+        # из предыдущего, а не из оригинала.
+        for name, size in sorted(
+            VARIANT_SIZES.items(), key=lambda item: item[1], reverse=True
+        ):
+            image = resize(image, size)
+            variants[name] = {
+                image_format: default_storage.save(
+                    f"{VARIANTS_DIR}/{recipe_id}/{stem}_{name}.{image_format}",
+                    encode(image, image_format),
+                )
+                for image_format in VARIANT_FORMATS
+            }
+    return variants
+
+
+@task()
+def generate_variants(recipe_id, source):
+    """
+    Строит варианты картинки рецепта. Сохраняет их, только если
+    картинка рецепта всё ещё source, иначе удаляет как устаревшие.
+    """
+    variants = build_variants(recipe_id, source)
+    with transaction.atomic():
+        recipe = (
+            Recipe.objects.select_for_update()
+            .filter(pk=recipe_id, image=source)
+            .first()
+        )
+        if recipe is None:
+            delete_files(variant_paths(variants))
+            return
+        previous = variant_paths(recipe.image_variants)
+        recipe.image_variants = variants
+        recipe.save(update_fields=["image_variants"])
+    delete_files(set(previous) - set(variant_paths(variants)))
+
+
+def schedule_variants(recipe):
+    """Ставит построение вариантов в очередь фоновых задач."""
+    generate_variants.delay(recipe_id=recipe.pk, source=recipe.image.name)
+
+
+def schedule_delete(variants):
+    paths = variant_paths(variants)
+    if paths:
+        delete_files.delay(paths=paths)
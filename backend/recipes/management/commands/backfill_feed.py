@@ -0,0 +1,36 @@
+import logging
+
+from django.core.management import BaseCommand
+from recipes.feed import FEED_KEY
+from recipes.models import ChangeMarker, FeedEntry
+from users.models import Follow
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger()
+
+
+class Command(BaseCommand):
+    help = "Заполнение лент подписок рецептами авторов, на которых подписаны"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            help="Заполнить ленту только этого пользователя (id).",
+        )
+
+    def handle(self, *args, **options):
+        logger.info("Заполнение лент подписок.")
+        follows = Follow.objects.order_by("id").values_list("user_id", "author_id")
+        if options["user"]:
+            follows = follows.filter(user_id=options["user"])
+        before = FeedEntry.objects.count()
+        total = 0
+        for user_id, author_id in follows.iterator():
+            FeedEntry.backfill(user_id, author_id)
+            total += 1
+        ChangeMarker.bump(FEED_KEY)
+        logger.info(
+            f"Обработано подписок: {total}, "
+            f"добавлено записей: {FeedEntry.objects.count() - before}"
+        )
@@ -0,0 +1,62 @@
+import json
+import logging
+import sys
+import time
+
+from django.core.management import BaseCommand, CommandError
+from recipes.transfer import TRANSFER_BATCH_SIZE, Checkpoint, export_batches
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger()
+
+
+class Command(BaseCommand):
+    help = "Выгрузка рецептов в JSON Lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "output", nargs="?", default="-", help="Файл, по умолчанию stdout."
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="Файл контрольной точки: с ним выгрузка продолжается "
+            "с места обрыва.",
+        )
+        parser.add_argument("--batch-size", type=int, default=TRANSFER_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        checkpoint = Checkpoint(options["checkpoint"])
+        state = checkpoint.load()
+        if options["output"] == "-":
+            if state:
+                raise CommandError("Продолжить можно только выгрузку в файл.")
+            output = sys.stdout.buffer
+        else:
+            output = open(options["output"], "r+b" if state else "wb")
+            # Строки, записанные после последней контрольной точки,
+            # выгружаются заново.
+            output.truncate(state.get("offset", 0))
+            output.seek(0, 2)
+
+        last_id, exported = state.get("last_id", 0), state.get("exported", 0)
+        logger.info(f"Выгрузка рецептов после id {last_id}.")
+        started = time.monotonic()
+        for batch in export_batches(last_id, options["batch_size"]):
+            output.write(
+                b"".join(
+                    json.dumps(recipe, ensure_ascii=False).encode() + b"\n"
+                    for recipe in batch
+                )
+            )
+            output.flush()
+            last_id, exported = batch[-1]["id"], exported + len(batch)
+            if output is not sys.stdout.buffer:
+                checkpoint.save(
+                    last_id=last_id, exported=exported, offset=output.tell()
+                )
+            rate = (exported - state.get("exported", 0)) / (time.monotonic() - started)
+            logger.info(f"Выгружено {exported} рецептов ({rate:.0f} в секунду)")
+        if output is not sys.stdout.buffer:
+            output.close()
+        checkpoint.clear()
+        logger.info(f"Успешно выгружено {exported} рецептов")
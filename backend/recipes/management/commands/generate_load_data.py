@@ -0,0 +1,86 @@
+import logging
+import time
+
+from django.core.management import BaseCommand
+from recipes.dataset import DATASET_PASSWORD, LOAD_BATCH_SIZE, LoadDataGenerator
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger()
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерация данных для нагрузочного тестирования: пользователи, "
+        "рецепты, избранное, списки покупок и подписки со степенным "
+        "распределением популярности"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--users", type=int, default=100_000)
+        parser.add_argument("--recipes", type=int, default=1_000_000)
+        parser.add_argument("--ingredients", type=int, default=2_000)
+        parser.add_argument(
+            "--ingredients-per-recipe",
+            type=int,
+            default=6,
+            help="Среднее число ингредиентов в рецепте.",
+        )
+        parser.add_argument("--favorites", type=int, default=2_000_000)
+        parser.add_argument("--carts", type=int, default=300_000)
+        parser.add_argument("--follows", type=int, default=500_000)
+        parser.add_argument(
+            "--exponent",
+            type=float,
+            default=1.0,
+            help="Показатель степенного закона: 0 - равномерно, "
+            "чем больше, тем сильнее перекос к популярным.",
+        )
+        parser.add_argument(
+            "--feeds",
+            action="store_true",
+            help="Заполнить ленты подписок. Записей в них может быть "
+            "на порядки больше, чем подписок; иначе ленты заполняет "
+            "команда backfill_feed.",
+        )
+        parser.add_argument("--batch-size", type=int, default=LOAD_BATCH_SIZE)
+        parser.add_argument(
+            "--no-copy",
+            action="store_true",
+            help="Не использовать COPY на Postgres, только INSERT.",
+        )
+
+    def handle(self, *args, **options):
+        generator = LoadDataGenerator(
+            seed=options["seed"],
+            users=options["users"],
+            recipes=options["recipes"],
+            ingredients=options["ingredients"],
+            ingredients_per_recipe=options["ingredients_per_recipe"],
+            favorites=options["favorites"],
+            carts=options["carts"],
+            follows=options["follows"],
+            exponent=options["exponent"],
+            batch_size=options["batch_size"],
+            use_copy=False if options["no_copy"] else None,
+            feeds=options["feeds"],
+        )
+        logger.info(
+            f"Генерация данных{' через COPY' if generator.use_copy else ''}, "
+            f"seed {options['seed']}."
+        )
+        started = time.monotonic()
+        rows = 0
+        for name, step in generator.steps():
+            step_started = time.monotonic()
+            count = step()
+            elapsed = time.monotonic() - step_started
+            if count is None:
+                logger.info(f"{name}: {elapsed:.1f} с")
+                continue
+            logger.info(f"{name}: {count} строк за {elapsed:.1f} с")
+            rows += count
+        logger.info(
+            f"Готово: {rows} строк за {time.monotonic() - started:.0f} с. "
+            f"Пароль всех пользователей: {DATASET_PASSWORD}"
+        )
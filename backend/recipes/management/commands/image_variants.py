@@ -0,0 +1,33 @@
+import logging
+
+from django.core.management import BaseCommand
+from recipes.images import generate_variants
+from recipes.models import Recipe
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger()
+
+
+class Command(BaseCommand):
+    help = "Постановка в очередь построения уменьшенных копий картинок"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Перестроить копии и у рецептов, где они уже есть.",
+        )
+
+    def handle(self, *args, **options):
+        logger.info("Построение уменьшенных копий картинок.")
+        recipes = Recipe.objects.exclude(image="").values_list(
+            "id", "image", "image_variants"
+        )
+        jobs = [
+            (recipe_id, image)
+            for recipe_id, image, variants in recipes.iterator()
+            if options["all"] or variants.get("source") != image
+        ]
+        for recipe_id, image in jobs:
+            generate_variants.delay(recipe_id=recipe_id, source=image)
+        logger.info(f"В очередь поставлено {len(jobs)} картинок")
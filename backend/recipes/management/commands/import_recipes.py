@@ -0,0 +1,58 @@
+import logging
+import time
+
+from django.core.management import BaseCommand
+from recipes.transfer import (
+    TRANSFER_BATCH_SIZE,
+    Checkpoint,
+    RecipeImporter,
+    read_batches,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger()
+
+
+class Command(BaseCommand):
+    help = "Загрузка рецептов из JSON Lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="Файл, выгруженный export_recipes.")
+        parser.add_argument(
+            "--checkpoint",
+            help="Файл контрольной точки: с ним загрузка продолжается "
+            "с места обрыва.",
+        )
+        parser.add_argument("--batch-size", type=int, default=TRANSFER_BATCH_SIZE)
+        parser.add_argument(
+            "--no-copy",
+            action="store_true",
+            help="Не использовать COPY на Postgres, только bulk_create.",
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = Checkpoint(options["checkpoint"])
+        state = checkpoint.load()
+        importer = RecipeImporter(use_copy=False if options["no_copy"] else None)
+        read, created = state.get("read", 0), state.get("created", 0)
+        logger.info(
+            f"Загрузка рецептов{' через COPY' if importer.use_copy else ''}, "
+            f"уже обработано {read} строк."
+        )
+        started = time.monotonic()
+        with open(options["input"], encoding="utf-8") as file:
+            file.seek(state.get("offset", 0))
+            for batch, offset in read_batches(file, options["batch_size"]):
+                created += importer.import_batch(batch)
+                read += len(batch)
+                checkpoint.save(offset=offset, read=read, created=created)
+                rate = (read - state.get("read", 0)) / (time.monotonic() - started)
+                logger.info(
+                    f"Обработано {read} строк, создано {created} рецептов "
+                    f"({rate:.0f} строк в секунду)"
+                )
+        checkpoint.clear()
+        logger.info(
+            f"Успешно загружено {created} рецептов, пропущено {read - created}. "
+            "Уменьшенные копии картинок строит команда image_variants."
+        )
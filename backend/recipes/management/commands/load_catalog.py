@@ -0,0 +1,43 @@
+import logging
+
+from django.core.management import BaseCommand, CommandError
+from django.db import IntegrityError
+from recipes.catalog import CATALOG_BATCH_SIZE, CATALOGS, CatalogLoader
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger()
+
+
+class Command(BaseCommand):
+    help = "Загрузка или обновление справочников ингредиентов и тэгов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "catalogs",
+            nargs="*",
+            choices=[[], *CATALOGS],
+            help="Справочники; по умолчанию все.",
+        )
+        parser.add_argument(
+            "--file", help="CSV или JSON вместо файла по умолчанию из data/."
+        )
+        parser.add_argument("--batch-size", type=int, default=CATALOG_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        for name in options["catalogs"] or CATALOGS:
+            load_catalog(name, options["file"], options["batch_size"])
+
+
+def load_catalog(name, path=None, batch_size=CATALOG_BATCH_SIZE):
+    catalog = CATALOGS[name]
+    path = path or catalog.path
+    logger.info(f"Загрузка справочника {name} из {path}.")
+    try:
+        loader = CatalogLoader(catalog, batch_size).load(path)
+    except IntegrityError as error:
+        raise CommandError(f"Справочник {name} не загружен: {error}")
+    logger.info(
+        f"Справочник {name} загружен за {loader.elapsed:.2f} с: "
+        f"добавлено {loader.inserted}, обновлено {loader.updated}, "
+        f"без изменений {loader.skipped}"
+    )
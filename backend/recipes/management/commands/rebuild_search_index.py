@@ -0,0 +1,18 @@
+import logging
+import time
+
+from django.core.management import BaseCommand
+from recipes.search import update_search
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger()
+
+
+class Command(BaseCommand):
+    help = "Пересчёт поискового индекса всех рецептов"
+
+    def handle(self, *args, **options):
+        logger.info("Пересчёт поискового индекса рецептов.")
+        started = time.monotonic()
+        update_search()
+        logger.info(f"Готово за {time.monotonic() - started:.1f} с")
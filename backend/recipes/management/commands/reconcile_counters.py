@@ -0,0 +1,17 @@
+import logging
+
+from django.core.management import BaseCommand
+from recipes.counters import COUNTERS, reconcile_counters
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger()
+
+
+class Command(BaseCommand):
+    help = "Сверка и пересчёт счётчиков рецептов и пользователей"
+
+    def handle(self, *args, **options):
+        for model in COUNTERS:
+            logger.info(f"Сверка счётчиков: {model._meta.verbose_name_plural}.")
+            fixed = reconcile_counters(model)
+            logger.info(f"Исправлено {fixed} строк")
@@ -0,0 +1,76 @@
+import logging
+
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from recipes.models import ShoppingCartIngredient
+
+BATCH_SIZE = 1000
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger()
+
+
+class Command(BaseCommand):
+    help = "Пересчёт или проверка сумм ингредиентов в списках покупок"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только сравнить сохранённые суммы с пересчитанными.",
+        )
+        parser.add_argument(
+            "--user", type=int, action="append", help="id пользователя."
+        )
+
+    def handle(self, *args, **options):
+        users = options["user"]
+        if options["check"]:
+            self.check_totals(users)
+        else:
+            self.rebuild_totals(users)
+
+    @staticmethod
+    def check_totals(users):
+        logger.info("Проверка сумм ингредиентов в списках покупок.")
+        stored = ShoppingCartIngredient.objects.all()
+        if users:
+            stored = stored.filter(user__in=users)
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in stored.values_list(
+                "user_id", "ingredient_id", "amount"
+            ).iterator()
+        }
+        mismatches = 0
+        for user_id, ingredient_id, total in ShoppingCartIngredient.calculate(
+            users
+        ).iterator():
+            if stored.pop((user_id, ingredient_id), None) != total:
+                mismatches += 1
+        mismatches += len(stored)
+        if mismatches:
+            raise CommandError(f"Найдено {mismatches} расхождений")
+        logger.info("Расхождений не найдено")
+
+    @staticmethod
+    def rebuild_totals(users):
+        logger.info("Пересчёт сумм ингредиентов в списках покупок.")
+        if users:
+            ShoppingCartIngredient.refresh(users)
+            logger.info(f"Пересчитаны списки покупок {len(users)} пользователей")
+            return
+
+        totals = ShoppingCartIngredient.calculate()
+        with transaction.atomic():
+            ShoppingCartIngredient.objects.all().delete()
+            created = ShoppingCartIngredient.objects.bulk_create(
+                (
+                    ShoppingCartIngredient(
+                        user_id=user_id, ingredient_id=ingredient_id, amount=total
+                    )
+                    for user_id, ingredient_id, total in totals.iterator()
+                ),
+                batch_size=BATCH_SIZE,
+            )
+        logger.info(f"Успешно пересчитано {len(created)} строк")
@@ -0,0 +1,46 @@
+# Generated by Django 3.2 on 2026-10-18 05:33
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0012_alter_tag_color"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChangeMarker",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "key",
+                    models.CharField(max_length=100, unique=True, verbose_name="Ключ"),
+                ),
+                (
+                    "version",
+                    models.PositiveBigIntegerField(default=0, verbose_name="Версия"),
+                ),
+                (
+                    "changed_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        verbose_name="Время изменения",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Версия данных",
+                "verbose_name_plural": "Версии данных",
+            },
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 3.2 on 2026-10-18 05:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_cart_ingredients(apps, schema_editor):
+    IngredientInRecipe = apps.get_model("recipes", "IngredientInRecipe")
+    ShoppingCartIngredient = apps.get_model("recipes", "ShoppingCartIngredient")
+    totals = (
+        IngredientInRecipe.objects.filter(recipe__shopping_list__user__isnull=False)
+        .order_by()
+        .values_list("recipe__shopping_list__user", "ingredient")
+        .annotate(total=models.Sum("amount"))
+    )
+    ShoppingCartIngredient.objects.bulk_create(
+        (
+            ShoppingCartIngredient(
+                user_id=user_id, ingredient_id=ingredient_id, amount=total
+            )
+            for user_id, ingredient_id, total in totals.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("recipes", "0013_changemarker"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShoppingCartIngredient",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("amount", models.PositiveIntegerField(verbose_name="Количество")),
+                (
+                    "ingredient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shopping_cart_ingredients",
+                        to="recipes.ingredient",
+                        verbose_name="Ингредиент",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shopping_cart_ingredients",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Ингредиент в списке покупок",
+                "verbose_name_plural": "Ингредиенты в списке покупок",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="shoppingcartingredient",
+            constraint=models.UniqueConstraint(
+                fields=("user", "ingredient"), name="unique_shopping_cart_ingredient"
+            ),
+        ),
+        migrations.RunPython(fill_shopping_cart_ingredients, migrations.RunPython.noop),
+    ]
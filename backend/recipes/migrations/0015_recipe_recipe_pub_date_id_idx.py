@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 05:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0014_auto_20261018_0536"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["-pub_date", "-id"], name="recipe_pub_date_id_idx"
+            ),
+        ),
+    ]
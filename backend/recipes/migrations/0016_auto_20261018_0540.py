@@ -0,0 +1,59 @@
+# Generated by Django 3.2 on 2026-10-18 05:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_related(counted_model, foreign_key):
+    return Coalesce(
+        Subquery(
+            counted_model.objects.filter(**{foreign_key: OuterRef("pk")})
+            .order_by()
+            .values(foreign_key)
+            .annotate(total=Count("pk"))
+            .values("total")
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    Favorite = apps.get_model("recipes", "Favorite")
+    ShoppingCart = apps.get_model("recipes", "ShoppingCart")
+    User = apps.get_model("users", "User")
+    Follow = apps.get_model("users", "Follow")
+    Recipe.objects.update(
+        favorites_count=count_related(Favorite, "recipe"),
+        in_carts_count=count_related(ShoppingCart, "recipe"),
+    )
+    User.objects.update(
+        recipes_count=count_related(Recipe, "author"),
+        followers_count=count_related(Follow, "author"),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0015_recipe_recipe_pub_date_id_idx"),
+        ("users", "0004_auto_20261018_0540"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="favorites_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Добавлений в избранное"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="in_carts_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Добавлений в список покупок"
+            ),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2 on 2026-10-18 05:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0016_auto_20261018_0540"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="image_variants",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                verbose_name="Уменьшенные копии картинки",
+            ),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 3.2 on 2026-10-18 05:54
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+INGREDIENT_NAMES = """coalesce((
+    SELECT {aggregate}
+    FROM recipes_ingredientinrecipe AS item
+    JOIN recipes_ingredient AS ingredient ON ingredient.id = item.ingredient_id
+    WHERE item.recipe_id = recipe.id
+), '')"""
+
+
+def fold(sql):
+    return f"replace(replace({sql}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+POSTGRES_SQL = [
+    "CREATE INDEX recipe_search_vector_idx "
+    "ON recipes_recipe USING gin (search_vector)",
+    f"""UPDATE recipes_recipe AS recipe SET search_vector =
+    setweight(to_tsvector('russian', {fold("recipe.name")}), 'A')
+    || setweight(to_tsvector('russian', {fold(
+        INGREDIENT_NAMES.format(aggregate="string_agg(ingredient.name, ' ')")
+    )}), 'B')
+    || setweight(to_tsvector('russian', {fold("recipe.text")}), 'C')""",
+]
+POSTGRES_REVERSE_SQL = ["DROP INDEX IF EXISTS recipe_search_vector_idx"]
+
+SQLITE_SQL = [
+    "CREATE VIRTUAL TABLE recipes_recipe_search USING fts5("
+    "name, text, ingredients, tokenize='unicode61 remove_diacritics 2')",
+    f"""INSERT INTO recipes_recipe_search (rowid, name, text, ingredients)
+    SELECT recipe.id, {fold("recipe.name")}, {fold("recipe.text")}, {fold(
+        INGREDIENT_NAMES.format(aggregate="group_concat(ingredient.name, ' ')")
+    )}
+    FROM recipes_recipe AS recipe""",
+]
+SQLITE_REVERSE_SQL = ["DROP TABLE IF EXISTS recipes_recipe_search"]
+
+
+def run(statements):
+    def execute(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for sql in statements.get(vendor, ()):
+            schema_editor.execute(sql, params=None)
+
+    return execute
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0017_recipe_image_variants"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(
+            run({"postgresql": POSTGRES_SQL, "sqlite": SQLITE_SQL}),
+            run({"postgresql": POSTGRES_REVERSE_SQL, "sqlite": SQLITE_REVERSE_SQL}),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 3.2 on 2026-10-18 06:03
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("recipes", "0018_recipe_search_vector"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FeedEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "pub_date",
+                    models.DateTimeField(verbose_name="Дата публикации рецепта"),
+                ),
+            ],
+            options={
+                "verbose_name": "Запись ленты",
+                "verbose_name_plural": "Записи ленты",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["author", "-pub_date", "-id"], name="recipe_author_pub_date_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="feedentry",
+            name="author",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Автор",
+            ),
+        ),
+        migrations.AddField(
+            model_name="feedentry",
+            name="recipe",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="feed_entries",
+                to="recipes.recipe",
+                verbose_name="Рецепт",
+            ),
+        ),
+        migrations.AddField(
+            model_name="feedentry",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="feed",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Подписчик",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="feedentry",
+            index=models.Index(
+                fields=["user", "-pub_date", "-recipe"], name="feed_user_pub_date_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="feedentry",
+            constraint=models.UniqueConstraint(
+                fields=("user", "recipe"), name="unique_feed_entry"
+            ),
+        ),
+    ]
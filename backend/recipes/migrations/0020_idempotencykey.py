@@ -0,0 +1,64 @@
+# Generated by Django 3.2 on 2026-10-18 06:06
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("recipes", "0019_feedentry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IdempotencyKey",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=255, verbose_name="Ключ")),
+                ("request", models.CharField(max_length=255, verbose_name="Запрос")),
+                (
+                    "status_code",
+                    models.PositiveSmallIntegerField(
+                        null=True, verbose_name="Код ответа"
+                    ),
+                ),
+                ("response", models.JSONField(null=True, verbose_name="Ответ")),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Создан"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="idempotency_keys",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Ключ идемпотентности",
+                "verbose_name_plural": "Ключи идемпотентности",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="idempotencykey",
+            constraint=models.UniqueConstraint(
+                fields=("user", "key"), name="unique_idempotency_key"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 06:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0020_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="idempotencykey",
+            index=models.Index(
+                fields=["user", "created_at"], name="idempotency_user_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2 on 2026-10-18 06:34
+
+from django.db import migrations
+
+# Автосозданная таблица связи рецептов и тегов: индекс по (tag_id,
+# recipe_id) отдаёт рецепты тега без чтения самой таблицы. Уникальный
+# индекс (recipe_id, tag_id) покрывает только проверку одного рецепта.
+SQL = (
+    "CREATE INDEX recipe_tags_tag_recipe_idx "
+    "ON recipes_recipe_tags (tag_id, recipe_id)"
+)
+REVERSE_SQL = "DROP INDEX IF EXISTS recipe_tags_tag_recipe_idx"
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0021_idempotency_user_created_idx"),
+    ]
+
+    operations = [
+        migrations.RunSQL(SQL, REVERSE_SQL),
+    ]
@@ -1,9 +1,17 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import models, transaction
 from django.db.models import UniqueConstraint
-from users.models import User
+from django.utils import timezone
+from users.models import Follow, User
 
 HEX_COLOR_REGEX = r"^#([A-Fa-f0-9]{6}|[A-Fa-f0-9]{3})$"
+# Рецепты авторов с таким числом подписчиков не раскладываются по лентам.
+FEED_FAN_OUT_LIMIT = 10_000
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
 
 
 class Ingredient(models.Model):
@@ -59,6 +67,9 @@ class Recipe(models.Model):
         "Картинка",
         upload_to="recipes/images/",
     )
+    image_variants = models.JSONField(
+        "Уменьшенные копии картинки", default=dict, blank=True, editable=False
+    )
     text = models.TextField(
         "Описание рецепта",
     )
@@ -75,6 +86,13 @@ class Recipe(models.Model):
         ],
     )
     pub_date = models.DateTimeField("Дата создания", auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        "Добавлений в избранное", default=0, editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        "Добавлений в список покупок", default=0, editable=False
+    )
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = "Рецепт"
@@ -83,10 +101,34 @@ class Recipe(models.Model):
         constraints = [
             UniqueConstraint(fields=["name", "author"], name="unique_recipe")
         ]
+        indexes = [
+            models.Index(fields=["-pub_date", "-id"], name="recipe_pub_date_id_idx"),
+            models.Index(
+                fields=["author", "-pub_date", "-id"],
+                name="recipe_author_pub_date_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """
+        Счётчики, поисковый вектор и копии картинки (поля с
+        editable=False) меняются только отдельными UPDATE, save их не
+        затирает. Отложенные поля тоже не пишутся и не дочитываются.
+        """
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.attname
+                for field in self._meta.concrete_fields
+                if field.editable
+                and not field.primary_key
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
 
 class IngredientInRecipe(models.Model):
     """Модель для связи рецепта и ингредиентов."""
@@ -162,3 +204,308 @@ class ShoppingCart(AbstractFavoriteShoppingCart):
         default_related_name = "shopping_list"
         verbose_name = "Рецепт в списке покупок"
         verbose_name_plural = "Рецепты в списке покупок"
+
+
+class ShoppingCartIngredient(models.Model):
+    """
+    Суммарное количество ингредиента в списке покупок пользователя.
+    Пересчитывается для затронутых пар (пользователь, ингредиент)
+    при изменении списка покупок или ингредиентов рецептов в нём.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_cart_ingredients",
+        verbose_name="Пользователь",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="shopping_cart_ingredients",
+        verbose_name="Ингредиент",
+    )
+    amount = models.PositiveIntegerField("Количество")
+
+    class Meta:
+        verbose_name = "Ингредиент в списке покупок"
+        verbose_name_plural = "Ингредиенты в списке покупок"
+        constraints = [
+            UniqueConstraint(
+                fields=["user", "ingredient"], name="unique_shopping_cart_ingredient"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user} :: {self.ingredient} - {self.amount}"
+
+    @staticmethod
+    def calculate(users=None, ingredients=None):
+        """Суммы ингредиентов по спискам покупок, посчитанные заново."""
+        in_cart = {"recipe__shopping_list__user__isnull": False}
+        if users is not None:
+            in_cart["recipe__shopping_list__user__in"] = users
+        items = IngredientInRecipe.objects.filter(**in_cart)
+        if ingredients is not None:
+            items = items.filter(ingredient__in=ingredients)
+        return (
+            items.order_by()
+            .values_list("recipe__shopping_list__user", "ingredient")
+            .annotate(total=models.Sum("amount"))
+        )
+
+    @classmethod
+    def refresh(cls, users, ingredients=None):
+        """
+        Пересчитывает суммы для пользователей users (по всем ингредиентам
+        или только по ingredients). Строки пользователей блокируются,
+        чтобы параллельные пересчёты не пересекались.
+        """
+        users = sorted(set(users))
+        if not users:
+            return
+        with transaction.atomic():
+            list(
+                User.objects.select_for_update()
+                .filter(id__in=users)
+                .order_by("id")
+                .values_list("id", flat=True)
+            )
+            stored = cls.objects.filter(user__in=users)
+            if ingredients is not None:
+                ingredients = set(ingredients)
+                stored = stored.filter(ingredient__in=ingredients)
+            stored.delete()
+            cls.objects.bulk_create(
+                cls(user_id=user_id, ingredient_id=ingredient_id, amount=total)
+                for user_id, ingredient_id, total in cls.calculate(users, ingredients)
+            )
+
+    @classmethod
+    def refresh_for_recipe(cls, recipe, ingredients=None):
+        """Пересчитывает суммы у всех, у кого рецепт в списке покупок."""
+        cls.refresh(
+            ShoppingCart.objects.filter(recipe=recipe).values_list(
+                "user_id", flat=True
+            ),
+            ingredients,
+        )
+
+
+class FeedEntry(models.Model):
+    """
+    Запись ленты подписок: рецепт автора, на которого подписан
+    пользователь. Записи раскладываются по лентам подписчиков при
+    публикации рецепта (fan-out on write), кроме рецептов популярных
+    авторов - их лента дочитывает из рецептов при чтении.
+    Дата публикации продублирована, чтобы лента читалась одним
+    проходом по индексу (user, pub_date, recipe).
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="feed",
+        verbose_name="Подписчик",
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="feed_entries",
+        verbose_name="Рецепт",
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Автор",
+    )
+    pub_date = models.DateTimeField("Дата публикации рецепта")
+
+    FAN_OUT_BATCH_SIZE = 1000
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Записи ленты"
+        constraints = [
+            UniqueConstraint(fields=["user", "recipe"], name="unique_feed_entry")
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-recipe"], name="feed_user_pub_date_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user} :: {self.recipe}"
+
+    @staticmethod
+    def fan_out_limit():
+        return getattr(settings, "FEED_FAN_OUT_LIMIT", FEED_FAN_OUT_LIMIT)
+
+    @classmethod
+    def popular_authors(cls, user):
+        """Авторы из подписок user, чьи рецепты не раскладываются по лентам."""
+        return Follow.objects.filter(
+            user=user, author__followers_count__gte=cls.fan_out_limit()
+        ).values_list("author_id", flat=True)
+
+    @classmethod
+    def insert(cls, entries):
+        """Вставка пачками; уже существующие записи пропускаются."""
+        batch = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) == cls.FAN_OUT_BATCH_SIZE:
+                cls.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        if batch:
+            cls.objects.bulk_create(batch, ignore_conflicts=True)
+
+    @classmethod
+    def fan_out(cls, recipe_ids):
+        """Раскладывает рецепты по лентам подписчиков их авторов."""
+        recipes = Recipe.objects.filter(
+            id__in=recipe_ids, author__followers_count__lt=cls.fan_out_limit()
+        ).values_list("id", "author_id", "pub_date")
+        for recipe_id, author_id, pub_date in recipes:
+            followers = Follow.objects.filter(author_id=author_id).values_list(
+                "user_id", flat=True
+            )
+            cls.insert(
+                cls(
+                    user_id=user_id,
+                    recipe_id=recipe_id,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for user_id in followers.iterator()
+            )
+
+    @classmethod
+    def backfill(cls, user_id, author_id):
+        """Добавляет в ленту подписчика уже опубликованные рецепты автора."""
+        if User.objects.filter(
+            id=author_id, followers_count__gte=cls.fan_out_limit()
+        ).exists():
+            return
+        recipes = Recipe.objects.filter(author_id=author_id).values_list(
+            "id", "pub_date"
+        )
+        cls.insert(
+            cls(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for recipe_id, pub_date in recipes.iterator()
+        )
+
+
+class ChangeMarker(models.Model):
+    """
+    Счётчик изменений таблицы (или её части, относящейся к одному
+    пользователю). По счётчикам вычисляются ETag и Last-Modified.
+    """
+
+    key = models.CharField("Ключ", max_length=100, unique=True)
+    version = models.PositiveBigIntegerField("Версия", default=0)
+    changed_at = models.DateTimeField("Время изменения", default=timezone.now)
+
+    class Meta:
+        verbose_name = "Версия данных"
+        verbose_name_plural = "Версии данных"
+
+    def __str__(self):
+        return f"{self.key} :: {self.version}"
+
+    @staticmethod
+    def user_key(table, user_id):
+        return f"{table}:{user_id}"
+
+    @staticmethod
+    def row_key(table, pk):
+        """Ключ версии одной строки таблицы, например документа рецепта."""
+        return f"{table}#{pk}"
+
+    @classmethod
+    def bump(cls, *keys):
+        """
+        Увеличивает версии атомарным UPDATE в транзакции записи: версия
+        меняется вместе с данными, которые она описывает, и не теряется,
+        если процесс завершится сразу после коммита. Существующие строки
+        обновляются одним запросом, недостающие создаются.
+        """
+        keys = sorted(set(keys))
+        if not keys:
+            return
+        now = timezone.now()
+        changes = {"version": models.F("version") + 1, "changed_at": now}
+        updated = cls.objects.filter(key__in=keys).update(**changes)
+        if updated == len(keys):
+            return
+        existing = set()
+        if updated:
+            existing = set(
+                cls.objects.filter(key__in=keys).values_list("key", flat=True)
+            )
+        for key in keys:
+            if key in existing:
+                continue
+            _, created = cls.objects.get_or_create(
+                key=key, defaults={"version": 1, "changed_at": now}
+            )
+            if not created:
+                cls.objects.filter(key=key).update(**changes)
+
+
+class IdempotencyKey(models.Model):
+    """
+    Ответ на запрос с заголовком Idempotency-Key. Повтор запроса с тем
+    же ключом получает сохранённый ответ, а не выполняется ещё раз.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="idempotency_keys",
+        verbose_name="Пользователь",
+    )
+    key = models.CharField("Ключ", max_length=255)
+    request = models.CharField("Запрос", max_length=255)
+    status_code = models.PositiveSmallIntegerField("Код ответа", null=True)
+    response = models.JSONField("Ответ", null=True)
+    created_at = models.DateTimeField("Создан", default=timezone.now)
+
+    class Meta:
+        verbose_name = "Ключ идемпотентности"
+        verbose_name_plural = "Ключи идемпотентности"
+        constraints = [
+            UniqueConstraint(fields=["user", "key"], name="unique_idempotency_key")
+        ]
+        indexes = [
+            # Удаление просроченных ключей пользователя в claim.
+            models.Index(
+                fields=["user", "created_at"], name="idempotency_user_created_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user} :: {self.key}"
+
+    @classmethod
+    def claim(cls, user, key, request):
+        """
+        Запись ключа пользователя и флаг "создана сейчас". Вызывается в
+        транзакции запроса: параллельный запрос с тем же ключом ждёт её
+        завершения на уникальном индексе и получает готовый ответ.
+        Просроченные ключи пользователя удаляются.
+        """
+        ttl = getattr(settings, "IDEMPOTENCY_KEY_TTL", IDEMPOTENCY_KEY_TTL)
+        cls.objects.filter(
+            user=user, created_at__lt=timezone.now() - timedelta(seconds=ttl)
+        ).delete()
+        return cls.objects.get_or_create(
+            user=user, key=key, defaults={"request": request}
+        )
@@ -0,0 +1,82 @@
+from django.db import connection, transaction
+from users.models import Follow
+
+from .models import Favorite, ShoppingCart
+from .signals import relations_changed
+
+
+class Relation:
+    """
+    Связь пользователя с рецептом или автором: избранное, список
+    покупок, подписка. Добавление - один INSERT ... ON CONFLICT DO
+    NOTHING, удаление - один DELETE; оба возвращают (RETURNING) только
+    реально изменённые строки. Поэтому параллельные одинаковые запросы
+    не падают на уникальном индексе, а сигнал relations_changed
+    (счётчики, версии, список покупок, ленты) отправляется один раз на
+    запрос и только с изменёнными строками.
+    """
+
+    def __init__(self, model, target):
+        self.model = model
+        self.target = target
+
+    def columns(self):
+        quote = connection.ops.quote_name
+        meta = self.model._meta
+        return (
+            quote(meta.db_table),
+            quote(meta.get_field("user").column),
+            quote(meta.get_field(self.target).column),
+        )
+
+    def changed(self, user_id, target_ids, created):
+        if target_ids:
+            relations_changed.send(
+                sender=self.model,
+                user_id=user_id,
+                target_ids=target_ids,
+                created=created,
+            )
+
+    def add(self, user_id, target_ids):
+        """Добавляет связи и возвращает id объектов, которых ещё не было."""
+        target_ids = sorted(set(target_ids))
+        if not target_ids:
+            return []
+        table, user_column, target_column = self.columns()
+        values = ", ".join(["(%s, %s)"] * len(target_ids))
+        params = [value for target_id in target_ids for value in (user_id, target_id)]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({user_column}, {target_column}) "
+                f"VALUES {values} "
+                f"ON CONFLICT ({user_column}, {target_column}) DO NOTHING "
+                f"RETURNING id, {target_column}",
+                params,
+            )
+            added = [target_id for _, target_id in cursor.fetchall()]
+            self.changed(user_id, added, created=True)
+        return added
+
+    def remove(self, user_id, target_ids):
+        """Удаляет связи и возвращает id объектов, связь с которыми была."""
+        target_ids = sorted(set(target_ids))
+        if not target_ids:
+            return []
+        table, user_column, target_column = self.columns()
+        placeholders = ", ".join(["%s"] * len(target_ids))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {table} "
+                f"WHERE {user_column} = %s AND {target_column} IN ({placeholders}) "
+                f"RETURNING id, {target_column}",
+                [user_id, *target_ids],
+            )
+            removed = [target_id for _, target_id in cursor.fetchall()]
+            self.changed(user_id, removed, created=False)
+        return removed
+
+
+FAVORITES = Relation(Favorite, "recipe")
+SHOPPING_CART = Relation(ShoppingCart, "recipe")
+FOLLOWS = Relation(Follow, "author")
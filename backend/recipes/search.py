@@ -0,0 +1,149 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import F, Value
+
+SEARCH_CONFIG = "russian"
+FTS_TABLE = "recipes_recipe_search"
+WORD_REGEX = re.compile(r"\w+")
+
+
+def fold(sql):
+    """Поиск не различает ё и е, как и поиск ингредиентов."""
+    return f"replace(replace({sql}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def fold_query(query):
+    return query.replace("ё", "е").replace("Ё", "Е")
+
+
+INGREDIENT_NAMES_SQL = """coalesce((
+    SELECT {aggregate}
+    FROM recipes_ingredientinrecipe AS item
+    JOIN recipes_ingredient AS ingredient ON ingredient.id = item.ingredient_id
+    WHERE item.recipe_id = recipe.id
+), '')"""
+
+# Вес полей: название важнее ингредиентов, ингредиенты важнее описания.
+POSTGRES_UPDATE_SQL = f"""
+    UPDATE recipes_recipe AS recipe SET search_vector =
+    setweight(to_tsvector('{SEARCH_CONFIG}', {fold("recipe.name")}), 'A')
+    || setweight(to_tsvector('{SEARCH_CONFIG}', {fold(
+        INGREDIENT_NAMES_SQL.format(aggregate="string_agg(ingredient.name, ' ')")
+    )}), 'B')
+    || setweight(to_tsvector('{SEARCH_CONFIG}', {fold("recipe.text")}), 'C')
+"""
+
+SQLITE_INSERT_SQL = f"""
+    INSERT INTO {FTS_TABLE} (rowid, name, text, ingredients)
+    SELECT recipe.id, {fold("recipe.name")}, {fold("recipe.text")}, {fold(
+        INGREDIENT_NAMES_SQL.format(aggregate="group_concat(ingredient.name, ' ')")
+    )}
+    FROM recipes_recipe AS recipe
+"""
+# Порядок весов bm25 совпадает с порядком столбцов FTS_TABLE.
+SQLITE_RANK = f"-bm25({FTS_TABLE}, 10.0, 1.0, 4.0)"
+
+
+def placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+class PostgresSearch:
+    """
+    Поиск по столбцу search_vector (tsvector, словарь russian) с
+    GIN-индексом и ранжированием ts_rank.
+    """
+
+    @staticmethod
+    def update(recipe_ids=None):
+        with connection.cursor() as cursor:
+            if recipe_ids is None:
+                cursor.execute(POSTGRES_UPDATE_SQL)
+            else:
+                cursor.execute(
+                    f"{POSTGRES_UPDATE_SQL} WHERE recipe.id = ANY(%s)",
+                    [list(recipe_ids)],
+                )
+
+    @staticmethod
+    def search(queryset, query):
+        search_query = SearchQuery(
+            fold_query(query), config=SEARCH_CONFIG, search_type="websearch"
+        )
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F("search_vector"), search_query)
+        )
+
+
+class SQLiteSearch:
+    """
+    Поиск для разработки без Postgres: виртуальная таблица FTS5 и
+    ранжирование bm25. Стемминга для русского в FTS5 нет, поэтому
+    слова запроса ищутся как префиксы.
+    """
+
+    @staticmethod
+    def update(recipe_ids=None):
+        with connection.cursor() as cursor:
+            if recipe_ids is None:
+                cursor.execute(f"DELETE FROM {FTS_TABLE}")
+                cursor.execute(SQLITE_INSERT_SQL)
+                return
+            recipe_ids = list(recipe_ids)
+            if not recipe_ids:
+                return
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN "
+                f"({placeholders(recipe_ids)})",
+                recipe_ids,
+            )
+            cursor.execute(
+                f"{SQLITE_INSERT_SQL} WHERE recipe.id IN "
+                f"({placeholders(recipe_ids)})",
+                recipe_ids,
+            )
+
+    @staticmethod
+    def search(queryset, query):
+        words = WORD_REGEX.findall(fold_query(query))
+        if not words:
+            return queryset.annotate(rank=Value(0.0)).none()
+        match = " ".join(f'"{word}"*' for word in words)
+        table = queryset.model._meta.db_table
+        # Соединение с FTS-таблицей: bm25 считается один раз на строку.
+        # Коррелированный подзапрос с MATCH выполнял бы полный поиск
+        # для каждого рецепта.
+        return queryset.extra(
+            select={"rank": SQLITE_RANK},
+            tables=[FTS_TABLE],
+            where=[f"{FTS_TABLE}.rowid = {table}.id", f"{FTS_TABLE} MATCH %s"],
+            params=[match],
+        )
+
+
+def get_backend():
+    if connection.vendor == "sqlite":
+        return SQLiteSearch
+    return PostgresSearch
+
+
+def search_recipes(queryset, query):
+    """Рецепты по запросу, от самых подходящих; при равенстве - новые."""
+    return get_backend().search(queryset, query).order_by("-rank", "-pub_date", "-id")
+
+
+def update_search(recipe_ids=None):
+    """Пересчитывает поисковые документы рецептов (всех, если None)."""
+    get_backend().update(recipe_ids)
+
+
+def schedule_search_update(recipe_ids):
+    """
+    Пересчитывает документы после коммита: к этому моменту сохранены
+    и ингредиенты, добавленные bulk_create.
+    """
+    recipe_ids = set(recipe_ids)
+    if recipe_ids:
+        transaction.on_commit(lambda: update_search(recipe_ids))
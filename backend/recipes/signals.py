@@ -0,0 +1,296 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+from users.models import Follow, User
+
+from .counters import COUNTED, shift_counter, shift_counters
+from .feed import backfill_follow, backfill_follows, fan_out_recipe
+from .images import schedule_delete, schedule_variants
+from .models import (
+    ChangeMarker,
+    Favorite,
+    FeedEntry,
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingCartIngredient,
+    Tag,
+)
+from .search import schedule_search_update
+
+TABLE_KEYS = {
+    Tag: "tags",
+    Ingredient: "ingredients",
+    Recipe: "recipes",
+    User: "users",
+}
+
+USER_TABLE_KEYS = {
+    Favorite: "favorites",
+    ShoppingCart: "shopping_cart",
+    Follow: "follows",
+}
+
+# Строки, версии которых входят в ключи документов рецептов в кэше:
+# сам рецепт и его автор.
+DOCUMENT_ROW_KEYS = {Recipe: "recipes", User: "users"}
+# Версия тэгов и ингредиентов, которые входят в документы рецептов.
+# Меняется только при изменении тех из них, что уже есть в рецептах.
+RECIPE_CATALOG_KEY = "recipe_catalog"
+
+# Справочник изменён массовой загрузкой в обход сигналов моделей.
+catalog_changed = Signal()
+# Состав рецептов recipe_ids изменён по ингредиентам ingredient_ids
+# массовыми запросами или удалением строк: у IngredientInRecipe нет
+# сигналов post_delete, чтобы удаление шло одним DELETE.
+ingredients_changed = Signal()
+# Связи пользователя user_id с объектами target_ids добавлены (created)
+# или удалены одним запросом Relation в обход сигналов моделей.
+relations_changed = Signal()
+
+
+def bump_table_version(sender, **kwargs):
+    """Отмечает изменение таблицы для пересчёта ETag."""
+    if sender is User and kwargs.get("update_fields") == frozenset({"last_login"}):
+        return
+    if sender in DOCUMENT_ROW_KEYS:
+        # Заодно версия строки, входящей в документы рецептов в кэше.
+        ChangeMarker.bump(
+            TABLE_KEYS[sender],
+            ChangeMarker.row_key(DOCUMENT_ROW_KEYS[sender], kwargs["instance"].pk),
+        )
+    elif sender in TABLE_KEYS:
+        ChangeMarker.bump(TABLE_KEYS[sender])
+    else:
+        ChangeMarker.bump(
+            ChangeMarker.user_key(USER_TABLE_KEYS[sender], kwargs["instance"].user_id)
+        )
+
+
+for model in (*TABLE_KEYS, *USER_TABLE_KEYS):
+    post_save.connect(bump_table_version, sender=model)
+    post_delete.connect(bump_table_version, sender=model)
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+def bump_recipe_ingredients_version(sender, instance, **kwargs):
+    ChangeMarker.bump(
+        TABLE_KEYS[Recipe], ChangeMarker.row_key("recipes", instance.recipe_id)
+    )
+
+
+@receiver(ingredients_changed, sender=IngredientInRecipe)
+def bump_changed_recipes_version(sender, recipe_ids, **kwargs):
+    ChangeMarker.bump(
+        TABLE_KEYS[Recipe],
+        *(ChangeMarker.row_key("recipes", recipe_id) for recipe_id in recipe_ids),
+    )
+
+
+catalog_changed.connect(bump_table_version, sender=Ingredient)
+catalog_changed.connect(bump_table_version, sender=Tag)
+
+
+def bump_relation_version(sender, user_id, **kwargs):
+    ChangeMarker.bump(ChangeMarker.user_key(USER_TABLE_KEYS[sender], user_id))
+
+
+for model in USER_TABLE_KEYS:
+    relations_changed.connect(bump_relation_version, sender=model)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_tags_version(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        keys = [TABLE_KEYS[Recipe]]
+        if not reverse:
+            keys.append(ChangeMarker.row_key("recipes", instance.pk))
+        elif action == "post_clear":
+            # У тэга очищены рецепты: их id уже не узнать.
+            keys.append(RECIPE_CATALOG_KEY)
+        else:
+            keys.extend(ChangeMarker.row_key("recipes", pk) for pk in pk_set)
+        ChangeMarker.bump(*keys)
+
+
+def is_in_recipes(instance):
+    if isinstance(instance, Tag):
+        return Recipe.tags.through.objects.filter(tag=instance).exists()
+    return IngredientInRecipe.objects.filter(ingredient=instance).exists()
+
+
+def bump_recipe_catalog_version(sender, instance=None, created=False, **kwargs):
+    """
+    Новые тэги и ингредиенты ещё не входят ни в один документ рецепта,
+    изменение неиспользуемых документы тоже не меняет. Удаление и
+    массовая загрузка меняют версию всегда.
+    """
+    if created:
+        return
+    if kwargs["signal"] is post_save and not is_in_recipes(instance):
+        return
+    ChangeMarker.bump(RECIPE_CATALOG_KEY)
+
+
+for model in (Tag, Ingredient):
+    post_save.connect(bump_recipe_catalog_version, sender=model)
+    post_delete.connect(bump_recipe_catalog_version, sender=model)
+    catalog_changed.connect(bump_recipe_catalog_version, sender=model)
+
+
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def update_cart_recipe_ingredients(sender, instance, **kwargs):
+    """
+    Пересчитывает у пользователя только суммы ингредиентов добавленного
+    или удалённого рецепта; строки, сумма которых стала нулевой,
+    удаляются.
+    """
+    ShoppingCartIngredient.refresh(
+        [instance.user_id],
+        IngredientInRecipe.objects.filter(recipe_id=instance.recipe_id).values_list(
+            "ingredient_id", flat=True
+        ),
+    )
+
+
+@receiver(relations_changed, sender=ShoppingCart)
+def update_cart_recipes_ingredients(sender, user_id, target_ids, **kwargs):
+    """То же для всех рецептов, добавленных или удалённых одним запросом."""
+    ShoppingCartIngredient.refresh(
+        [user_id],
+        IngredientInRecipe.objects.filter(recipe_id__in=target_ids).values_list(
+            "ingredient_id", flat=True
+        ),
+    )
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+def update_shopping_cart_ingredients(sender, instance, **kwargs):
+    ShoppingCartIngredient.refresh_for_recipe(instance.recipe_id)
+
+
+@receiver(ingredients_changed, sender=IngredientInRecipe)
+def update_changed_shopping_cart_ingredients(
+    sender, recipe_ids, ingredient_ids, **kwargs
+):
+    ShoppingCartIngredient.refresh(
+        ShoppingCart.objects.filter(recipe__in=recipe_ids).values_list(
+            "user_id", flat=True
+        ),
+        ingredient_ids,
+    )
+
+
+def increment_counter(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        shift_counter(sender, instance, 1)
+
+
+def decrement_counter(sender, instance, **kwargs):
+    shift_counter(sender, instance, -1)
+
+
+def shift_relation_counters(sender, target_ids, created, **kwargs):
+    shift_counters(sender, target_ids, 1 if created else -1)
+
+
+for model in COUNTED:
+    post_save.connect(increment_counter, sender=model)
+    post_delete.connect(decrement_counter, sender=model)
+    if model in USER_TABLE_KEYS:
+        relations_changed.connect(shift_relation_counters, sender=model)
+
+
+@receiver(post_save, sender=Recipe)
+def build_image_variants(sender, instance, raw=False, **kwargs):
+    if (
+        not raw
+        and instance.image
+        and instance.image_variants.get("source") != instance.image.name
+    ):
+        schedule_variants(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_image_variants(sender, instance, **kwargs):
+    schedule_delete(instance.image_variants)
+
+
+SEARCH_FIELDS = {"name", "text"}
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or SEARCH_FIELDS & set(update_fields):
+        schedule_search_update([instance.id])
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_search(sender, instance, **kwargs):
+    schedule_search_update([instance.id])
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+def update_recipe_ingredients_search(sender, instance, **kwargs):
+    schedule_search_update([instance.recipe_id])
+
+
+@receiver(ingredients_changed, sender=IngredientInRecipe)
+def update_changed_recipes_search(sender, recipe_ids, **kwargs):
+    schedule_search_update(recipe_ids)
+
+
+@receiver(pre_delete, sender=Ingredient)
+def remember_ingredient_recipes(sender, instance, **kwargs):
+    # После удаления строк состава рецептов уже не найти.
+    instance.recipe_ids = list(
+        IngredientInRecipe.objects.filter(ingredient=instance).values_list(
+            "recipe_id", flat=True
+        )
+    )
+
+
+@receiver(post_delete, sender=Ingredient)
+def remove_ingredient_from_recipes(sender, instance, **kwargs):
+    if instance.recipe_ids:
+        ingredients_changed.send(
+            sender=IngredientInRecipe,
+            recipe_ids=instance.recipe_ids,
+            ingredient_ids=[instance.id],
+        )
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_search(sender, instance, created, **kwargs):
+    if not created:
+        schedule_search_update(
+            IngredientInRecipe.objects.filter(ingredient=instance).values_list(
+                "recipe_id", flat=True
+            )
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe_to_feeds(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        fan_out_recipe.delay(recipe_id=instance.id)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        backfill_follow.delay(user_id=instance.user_id, author_id=instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clear_feed(sender, instance, **kwargs):
+    FeedEntry.objects.filter(user=instance.user_id, author=instance.author_id).delete()
+
+
+@receiver(relations_changed, sender=Follow)
+def update_follow_feeds(sender, user_id, target_ids, created, **kwargs):
+    if created:
+        backfill_follows.delay(user_id=user_id, author_ids=target_ids)
+    else:
+        FeedEntry.objects.filter(user=user_id, author__in=target_ids).delete()
@@ -0,0 +1,21 @@
+from django.contrib import admin
+
+from .models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    """Настройка отображения фоновых задач."""
+
+    list_display = (
+        "name",
+        "status",
+        "attempts",
+        "run_at",
+        "latency",
+        "duration",
+        "worker",
+    )
+    list_filter = ("status", "name")
+    readonly_fields = ("latency", "duration")
+    search_fields = ("name",)
@@ -0,0 +1,203 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import DatabaseError, close_old_connections, connections
+from django.utils import timezone
+from tasks.models import Task
+
+TASK_WORKERS = 2
+POLL_INTERVAL = 1.0
+STATS_INTERVAL = 60
+TASK_KEEP_DONE = 24 * 60 * 60
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger()
+
+
+class Metrics:
+    """Число, ожидание в очереди и длительность задач по именам."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.started = time.monotonic()
+        self.tasks = defaultdict(
+            lambda: {"done": 0, "failed": 0, "wait": [], "run": []}
+        )
+
+    def add(self, name, succeeded, wait, run):
+        with self.lock:
+            stats = self.tasks[name]
+            stats["done" if succeeded else "failed"] += 1
+            stats["wait"].append(wait)
+            stats["run"].append(run)
+
+    def report(self, worker):
+        with self.lock:
+            tasks, period = self.tasks, time.monotonic() - self.started
+            self.reset()
+        for name, stats in sorted(tasks.items()):
+            wait = sorted(stats["wait"])
+            logger.info(
+                f"[{worker}] {name}: за {period:.0f} с выполнено {stats['done']}, "
+                f"с ошибкой {stats['failed']}; ожидание в очереди "
+                f"среднее {sum(wait) / len(wait):.3f} с, "
+                f"p95 {wait[int(len(wait) * 0.95)]:.3f} с, "
+                f"наибольшее {wait[-1]:.3f} с; выполнение среднее "
+                f"{sum(stats['run']) / len(stats['run']):.3f} с"
+            )
+
+
+def work(worker, stop, burst, poll_interval, metrics):
+    """Цикл обработчика: забрать задачу, выполнить, повторить."""
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            try:
+                task = Task.claim(worker)
+            except DatabaseError:
+                logger.exception(f"[{worker}] Не удалось получить задачу")
+                stop.wait(poll_interval)
+                continue
+            if task is None:
+                if burst:
+                    return
+                stop.wait(poll_interval)
+                continue
+            wait = task.latency.total_seconds()
+            succeeded = task.run()
+            run = task.duration.total_seconds()
+            metrics.add(task.name, succeeded, wait, run)
+            log = logger.info if succeeded else logger.warning
+            log(
+                f"[{worker}] {task.name} #{task.pk} "
+                f"{'выполнена' if succeeded else 'не выполнена'} "
+                f"за {run:.3f} с, ожидала {wait:.3f} с"
+            )
+    finally:
+        connections.close_all()
+
+
+def run_threads(name, concurrency, stop, burst, poll_interval, metrics):
+    threads = [
+        threading.Thread(
+            target=work,
+            args=(f"{name}-{number}", stop, burst, poll_interval, metrics),
+        )
+        for number in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def supervise(name, workers, stop, poll_interval, metrics):
+    """Ждёт обработчиков, периодически пишет метрики и чистит очередь."""
+    last_report = time.monotonic()
+    while any(worker.is_alive() for worker in workers):
+        stop.wait(poll_interval)
+        if time.monotonic() - last_report < STATS_INTERVAL:
+            continue
+        last_report = time.monotonic()
+        metrics.report(name)
+        purged = Task.purge(
+            timezone.now()
+            - timedelta(seconds=getattr(settings, "TASK_KEEP_DONE", TASK_KEEP_DONE))
+        )
+        if purged:
+            logger.info(f"[{name}] Удалено {purged} выполненных задач")
+    for worker in workers:
+        worker.join()
+    metrics.report(name)
+    connections.close_all()
+
+
+def run_process(name, stop, burst, poll_interval):
+    """Процесс-обработчик с одним потоком и своими метриками."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    metrics = Metrics()
+    threads = run_threads(name, 1, stop, burst, poll_interval, metrics)
+    supervise(name, threads, stop, poll_interval, metrics)
+
+
+class Command(BaseCommand):
+    help = "Обработчик очереди фоновых задач"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=getattr(settings, "TASK_WORKERS", TASK_WORKERS),
+            help="Число потоков или процессов.",
+        )
+        parser.add_argument(
+            "--processes",
+            action="store_true",
+            help="Запускать процессы вместо потоков.",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Завершиться, когда очередь опустеет.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=POLL_INTERVAL,
+            help="Пауза в секундах, если задач нет.",
+        )
+
+    def handle(self, *args, **options):
+        name = f"{socket.gethostname()}-{os.getpid()}"
+        concurrency = max(options["concurrency"], 1)
+        burst, poll_interval = options["burst"], options["poll_interval"]
+        if options["processes"]:
+            stop = multiprocessing.Event()
+            connections.close_all()
+            workers = [
+                multiprocessing.Process(
+                    target=run_process,
+                    args=(f"{name}-p{number}", stop, burst, poll_interval),
+                )
+                for number in range(concurrency)
+            ]
+            for process in workers:
+                process.start()
+        else:
+            stop = threading.Event()
+            metrics = Metrics()
+            workers = run_threads(
+                name, concurrency, stop, burst, poll_interval, metrics
+            )
+
+        def shutdown(*args):
+            logger.info("Остановка после текущих задач.")
+            stop.set()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+        logger.info(
+            f"Обработчик {name} запущен: "
+            f"{concurrency} {'процессов' if options['processes'] else 'потоков'}."
+        )
+
+        if options["processes"]:
+            for worker in workers:
+                while worker.is_alive():
+                    stop.wait(poll_interval)
+                    worker.join(0)
+        else:
+            supervise(name, workers, stop, poll_interval, metrics)
+        logger.info(f"Обработчик {name} остановлен")
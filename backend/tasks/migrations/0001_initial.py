@@ -0,0 +1,116 @@
+# Generated by Django 3.2 on 2026-10-18 05:45
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="Task",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=200, verbose_name="Задача")),
+                (
+                    "kwargs",
+                    models.JSONField(
+                        blank=True, default=dict, verbose_name="Аргументы"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "В очереди"),
+                            ("running", "Выполняется"),
+                            ("done", "Выполнена"),
+                            ("failed", "Ошибка"),
+                        ],
+                        default="queued",
+                        max_length=10,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveSmallIntegerField(default=0, verbose_name="Попыток"),
+                ),
+                (
+                    "max_attempts",
+                    models.PositiveSmallIntegerField(
+                        default=3, verbose_name="Наибольшее число попыток"
+                    ),
+                ),
+                (
+                    "run_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        verbose_name="Выполнить после",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Создана"),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(blank=True, null=True, verbose_name="Начата"),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Завершена"
+                    ),
+                ),
+                (
+                    "locked_until",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Занята до"
+                    ),
+                ),
+                (
+                    "worker",
+                    models.CharField(
+                        blank=True, max_length=100, verbose_name="Обработчик"
+                    ),
+                ),
+                (
+                    "last_error",
+                    models.TextField(blank=True, verbose_name="Последняя ошибка"),
+                ),
+            ],
+            options={
+                "verbose_name": "Фоновая задача",
+                "verbose_name_plural": "Фоновые задачи",
+                "ordering": ("-created_at",),
+            },
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                condition=models.Q(status="queued"),
+                fields=["run_at", "id"],
+                name="task_queued_run_at_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                condition=models.Q(status="running"),
+                fields=["locked_until"],
+                name="task_running_locked_idx",
+            ),
+        ),
+    ]
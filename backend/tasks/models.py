@@ -0,0 +1,183 @@
+import traceback
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .registry import TASKS
+
+TASK_MAX_ATTEMPTS = 3
+TASK_RETRY_DELAY = 10
+TASK_LOCK_TIMEOUT = 10 * 60
+
+
+def get_setting(name, default):
+    return getattr(settings, name, default)
+
+
+class Task(models.Model):
+    """
+    Фоновая задача. Ставится в очередь в той же транзакции, что и
+    изменения, которые её породили, и выполняется командой worker.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (QUEUED, "В очереди"),
+        (RUNNING, "Выполняется"),
+        (DONE, "Выполнена"),
+        (FAILED, "Ошибка"),
+    )
+
+    name = models.CharField("Задача", max_length=200)
+    kwargs = models.JSONField("Аргументы", default=dict, blank=True)
+    status = models.CharField(
+        "Статус", max_length=10, choices=STATUS_CHOICES, default=QUEUED
+    )
+    attempts = models.PositiveSmallIntegerField("Попыток", default=0)
+    max_attempts = models.PositiveSmallIntegerField(
+        "Наибольшее число попыток", default=TASK_MAX_ATTEMPTS
+    )
+    run_at = models.DateTimeField("Выполнить после", default=timezone.now)
+    created_at = models.DateTimeField("Создана", auto_now_add=True)
+    started_at = models.DateTimeField("Начата", null=True, blank=True)
+    finished_at = models.DateTimeField("Завершена", null=True, blank=True)
+    locked_until = models.DateTimeField("Занята до", null=True, blank=True)
+    worker = models.CharField("Обработчик", max_length=100, blank=True)
+    last_error = models.TextField("Последняя ошибка", blank=True)
+
+    class Meta:
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        ordering = ("-created_at",)
+        indexes = [
+            models.Index(
+                fields=["run_at", "id"],
+                condition=Q(status="queued"),
+                name="task_queued_run_at_idx",
+            ),
+            models.Index(
+                fields=["locked_until"],
+                condition=Q(status="running"),
+                name="task_running_locked_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} :: {self.status}"
+
+    @property
+    def latency(self):
+        """Сколько задача ждала в очереди до последнего запуска."""
+        if self.started_at:
+            return self.started_at - self.run_at
+        return None
+
+    @property
+    def duration(self):
+        if self.started_at and self.finished_at:
+            return self.finished_at - self.started_at
+        return None
+
+    @classmethod
+    def enqueue(cls, name, kwargs=None, run_at=None, max_attempts=None):
+        return cls.objects.create(
+            name=name,
+            kwargs=kwargs or {},
+            run_at=run_at or timezone.now(),
+            max_attempts=max_attempts
+            or get_setting("TASK_MAX_ATTEMPTS", TASK_MAX_ATTEMPTS),
+        )
+
+    @classmethod
+    def claim(cls, worker):
+        """
+        Забирает одну готовую к запуску задачу. Ждущие и зависшие
+        (занятые дольше TASK_LOCK_TIMEOUT) строки выбираются через
+        SELECT ... FOR UPDATE SKIP LOCKED, так что обработчики не ждут
+        друг друга. Там, где SKIP LOCKED нет (SQLite), задачу
+        достаётся тому, чей условный UPDATE сработал первым. Зависшие
+        задачи, исчерпавшие попытки, не перезапускаются, а помечаются
+        ошибкой: иначе задача, роняющая обработчик, выполнялась бы вечно.
+        """
+        now = timezone.now()
+        stale = Q(status=cls.RUNNING, locked_until__lt=now)
+        cls.objects.filter(stale, attempts__gte=F("max_attempts")).update(
+            status=cls.FAILED,
+            finished_at=now,
+            locked_until=None,
+            last_error="Обработчик не завершил задачу за TASK_LOCK_TIMEOUT.",
+        )
+        ready = Q(status=cls.QUEUED, run_at__lte=now) | (
+            stale & Q(attempts__lt=F("max_attempts"))
+        )
+        with transaction.atomic():
+            task = (
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(ready)
+                .order_by("run_at", "id")
+                .first()
+            )
+            if task is None:
+                return None
+            changes = {
+                "status": cls.RUNNING,
+                "attempts": task.attempts + 1,
+                "started_at": now,
+                "locked_until": now
+                + timedelta(
+                    seconds=get_setting("TASK_LOCK_TIMEOUT", TASK_LOCK_TIMEOUT)
+                ),
+                "worker": worker,
+            }
+            claimed = cls.objects.filter(
+                ready, pk=task.pk, attempts=task.attempts
+            ).update(**changes)
+        if not claimed:
+            return None
+        for field, value in changes.items():
+            setattr(task, field, value)
+        return task
+
+    def run(self):
+        """Выполняет задачу и сохраняет результат или планирует повтор."""
+        try:
+            if self.name not in TASKS:
+                import_module(self.name.rsplit(".", 1)[0])
+            TASKS[self.name](**self.kwargs)
+        except Exception:
+            self.last_error = traceback.format_exc()
+            if self.attempts < self.max_attempts:
+                self.status = self.QUEUED
+                self.run_at = timezone.now() + timedelta(
+                    seconds=get_setting("TASK_RETRY_DELAY", TASK_RETRY_DELAY)
+                    * 2 ** (self.attempts - 1)
+                )
+            else:
+                self.status = self.FAILED
+        else:
+            self.status = self.DONE
+        self.finished_at = timezone.now()
+        self.locked_until = None
+        type(self).objects.filter(pk=self.pk, worker=self.worker).update(
+            status=self.status,
+            run_at=self.run_at,
+            finished_at=self.finished_at,
+            locked_until=None,
+            last_error=self.last_error,
+        )
+        return self.status == self.DONE
+
+    @classmethod
+    def purge(cls, older_than):
+        """Удаляет выполненные задачи, завершённые раньше older_than."""
+        deleted, _ = cls.objects.filter(
+            status=cls.DONE, finished_at__lt=older_than
+        ).delete()
+        return deleted
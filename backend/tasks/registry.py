@@ -0,0 +1,24 @@
+TASKS = {}
+
+
+def task(max_attempts=None):
+    """
+    Регистрирует функцию как фоновую задачу. Поставить её в очередь
+    можно вызовом func.delay(**kwargs): аргументы сохраняются в JSON,
+    поэтому передавать нужно id и строки, а не объекты моделей.
+    """
+
+    def register(func):
+        name = f"{func.__module__}.{func.__name__}"
+        TASKS[name] = func
+
+        def delay(run_at=None, **kwargs):
+            from .models import Task
+
+            return Task.enqueue(name, kwargs, run_at=run_at, max_attempts=max_attempts)
+
+        func.delay = delay
+        func.task_name = name
+        return func
+
+    return register
@@ -0,0 +1,19 @@
+import pytest
+
+pytestmark = pytest.mark.django_db
+
+
+def test_write_changes_etag_before_commit_callbacks(api_client, tags):
+    first = api_client.get("/api/tags/")
+    etag = first["ETag"]
+    assert api_client.get("/api/tags/", HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    # Колбэки on_commit в тесте не выполняются: версия должна вырасти
+    # в самой транзакции записи.
+    tags[0].name = "Завтрак"
+    tags[0].save()
+
+    response = api_client.get("/api/tags/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+    assert "Last-Modified" in response
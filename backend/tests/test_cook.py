@@ -0,0 +1,141 @@
+import threading
+
+import pytest
+from api.pantry_index import PantryIndex, PantryIndexHolder
+from recipes.models import ChangeMarker, IngredientInRecipe
+
+pytestmark = pytest.mark.django_db
+
+
+def cook(client, ingredients, max_missing):
+    response = client.get(
+        "/api/recipes/cook/",
+        {
+            "ingredients": ",".join(str(ingredient.id) for ingredient in ingredients),
+            "max_missing": max_missing,
+        },
+    )
+    assert response.status_code == 200
+    return {
+        recipe["id"]: recipe["missing_ingredients"]
+        for recipe in response.json()["results"]
+    }
+
+
+def test_cook_orders_by_coverage(api_client, make_recipe, ingredients):
+    salt, sugar, flour, milk = ingredients[:4]
+    full = make_recipe("Сироп", {sugar: 100})
+    half = make_recipe("Тесто", {salt: 5, flour: 500})
+    third = make_recipe("Блины", {sugar: 50, flour: 300, milk: 500})
+    make_recipe("Кисель", {milk: 200})
+
+    response = api_client.get(
+        "/api/recipes/cook/", {"ingredients": f"{salt.id},{sugar.id}"}
+    )
+    assert [recipe["id"] for recipe in response.json()["results"]] == [
+        full.id,
+        half.id,
+        third.id,
+    ]
+    assert [recipe["coverage"] for recipe in response.json()["results"]] == [
+        1,
+        0.5,
+        0.333,
+    ]
+    assert cook(api_client, [salt, sugar], max_missing=1) == {
+        full.id: [],
+        half.id: [flour.id],
+    }
+
+
+def test_new_recipe_reaches_cook(
+    api_client, make_recipe, ingredients, django_capture_on_commit_callbacks
+):
+    salt = ingredients[0]
+    assert cook(api_client, [salt], max_missing=0) == {}
+    with django_capture_on_commit_callbacks(execute=True):
+        recipe = make_recipe("Соль", {salt: 5})
+    assert cook(api_client, [salt], max_missing=0) == {recipe.id: []}
+
+
+def test_cook_requires_ingredients(api_client):
+    assert api_client.get("/api/recipes/cook/").status_code == 400
+
+
+def test_patched_ingredients_reach_cook(
+    api_client,
+    author_client,
+    make_recipe,
+    ingredients,
+    tags,
+    django_capture_on_commit_callbacks,
+):
+    salt, sugar, flour = ingredients[:3]
+    recipe = make_recipe("Тесто", {salt: 5, sugar: 50})
+    assert cook(api_client, [salt, sugar], max_missing=0) == {recipe.id: []}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = author_client.patch(
+            f"/api/recipes/{recipe.id}/",
+            {
+                "ingredients": [
+                    {"id": salt.id, "amount": 5},
+                    {"id": sugar.id, "amount": 50},
+                    {"id": flour.id, "amount": 500},
+                ],
+                "tags": [tag.id for tag in tags],
+            },
+            format="json",
+        )
+    assert response.status_code == 200
+
+    assert cook(api_client, [salt, sugar], max_missing=0) == {}
+    assert cook(api_client, [salt, sugar], max_missing=1) == {recipe.id: [flour.id]}
+
+
+def test_write_from_another_process_reaches_cook(api_client, make_recipe, ingredients):
+    salt, sugar = ingredients[:2]
+    recipe = make_recipe("Соль", {salt: 5})
+    assert cook(api_client, [sugar], max_missing=0) == {}
+
+    # Другой процесс добавил ингредиент: здесь после коммита ничего не
+    # выполнялось, изменилась только версия рецептов.
+    IngredientInRecipe.objects.create(recipe=recipe, ingredient=sugar, amount=5)
+    ChangeMarker.bump("recipes")
+    assert cook(api_client, [sugar], max_missing=1) == {recipe.id: [salt.id]}
+
+
+def test_rebuild_serves_previous_index(settings, monkeypatch):
+    settings.PANTRY_INDEX_BACKGROUND_REBUILD = True
+    holder = PantryIndexHolder()
+    release = threading.Event()
+    builds = iter([[(1, 10)], [(1, 10), (2, 10)]])
+
+    def build():
+        rows = next(builds)
+        if len(rows) > 1:
+            release.wait(5)
+        return PantryIndex(rows)
+
+    monkeypatch.setattr(holder, "build", build)
+    first = holder.get(1)
+    assert holder.get(2) is first
+    rebuilding = holder.rebuilding
+    # Пока идёт перестройка, второй поток не запускается.
+    assert holder.get(3) is first
+    assert holder.rebuilding is rebuilding
+    release.set()
+    rebuilding.join(5)
+    assert [recipe_id for recipe_id, _, _ in holder.get(2).match([10])] == [2, 1]
+
+
+def test_deleted_ingredient_leaves_cook(
+    api_client, make_recipe, ingredients, django_capture_on_commit_callbacks
+):
+    salt, sugar = ingredients[:2]
+    recipe = make_recipe("Соль", {salt: 5, sugar: 5})
+    assert cook(api_client, [salt], max_missing=1) == {recipe.id: [sugar.id]}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        sugar.delete()
+    assert cook(api_client, [salt], max_missing=0) == {recipe.id: []}
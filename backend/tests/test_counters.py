@@ -0,0 +1,93 @@
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from recipes.counters import reconcile_counters
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+pytestmark = pytest.mark.django_db
+
+
+def test_signals_shift_counters(user, author, make_recipe):
+    recipe = make_recipe("Суп")
+    favorite = Favorite.objects.create(user=user, recipe=recipe)
+    ShoppingCart.objects.create(user=user, recipe=recipe)
+    follow = Follow.objects.create(user=user, author=author)
+
+    recipe.refresh_from_db()
+    author.refresh_from_db()
+    assert (recipe.favorites_count, recipe.in_carts_count) == (1, 1)
+    assert (author.recipes_count, author.followers_count) == (1, 1)
+
+    favorite.delete()
+    follow.delete()
+    recipe.refresh_from_db()
+    author.refresh_from_db()
+    assert (recipe.favorites_count, recipe.in_carts_count) == (0, 1)
+    assert (author.recipes_count, author.followers_count) == (1, 0)
+
+
+def test_stale_instance_keeps_counters(user, make_recipe):
+    recipe = make_recipe("Суп")
+    stale = Recipe.objects.get(pk=recipe.pk)
+    Favorite.objects.create(user=user, recipe=recipe)
+
+    stale.name = "Борщ"
+    stale.save()
+    recipe.refresh_from_db()
+    assert (recipe.name, recipe.favorites_count) == ("Борщ", 1)
+
+
+def test_deferred_save_writes_only_loaded_fields(user):
+    partial = User.objects.only("id", "first_name").get(pk=user.pk)
+    partial.first_name = "Иван"
+    updates = []
+
+    def record(execute, sql, params, many, context):
+        if sql.startswith("UPDATE") and User._meta.db_table in sql:
+            updates.append(sql)
+        elif sql.startswith("SELECT") and User._meta.db_table in sql:
+            pytest.fail("save дочитывает отложенные поля")
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(record):
+        partial.save()
+    (update,) = updates
+    assert '"first_name"' in update and '"username"' not in update
+    user.refresh_from_db()
+    assert (user.first_name, user.username) == ("Иван", "user")
+
+
+def test_orderings_use_counters(user, user_client, make_user, make_recipe):
+    authors = [make_user("first"), make_user("second")]
+    popular = make_recipe("Суп", author=authors[0])
+    make_recipe("Борщ", author=authors[1])
+    make_recipe("Каша", author=authors[1])
+    Favorite.objects.create(user=user, recipe=popular)
+    for author in authors:
+        Follow.objects.create(user=user, author=author)
+
+    recipes = user_client.get("/api/recipes/", {"ordering": "-favorites_count"})
+    assert recipes.json()["results"][0]["id"] == popular.id
+    subscriptions = user_client.get(
+        "/api/users/subscriptions/", {"ordering": "-recipes_count"}
+    )
+    assert [author["id"] for author in subscriptions.json()["results"]] == [
+        authors[1].id,
+        authors[0].id,
+    ]
+
+
+def test_reconcile_fixes_only_drifted_rows(user, author, make_recipe):
+    first, second = make_recipe("Суп"), make_recipe("Борщ")
+    Favorite.objects.create(user=user, recipe=first)
+    Recipe.objects.filter(pk=first.pk).update(favorites_count=5)
+    User.objects.filter(pk=author.pk).update(recipes_count=0)
+
+    assert reconcile_counters(Recipe) == 1
+    assert reconcile_counters(Recipe, [second.pk]) == 0
+    call_command("reconcile_counters")
+
+    assert Recipe.objects.get(pk=first.pk).favorites_count == 1
+    assert User.objects.get(pk=author.pk).recipes_count == 2
+    assert reconcile_counters(User) == 0
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+from django.core.management import call_command
+from recipes.models import FeedEntry, Recipe
+from tasks.models import Task
+
+pytestmark = pytest.mark.django_db
+
+
+def run_tasks():
+    """Выполняет задачи лент; картинок для рецептов в тестах нет."""
+    task = Task.claim("tests")
+    while task is not None:
+        if task.name.startswith("recipes.feed."):
+            assert task.run(), task.last_error
+        else:
+            task.run()
+        task = Task.claim("tests")
+
+
+def feed(client):
+    response = client.get("/api/recipes/feed/")
+    assert response.status_code == 200
+    return [recipe["id"] for recipe in response.json()["results"]]
+
+
+def test_follow_backfills_and_publish_fans_out(user_client, author, make_recipe):
+    old = make_recipe("Суп")
+    run_tasks()
+    assert user_client.post(f"/api/users/{author.id}/subscribe/").status_code == 201
+    run_tasks()
+    assert feed(user_client) == [old.id]
+
+    new = make_recipe("Борщ")
+    run_tasks()
+    assert feed(user_client) == [new.id, old.id]
+    assert FeedEntry.objects.filter(user__username="user").count() == 2
+
+
+def test_unfollow_clears_feed(user_client, author, make_recipe):
+    make_recipe("Суп")
+    user_client.post(f"/api/users/{author.id}/subscribe/")
+    run_tasks()
+    assert user_client.delete(f"/api/users/{author.id}/subscribe/").status_code == 204
+    assert feed(user_client) == []
+    assert not FeedEntry.objects.exists()
+
+
+def test_popular_author_is_read_from_recipes(
+    settings, user_client, author, make_recipe
+):
+    settings.FEED_FAN_OUT_LIMIT = 1
+    user_client.post(f"/api/users/{author.id}/subscribe/")
+    recipe = make_recipe("Суп")
+    run_tasks()
+    assert not FeedEntry.objects.exists()
+    assert feed(user_client) == [recipe.id]
+
+
+def test_imported_recipes_reach_feed_cook_and_search(
+    user_client, author, tags, ingredients, tmp_path
+):
+    user_client.post(f"/api/users/{author.id}/subscribe/")
+    run_tasks()
+    assert feed(user_client) == []
+    salt = ingredients[0]
+    assert (
+        user_client.get("/api/recipes/cook/", {"ingredients": salt.id}).json()[
+            "results"
+        ]
+        == []
+    )
+
+    dump = tmp_path / "recipes.jsonl"
+    record = {
+        "author": author.email,
+        "name": "Рассольник",
+        "text": "Описание",
+        "cooking_time": 30,
+        "image": "recipes/images/recipe.png",
+        "pub_date": "2024-01-01T00:00:00+00:00",
+        "tags": [tags[0].slug],
+        "ingredients": [
+            {"name": salt.name, "measurement_unit": salt.measurement_unit, "amount": 5}
+        ],
+    }
+    dump.write_text(json.dumps(record, ensure_ascii=False) + "\n", encoding="utf-8")
+    call_command("import_recipes", str(dump), "--no-copy")
+    run_tasks()
+
+    (recipe_id,) = Recipe.objects.filter(name="Рассольник").values_list("id", flat=True)
+    assert feed(user_client) == [recipe_id]
+    cook = user_client.get("/api/recipes/cook/", {"ingredients": salt.id})
+    assert [recipe["id"] for recipe in cook.json()["results"]] == [recipe_id]
+    found = user_client.get("/api/recipes/", {"search": "рассольник"})
+    assert [recipe["id"] for recipe in found.json()["results"]] == [recipe_id]
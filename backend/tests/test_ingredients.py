@@ -0,0 +1,49 @@
+import pytest
+from django.core.management import call_command
+from recipes.catalog import CATALOGS, CatalogLoader
+from recipes.models import Tag
+
+pytestmark = pytest.mark.django_db
+
+
+def names(response):
+    assert response.status_code == 200
+    return [ingredient["name"] for ingredient in response.json()]
+
+
+def test_catalog_load_reaches_autocomplete(
+    api_client, tmp_path, django_capture_on_commit_callbacks
+):
+    catalog = tmp_path / "ingredients.csv"
+    catalog.write_text("name,unit of measure\nсоль,г\n", encoding="utf-8")
+    with django_capture_on_commit_callbacks(execute=True):
+        call_command("load_catalog", "ingredients", file=str(catalog))
+    assert names(api_client.get("/api/ingredients/?name=са")) == []
+
+    # Индекс не подписан на сигналы: загрузку, в том числе из другого
+    # процесса, он замечает только по версии справочника.
+    catalog.write_text("name,unit of measure\nсахар,г\n", encoding="utf-8")
+    with django_capture_on_commit_callbacks(execute=True):
+        call_command("load_catalog", "ingredients", file=str(catalog))
+    assert names(api_client.get("/api/ingredients/?name=са")) == ["сахар"]
+
+
+def test_unchanged_catalog_keeps_etag(api_client, tmp_path):
+    catalog = tmp_path / "ingredients.csv"
+    catalog.write_text("name,unit of measure\nсоль,г\n", encoding="utf-8")
+    call_command("load_catalog", "ingredients", file=str(catalog))
+    etag = api_client.get("/api/ingredients/")["ETag"]
+    response = api_client.get("/api/ingredients/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+
+def test_conflicting_rows_are_counted_as_skipped(tmp_path, tags):
+    catalog = tmp_path / "tags.csv"
+    # Новый slug, но название уже занято: bulk_create строку отбросит.
+    catalog.write_text(
+        f"name,slug,color\n{tags[0].name},taken,#000000\nУжин,dinner,#111111\n",
+        encoding="utf-8",
+    )
+    loader = CatalogLoader(CATALOGS["tags"]).load(str(catalog))
+    assert (loader.inserted, loader.updated, loader.skipped) == (1, 0, 1)
+    assert not Tag.objects.filter(slug="taken").exists()
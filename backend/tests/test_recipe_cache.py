@@ -0,0 +1,63 @@
+import pytest
+from recipes.models import ChangeMarker, Recipe, Tag
+
+pytestmark = pytest.mark.django_db
+
+
+def test_write_from_another_process_is_not_served_stale(
+    user_client, make_recipe, django_capture_on_commit_callbacks
+):
+    recipe = make_recipe("Суп")
+    url = f"/api/recipes/{recipe.id}/"
+    first = user_client.get(url)
+    assert first.json()["image_variants"] is None
+    assert user_client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code == 304
+
+    # Варианты картинки сохранила фоновая задача в другом процессе:
+    # здесь сигналов не было, изменились только строка и версия в базе.
+    with django_capture_on_commit_callbacks(execute=True):
+        Recipe.objects.filter(pk=recipe.pk).update(
+            image_variants={
+                "source": recipe.image.name,
+                "thumbnail": {"webp": "recipes/variants/thumbnail.webp"},
+            }
+        )
+        ChangeMarker.bump("recipes", ChangeMarker.row_key("recipes", recipe.pk))
+
+    response = user_client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+    assert response.status_code == 200
+    assert response["ETag"] != first["ETag"]
+    assert response.json()["image_variants"] is not None
+
+
+# Тёплый документ: версии для ETag и версии документа, без чтения рецепта.
+WARM_DETAIL_QUERIES = 2
+
+
+def test_unrelated_writes_keep_cached_document(
+    api_client, make_recipe, make_user, django_assert_num_queries
+):
+    recipe = make_recipe("Суп")
+    url = f"/api/recipes/{recipe.id}/"
+    api_client.get(url)
+
+    make_user("newcomer")
+    make_recipe("Каша")
+    Tag.objects.create(name="Новый тэг", slug="new", color="#000000")
+    with django_assert_num_queries(WARM_DETAIL_QUERIES):
+        assert api_client.get(url).status_code == 200
+
+
+def test_author_and_tag_changes_refresh_document(api_client, make_recipe, tags):
+    recipe = make_recipe("Суп")
+    url = f"/api/recipes/{recipe.id}/"
+    api_client.get(url)
+
+    recipe.author.first_name = "Новое имя"
+    recipe.author.save()
+    assert api_client.get(url).json()["author"]["first_name"] == "Новое имя"
+
+    tags[0].name = "Переименованный тэг"
+    tags[0].save()
+    names = [tag["name"] for tag in api_client.get(url).json()["tags"]]
+    assert "Переименованный тэг" in names
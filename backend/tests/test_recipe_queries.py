@@ -0,0 +1,59 @@
+import pytest
+from django.core.cache import cache
+from recipes.models import Favorite, ShoppingCart
+
+pytestmark = pytest.mark.django_db
+
+# Запросы при холодном кэше документов: версии для ETag, COUNT, id
+# страницы, версии документов, рецепты с авторами, теги, ингредиенты;
+# для пользователя - ещё подписки на авторов страницы.
+LIST_QUERIES = {"anonymous": 7, "authenticated": 8}
+# Версии, версия документа, рецепт с автором, теги, ингредиенты
+# (и подписка на автора).
+DETAIL_QUERIES = {"anonymous": 5, "authenticated": 6}
+
+
+@pytest.fixture
+def recipes(make_recipe, make_user, author, ingredients, request):
+    """Рецепты двух авторов, по несколько ингредиентов в каждом."""
+    authors = [author, make_user("second_author")]
+    return [
+        make_recipe(
+            f"Рецепт {number}",
+            {ingredient: 10 for ingredient in ingredients[: number % 3 + 2]},
+            author=authors[number % 2],
+        )
+        for number in range(request.param)
+    ]
+
+
+@pytest.fixture
+def clients(api_client, user_client):
+    return {"anonymous": api_client, "authenticated": user_client}
+
+
+@pytest.mark.parametrize("recipes", [1, 6], indirect=True)
+@pytest.mark.parametrize("viewer", ["anonymous", "authenticated"])
+def test_list_queries_do_not_depend_on_page_size(
+    recipes, viewer, clients, user, django_assert_num_queries
+):
+    Favorite.objects.create(user=user, recipe=recipes[0])
+    ShoppingCart.objects.create(user=user, recipe=recipes[-1])
+    cache.clear()
+    with django_assert_num_queries(LIST_QUERIES[viewer]):
+        response = clients[viewer].get("/api/recipes/?limit=6")
+    assert response.status_code == 200
+    assert len(response.json()["results"]) == len(recipes)
+
+
+@pytest.mark.parametrize("recipes", [1, 6], indirect=True)
+@pytest.mark.parametrize("viewer", ["anonymous", "authenticated"])
+def test_detail_queries_do_not_depend_on_recipe_size(
+    recipes, viewer, clients, django_assert_num_queries
+):
+    recipe = recipes[-1]
+    cache.clear()
+    with django_assert_num_queries(DETAIL_QUERIES[viewer]):
+        response = clients[viewer].get(f"/api/recipes/{recipe.id}/")
+    assert response.status_code == 200
+    assert len(response.json()["ingredients"]) == recipe.ingredients.count()
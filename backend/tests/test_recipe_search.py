@@ -0,0 +1,40 @@
+import pytest
+from recipes.models import Ingredient
+
+pytestmark = pytest.mark.django_db
+
+
+def search(client, query, **params):
+    response = client.get("/api/recipes/", {"search": query, **params})
+    assert response.status_code == 200
+    return [recipe["name"] for recipe in response.json()["results"]]
+
+
+def test_search_ranks_name_over_ingredients_and_text(
+    api_client, make_recipe, django_capture_on_commit_callbacks
+):
+    beet = Ingredient.objects.create(name="Свёкла", measurement_unit="г")
+    with django_capture_on_commit_callbacks(execute=True):
+        make_recipe("Салат", {beet: 200})
+        make_recipe("Свекла тушёная")
+        recipe = make_recipe("Суп")
+        recipe.text = "Свёкла по вкусу"
+        recipe.save()
+        make_recipe("Компот")
+
+    assert search(api_client, "свёкла") == ["Свекла тушёная", "Салат", "Суп"]
+    assert search(api_client, "компот") == ["Компот"]
+    assert search(api_client, "!!!") == []
+
+
+def test_cursor_keeps_search_relevance(
+    api_client, make_recipe, django_capture_on_commit_callbacks
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        make_recipe("Борщ")
+        recipe = make_recipe("Щи")
+        recipe.text = "Почти борщ"
+        recipe.save()
+
+    assert search(api_client, "борщ") == ["Борщ", "Щи"]
+    assert search(api_client, "борщ", cursor="") == ["Борщ", "Щи"]
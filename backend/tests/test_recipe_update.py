@@ -0,0 +1,105 @@
+import pytest
+from django.db import connection
+from recipes.models import IngredientInRecipe, ShoppingCart, ShoppingCartIngredient
+
+pytestmark = pytest.mark.django_db
+
+# Загрузка рецепта с тэгами и ингредиентами, проверка id тэгов и
+# ингредиентов (по запросу на список) и уникальности названия,
+# сохранение разницы, версия рецептов и ответ с составом рецепта.
+PATCH_QUERIES = 18
+# Загрузка рецепта с тэгами и ингредиентами, проверка уникальности
+# названия, UPDATE рецепта, версии рецептов, задача вариантов картинки
+# и ответ с составом рецепта и подпиской на автора.
+NAME_PATCH_QUERIES = 12
+
+
+@pytest.mark.parametrize("changed", [1, 3])
+def test_patch_costs_constant_queries(
+    changed, author_client, make_recipe, ingredients, tags, django_assert_num_queries
+):
+    kept, replaced, new = ingredients[:4], ingredients[4:7], ingredients[7:10]
+    recipe = make_recipe("Суп", {ingredient: 10 for ingredient in kept + replaced})
+    rows = {
+        row.ingredient_id: row.pk
+        for row in IngredientInRecipe.objects.filter(recipe=recipe)
+    }
+    payload = (
+        [
+            {"id": ingredient.id, "amount": 20 if number < changed else 10}
+            for number, ingredient in enumerate(kept)
+        ]
+        + [{"id": ingredient.id, "amount": 10} for ingredient in replaced[changed:]]
+        + [{"id": ingredient.id, "amount": 5} for ingredient in new[:changed]]
+    )
+    writes = []
+
+    def record_writes(execute, sql, params, many, context):
+        if sql.startswith(("INSERT", "UPDATE", "DELETE")) and (
+            IngredientInRecipe._meta.db_table in sql
+        ):
+            writes.append((sql.split()[0], params))
+        return execute(sql, params, many, context)
+
+    with django_assert_num_queries(PATCH_QUERIES), connection.execute_wrapper(
+        record_writes
+    ):
+        response = author_client.patch(
+            f"/api/recipes/{recipe.id}/",
+            {"ingredients": payload, "tags": [tag.id for tag in tags]},
+            format="json",
+        )
+    assert response.status_code == 200
+    assert len(response.json()["ingredients"]) == len(payload)
+
+    # По одному INSERT, UPDATE и DELETE при любом числе изменений, и
+    # UPDATE затрагивает только строки с новым количеством.
+    assert sorted(kind for kind, _ in writes) == ["DELETE", "INSERT", "UPDATE"]
+    (update_params,) = [params for kind, params in writes if kind == "UPDATE"]
+    changed_rows = {rows[ingredient.id] for ingredient in kept[:changed]}
+    assert set(update_params[-changed:]) == changed_rows
+    assert len(update_params) == 3 * changed
+    stored = dict(
+        IngredientInRecipe.objects.filter(recipe=recipe).values_list(
+            "ingredient_id", "pk"
+        )
+    )
+    for ingredient in kept + replaced[changed:]:
+        assert stored[ingredient.id] == rows[ingredient.id]
+
+
+def test_name_patch_costs_fixed_queries(
+    author_client, make_recipe, django_assert_num_queries
+):
+    recipe = make_recipe("Суп")
+    with django_assert_num_queries(NAME_PATCH_QUERIES):
+        response = author_client.patch(
+            f"/api/recipes/{recipe.id}/", {"name": "Борщ"}, format="json"
+        )
+    assert response.status_code == 200
+    assert response.json()["name"] == "Борщ"
+
+
+def test_removed_ingredient_leaves_shopping_cart_and_search(
+    author_client, user, make_recipe, ingredients, django_capture_on_commit_callbacks
+):
+    salt, sugar = ingredients[:2]
+    recipe = make_recipe("Суп", {salt: 5, sugar: 50})
+    ShoppingCart.objects.create(user=user, recipe=recipe)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = author_client.patch(
+            f"/api/recipes/{recipe.id}/",
+            {"ingredients": [{"id": salt.id, "amount": 5}]},
+            format="json",
+        )
+    assert response.status_code == 200
+    assert dict(
+        ShoppingCartIngredient.objects.filter(user=user).values_list(
+            "ingredient_id", "amount"
+        )
+    ) == {salt.id: 5}
+    assert (
+        author_client.get("/api/recipes/", {"search": sugar.name}).json()["results"]
+        == []
+    )
@@ -0,0 +1,124 @@
+import random
+import threading
+
+import pytest
+from django.db import connection
+from recipes.counters import reconcile_counters
+from recipes.models import Favorite, Recipe, ShoppingCart, ShoppingCartIngredient
+from rest_framework.test import APIClient
+
+ENDPOINTS = {
+    Favorite: "/api/recipes/favorite/",
+    ShoppingCart: "/api/recipes/shopping_cart/",
+}
+# (добавление, удаление): проверка рецептов, INSERT или DELETE, один
+# UPDATE счётчиков и версия пользователя (первое добавление создаёт её
+# строку); для списка покупок - ещё пересчёт его сумм.
+BULK_QUERIES = {Favorite: (10, 5), ShoppingCart: (17, 11)}
+COUNTERS = {Favorite: "favorites_count", ShoppingCart: "in_carts_count"}
+
+
+@pytest.fixture
+def recipes(make_recipe, ingredients):
+    return [
+        make_recipe(f"Рецепт {number}", {ingredients[number % 4]: 10 * (number + 1)})
+        for number in range(8)
+    ]
+
+
+def statuses(response):
+    assert response.status_code == 200
+    return [item["status"] for item in response.json()["results"]]
+
+
+def stored_cart(user):
+    return sorted(
+        ShoppingCartIngredient.objects.filter(user=user).values_list(
+            "ingredient_id", "amount"
+        )
+    )
+
+
+def expected_cart(user):
+    return sorted(
+        (ingredient_id, total)
+        for _, ingredient_id, total in ShoppingCartIngredient.calculate([user.id])
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("model", list(ENDPOINTS))
+def test_bulk_relation_statuses(model, user, user_client, recipes):
+    first, second = recipes[:2]
+    ids = [first.id, second.id, 10_000]
+    model.objects.create(user=user, recipe=first)
+
+    response = user_client.post(ENDPOINTS[model], {"recipes": ids}, format="json")
+    assert statuses(response) == ["exists", "added", "not_found"]
+    assert getattr(Recipe.objects.get(pk=second.pk), COUNTERS[model]) == 1
+
+    response = user_client.delete(ENDPOINTS[model], {"recipes": ids}, format="json")
+    assert statuses(response) == ["removed", "removed", "absent"]
+    assert not model.objects.exists()
+
+    response = user_client.post(ENDPOINTS[model], {"recipes": []}, format="json")
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("model", list(ENDPOINTS))
+@pytest.mark.parametrize("size", [1, 5])
+def test_bulk_relation_queries_do_not_depend_on_size(
+    model, size, user_client, recipes, django_assert_num_queries
+):
+    ids = [recipe.id for recipe in recipes[:size]]
+    add, remove = BULK_QUERIES[model]
+    with django_assert_num_queries(add):
+        user_client.post(ENDPOINTS[model], {"recipes": ids}, format="json")
+    with django_assert_num_queries(remove):
+        user_client.delete(ENDPOINTS[model], {"recipes": ids}, format="json")
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_bulk_relations_keep_counters(user, recipes):
+    """
+    Пересекающиеся массовые добавления и удаления из нескольких потоков
+    не создают дублей, а счётчики и список покупок совпадают с данными.
+    """
+    if connection.vendor == "sqlite" and connection.is_in_memory_db():
+        pytest.skip("SQLite в памяти не ждёт блокировок таблиц между потоками.")
+    ids = [recipe.id for recipe in recipes]
+    errors = []
+    start = threading.Barrier(6)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = APIClient()
+        client.force_authenticate(user)
+        try:
+            start.wait()
+            for _ in range(15):
+                method = rng.choice((client.post, client.delete))
+                endpoint = ENDPOINTS[rng.choice(list(ENDPOINTS))]
+                response = method(
+                    endpoint, {"recipes": rng.sample(ids, 4)}, format="json"
+                )
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    for model in ENDPOINTS:
+        pairs = list(model.objects.values_list("user_id", "recipe_id"))
+        assert len(pairs) == len(set(pairs))
+    assert reconcile_counters(Recipe) == 0
+    assert stored_cart(user) == expected_cart(user)
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from tasks.models import Task
+
+pytestmark = pytest.mark.django_db
+
+
+def test_stale_task_is_reclaimed_until_attempts_run_out():
+    task = Task.enqueue("tasks.tests.noop", max_attempts=2)
+    for attempt in (1, 2):
+        claimed = Task.claim("crashed")
+        assert claimed.pk == task.pk
+        assert claimed.attempts == attempt
+        # Обработчик упал, не завершив задачу: блокировка истекла.
+        Task.objects.filter(pk=task.pk).update(
+            locked_until=timezone.now() - timedelta(seconds=1)
+        )
+
+    assert Task.claim("next") is None
+    task.refresh_from_db()
+    assert task.status == Task.FAILED
+    assert task.attempts == 2
+    assert task.locked_until is None
+    assert task.finished_at is not None
+    assert "TASK_LOCK_TIMEOUT" in task.last_error
@@ -17,6 +17,8 @@ class UserAdmin(admin.ModelAdmin):
         "last_name",
         "password",
         "role",
+        "recipes_count",
+        "followers_count",
     )
     search_fields = ("username",)
     list_filter = ("username", "email")
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 06:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0004_auto_20261018_0540"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="follow",
+            index=models.Index(
+                fields=["author", "user"], name="follow_author_user_idx"
+            ),
+        ),
+    ]
@@ -29,6 +29,12 @@ class User(AbstractUser):
         default=USER,
         blank=True,
     )
+    recipes_count = models.PositiveIntegerField(
+        "Количество рецептов", default=0, editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        "Количество подписчиков", default=0, editable=False
+    )
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = [
@@ -56,6 +62,23 @@ class User(AbstractUser):
     def __str__(self) -> str:
         return self.username
 
+    def save(self, *args, **kwargs):
+        """
+        Счётчики (поля с editable=False) меняются только атомарными
+        UPDATE, save их не затирает. Отложенные поля тоже не пишутся и
+        не дочитываются.
+        """
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.attname
+                for field in self._meta.concrete_fields
+                if field.editable
+                and not field.primary_key
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -77,3 +100,8 @@ class Follow(models.Model):
         constraints = [
             UniqueConstraint(fields=["user", "author"], name="unique_follow")
         ]
+        indexes = [
+            # Подписчики автора (рассылка в ленты, пересчёт счётчиков)
+            # читаются из индекса, без обращения к таблице.
+            models.Index(fields=["author", "user"], name="follow_author_user_idx")
+        ]